@@ -1,21 +1,46 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, session
+from flask import Blueprint, Flask, current_app, render_template, request, jsonify, session, Response, stream_with_context
+import click
 import os
-import random
 import itertools
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-import google.generativeai as genai
+from model_loader import LazyGenerativeModel
+from recipe_cache import create_cache_from_env, make_cache_key
+from recipe_model import RecipeSerializer, recipe_dict, recipe_markdown, recipe_or_text
+from recipe_corpus import create_corpus_from_env
+from similarity_cache import create_similarity_cache_from_env
+from precompute import mine_session_history, open_precomputed_from_env, read_combinations, run_precompute, load_checkpoint, write_lookup_file
+from routing import create_router_from_env
+from chat_context import create_chat_context_from_env
+from static_assets import AssetRegistry
+from image_service import DEFAULT_SIZES, create_image_library_from_env
+from event_log import create_event_log_from_env
+from preferences import PreferenceVector
+from job_queue import JobWorkerPool, create_job_queue_from_env
+from engines import AUTO, CorpusEngine, EngineRegistry, EngineResult, MultiRecipeAIEngine, RecipeRequest, RuleBasedEngine, SingleAIEngine
+from llm_client import LLMCircuitOpenError, LLMClient, LLMOverloadedError, LLMTimeoutError
+from resilience import create_resilience_from_env
+from quota import create_quota_store_from_env
+from rate_limit import ALLOWED as RATE_LIMIT_ALLOWED, client_ip, create_rate_limiter_from_env, retry_after_header
+from catalog import INGREDIENT_NAMES, ingredient_names, mood_description, mood_name as catalog_mood_name
+from prompts import render_batch_recipe_prompt, render_chef_prompt, render_multi_recipe_prompt, render_recipe_prompt, split_batch_recipes
+from singleflight import create_singleflight_from_env
+from session_store import ServerSideSessionInterface, init_session_store
+import instrumentation
+from instrumentation import observe_chef_context, observe_llm_call, record_recipe_response
 
-# Flaskアプリケーションを作成
-app = Flask(__name__, static_folder='.', static_url_path='/static')
-app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here')
+# ルートはこのブループリントに登録し、Flaskアプリは create_app で作る（ファイル末尾）
+recipe_app = Blueprint('recipe_app', __name__, cli_group=None)
 
-# Gemini API設定
+# メトリクスのレジストリ（/metrics は create_app で登録、METRICS_MULTIPROC_DIR で全ワーカー分を合算）
+metrics = instrumentation.registry
+
+# Gemini API設定（SDKは最初のAI生成か warm_up() で読み込み、インポート時には読み込まない）
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-1.5-flash')
+    model = LazyGenerativeModel(GEMINI_API_KEY, 'gemini-1.5-flash')
 else:
     print("警告: GEMINI_API_KEYが設定されていません。AI機能は無効になります。")
     model = None
@@ -24,95 +49,238 @@ else:
 AI_MODE_ENABLED = os.environ.get('AI_MODE_ENABLED', 'true').lower() == 'true'
 DAILY_AI_LIMIT = int(os.environ.get('DAILY_AI_LIMIT', '50'))  # 1日あたりのAI使用回数制限
 AI_GENERATION_RATE = float(os.environ.get('AI_GENERATION_RATE', '0.7'))  # AI生成の確率（70%）
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))  # ワーカーあたりのAI同時生成数
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', '20'))  # AI生成1回あたりの締め切り（秒）
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '20'))  # バッチ1回で受け付けるリクエスト数
+BATCH_PACK_SIZE = int(os.environ.get('BATCH_PACK_SIZE', '3'))  # 1つのプロンプトにまとめるリクエスト数
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', '4'))  # バッチ内で同時に送るプロンプト数
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))  # ワーカーあたりの非同期ジョブの実行スレッド数
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '0'))  # X-Forwarded-For を付けるプロキシの段数
+
+def observe_ai_call(kind, outcome, seconds, prompt_chars, response_chars):
+    """Gemini呼び出しの結果をメトリクスとAI振り分けに渡す"""
+    observe_llm_call(kind, outcome, seconds, prompt_chars, response_chars)
+    ai_router.observe(outcome, seconds)
+
+# 締め切りと同時実行数の上限付きでモデルを呼び出すクライアント
+# 失敗が続けばサーキットブレーカーで呼び出しを止め、失敗した呼び出しは締め切り内で再試行する
+# （LLM_CIRCUIT_BREAKER / LLM_RETRY_ATTEMPTS / LLM_HEDGE）
+llm_client = LLMClient(
+    model,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    timeout=LLM_TIMEOUT,
+    observer=observe_ai_call,
+    **create_resilience_from_env()
+)
+
+# AI使用回数のクォータ（AI_QUOTA_BACKEND: sqlite / redis / memory）
+# 全ワーカーで共有するストアに置き、生成前に1回分を確保してから呼び出す
+ai_quota = create_quota_store_from_env(DAILY_AI_LIMIT)
+
+# セッション・IP・全体ごとのレート制限（RATE_LIMIT_BACKEND: sqlite / memory / off、ルールは RATE_LIMITS）
+# 1つのクライアントが共有のAI使用回数を使い切らないよう、AIを使うエンドポイントを中心に制限する
+rate_limiter = create_rate_limiter_from_env()
+
+# キャッシュにはAIレシピを構造化した Recipe をコンパクトな形式で保存する
+recipe_serializer = RecipeSerializer()
+
+# AI生成レシピのキャッシュ（RECIPE_CACHE_BACKEND: memory / sqlite / none）
+recipe_cache = create_cache_from_env(recipe_serializer)
+
+# 同じ条件の同時リクエストを1回のAI生成にまとめる（AI_SINGLEFLIGHT_MODE: thread / process / off）
+ai_singleflight = create_singleflight_from_env(recipe_cache)
+
+# オフラインで事前生成した人気の組み合わせのレシピ（flask precompute で作成、PRECOMPUTED_RECIPES_PATH）
+precomputed_recipes = open_precomputed_from_env(recipe_serializer)
+
+# 食材や要望が少しだけ違う条件でも、十分近い保存済みのAIレシピを再利用する（AI_SIMILARITY_CACHE: on / off）
+similarity_cache = create_similarity_cache_from_env(recipe_serializer)
+
+# ローカルのレシピ集（同梱データ＋過去のAI生成レシピ、RECIPE_CORPUS_ENABLED で無効化）
+# AIを使わない場合やAIが使えない場合に、食材と気分に合うレシピをここから返す
+recipe_corpus = create_corpus_from_env()
+
+# レシピ履歴とフィードバックのイベントログ（バックグラウンドでまとめて instance/events に追記）
+# 集計は python event_log.py instance/events
+event_log = create_event_log_from_env()
+
+# async=true のレシピ生成を積むジョブキュー（全ワーカーで共有するSQLite、JOB_QUEUE_ENABLED で無効化）
+job_queue = create_job_queue_from_env()
+
+# AI Chefの会話履歴を「要約＋直近の往復」に圧縮してプロンプトに入れる（CHEF_CONTEXT_TOKEN_BUDGET）
+chat_context = create_chat_context_from_env()
+
+# キャッシュにないリクエストをAIで生成するかの振り分け（AI_ROUTING_MODE: adaptive / fixed）
+# クォータの消化ペース・Geminiのエラー率とレイテンシ・同時実行数の空きから確率を決める
+ai_router = create_router_from_env(
+    lambda: ai_quota.stats(),
+    lambda: (llm_client.in_flight, llm_client.max_concurrency),
+    circuit_open=lambda: llm_client.circuit_open,
+    cache_counts=lambda: (recipe_cache.hits, recipe_cache.misses),
+    base_rate=AI_GENERATION_RATE,
+    llm_timeout=LLM_TIMEOUT,
+)
 
-# 使用回数管理用の簡易ストレージ（本番環境ではRedisやDBを使用）
-usage_tracker = {}
+def collect_process_metrics():
+    """ワーカーごとの累積値（全ワーカー分が合算される）"""
+    samples = [
+        ('recipe_cache_lookups_total', 'AIレシピキャッシュの参照回数', {'result': 'hit'}, recipe_cache.hits),
+        ('recipe_cache_lookups_total', 'AIレシピキャッシュの参照回数', {'result': 'miss'}, recipe_cache.misses),
+        ('recipe_cache_errors_total', 'AIレシピキャッシュの読み書きエラー', {}, recipe_cache.errors),
+        ('recipe_ai_quota_rejected_total', 'クォータ上限によりAI生成を見送った回数', {}, ai_quota.rejected),
+    ]
+    if precomputed_recipes is not None:
+        samples.append(('recipe_precomputed_lookups_total', '事前生成レシピの参照回数', {'result': 'hit'}, precomputed_recipes.hits))
+        samples.append(('recipe_precomputed_lookups_total', '事前生成レシピの参照回数', {'result': 'miss'}, precomputed_recipes.misses))
+    if similarity_cache is not None:
+        samples.append(('recipe_similarity_cache_lookups_total', '類似キャッシュの参照回数', {'result': 'hit'}, similarity_cache.hits))
+        samples.append(('recipe_similarity_cache_lookups_total', '類似キャッシュの参照回数', {'result': 'miss'}, similarity_cache.misses))
+    if recipe_corpus is not None:
+        samples.append(('recipe_corpus_lookups_total', 'レシピ集の検索回数', {'result': 'hit'}, recipe_corpus.hits))
+        samples.append(('recipe_corpus_lookups_total', 'レシピ集の検索回数', {'result': 'miss'}, recipe_corpus.misses))
+    if event_log is not None:
+        samples.append(('recipe_event_log_events_total', 'イベントログのイベント数（written: 書き出し済み / dropped: キューの上限超過で破棄）', {'result': 'written'}, event_log.written))
+        samples.append(('recipe_event_log_events_total', 'イベントログのイベント数（written: 書き出し済み / dropped: キューの上限超過で破棄）', {'result': 'dropped'}, event_log.dropped))
+    for (route, reason), count in list(ai_router.decisions.items()):
+        samples.append(('recipe_ai_routing_decisions_total', 'AI振り分けの判定回数（経路・理由別）', {'route': route, 'reason': reason}, count))
+    if rate_limiter is not None:
+        for (rule, scope), count in list(rate_limiter.rejected.items()):
+            samples.append(('recipe_rate_limit_rejected_total', 'レート制限で拒否したリクエスト数（ルール・範囲別）', {'rule': rule, 'scope': scope}, count))
+    if ai_singleflight is not None:
+        samples.append(('recipe_singleflight_calls_saved_total', 'まとめ実行で省いたAI生成の回数', {}, ai_singleflight.stats()['calls_saved']))
+    return samples
 
-def get_daily_usage_key():
-    """今日の日付ベースのキーを生成"""
-    return datetime.now().strftime('%Y-%m-%d')
+def collect_quota_metrics():
+    """共有ストアのクォータ消費状況（出力時に取得）"""
+    stats = ai_quota.stats()
+    return [
+        ('recipe_ai_quota_limit', '1日あたりのAI使用回数の上限', {}, stats['limit']),
+        ('recipe_ai_quota_used', '今日のAI使用回数', {}, stats['used']),
+        ('recipe_ai_quota_reserved', '生成中として確保されているAI使用枠', {}, stats['reserved']),
+        ('recipe_ai_quota_remaining', '今日のAI使用可能な残り回数', {}, stats['remaining']),
+    ]
 
-def increment_ai_usage():
-    """AI使用回数をインクリメント"""
-    key = get_daily_usage_key()
-    if key not in usage_tracker:
-        usage_tracker[key] = 0
-    usage_tracker[key] += 1
+metrics.register_collector(collect_process_metrics)
+metrics.register_live_collector(collect_quota_metrics)
+
+def reserve_ai_usage():
+    """AI使用枠を1回分確保（使えない場合は None）"""
+    if not model or not AI_MODE_ENABLED:
+        return None
+    return ai_quota.reserve()
 
 def can_use_ai():
     """AI使用可能かチェック"""
     if not model or not AI_MODE_ENABLED:
         return False
-    
-    key = get_daily_usage_key()
-    current_usage = usage_tracker.get(key, 0)
-    return current_usage < DAILY_AI_LIMIT
+    return ai_quota.remaining() > 0
+
+def ai_usage_remaining():
+    """今日のAI使用可能な残り回数"""
+    return ai_quota.remaining()
+
+def check_rate_limit(rule):
+    """ルールのバケットから1回分を使う（戻り値: RateLimitResult）
+
+    このリクエストで作られたばかりのセッションは、Cookieを返さないクライアントだと毎回別のidになり
+    バケットがたまらないので、セッションの範囲は使わずIPと全体だけで判定する。
+    """
+    if rate_limiter is None:
+        return RATE_LIMIT_ALLOWED
+    session_id = None if getattr(session, 'new', False) else getattr(session, 'sid', None)
+    return rate_limiter.check(rule, session_id, client_ip(request, RATE_LIMIT_TRUSTED_PROXIES))
+
+def rate_limit_response(rule):
+    """ルールのバケットが空なら429のレスポンスを返す（制限内なら None）"""
+    result = check_rate_limit(rule)
+    if result.allowed:
+        return None
+    retry_after = retry_after_header(result.retry_after)
+    response = jsonify({
+        'success': False,
+        'error': f'リクエストが多すぎます。{retry_after}秒ほど待ってから再度お試しください。',
+        'rate_limit': {'rule': rule, 'scope': result.scope},
+        'retry_after': int(retry_after)
+    })
+    response.headers['Retry-After'] = retry_after
+    return response, 429
 
 def should_use_ai():
-    """AI生成すべきかランダム判定（A/Bテスト用）"""
-    return random.random() < AI_GENERATION_RATE
+    """AI生成すべきか判定（クォータの残りや負荷に応じた確率で振り分ける）"""
+    use_ai, _ = ai_router.decide()
+    return use_ai
+
+# 静的ファイル（アイコン・マニフェスト・トップページ）は起動時にメモリへ読み込み、
+# ETag・圧縮版・ハッシュ入りのURLを用意しておく（リクエストごとにファイルを読まない）
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+assets = AssetRegistry()
+assets.add_file('icon-256x256.png', os.path.join(APP_ROOT, 'icon-256x256.png'), 'image/png')
+assets.add_file('manifest.json', os.path.join(APP_ROOT, 'manifest.json'), 'application/json')
+
+# 料理画像のサムネイル（images/library.json）も同じ登録に載せ、ハッシュ入りのURLで配信する
+image_library = create_image_library_from_env(assets, APP_ROOT, placeholder='icon-256x256.png')
+
+@recipe_app.app_context_processor
+def inject_asset_url():
+    return {'asset_url': assets.url}
+
+@recipe_app.route('/assets/<path:filename>')
+def serve_fingerprinted_asset(filename):
+    """ハッシュ入りのURL（内容が変われば別のURLになるので長期間キャッシュさせる）"""
+    return assets.fingerprinted_response(filename) or ("Asset not found", 404)
 
 # 既存の静的ファイル配信ルート
-@app.route('/icon-256x256.png')
+@recipe_app.route('/icon-256x256.png')
 def serve_icon():
-    app_root = os.path.dirname(os.path.abspath(__file__))
-    icon_path = os.path.join(app_root, 'icon-256x256.png')
-    
-    try:
-        if os.path.exists(icon_path):
-            return send_from_directory(app_root, 'icon-256x256.png', mimetype='image/png')
-        else:
-            return "Icon not found", 404
-    except Exception as e:
-        return f"Icon error: {str(e)}", 500
+    return assets.response('icon-256x256.png') or ("Icon not found", 404)
 
-@app.route('/manifest.json')
+@recipe_app.route('/manifest.json')
 def serve_manifest():
-    app_root = os.path.dirname(os.path.abspath(__file__))
-    manifest_path = os.path.join(app_root, 'manifest.json')
-    
-    try:
-        if os.path.exists(manifest_path):
-            return send_from_directory(app_root, 'manifest.json', mimetype='application/json')
-        else:
-            return "Manifest not found", 404
-    except Exception as e:
-        return f"Manifest error: {str(e)}", 500
+    return assets.response('manifest.json') or ("Manifest not found", 404)
 
-@app.route('/apple-touch-icon.png')
-@app.route('/apple-touch-icon-120x120.png')
-@app.route('/apple-touch-icon-120x120-precomposed.png')
-@app.route('/apple-touch-icon-180x180.png')
+@recipe_app.route('/apple-touch-icon.png')
+@recipe_app.route('/apple-touch-icon-120x120.png')
+@recipe_app.route('/apple-touch-icon-120x120-precomposed.png')
+@recipe_app.route('/apple-touch-icon-180x180.png')
 def serve_apple_icon():
-    app_root = os.path.dirname(os.path.abspath(__file__))
-    icon_path = os.path.join(app_root, 'icon-256x256.png')
-    
-    try:
-        if os.path.exists(icon_path):
-            return send_from_directory(app_root, 'icon-256x256.png', mimetype='image/png')
-        else:
-            return "Apple icon not found", 404
-    except Exception as e:
-        return f"Apple icon error: {str(e)}", 500
+    return assets.response('icon-256x256.png') or ("Apple icon not found", 404)
 
-@app.route('/favicon.ico')
+@recipe_app.route('/favicon.ico')
 def serve_favicon():
-    app_root = os.path.dirname(os.path.abspath(__file__))
-    icon_path = os.path.join(app_root, 'icon-256x256.png')
-    
-    try:
-        if os.path.exists(icon_path):
-            return send_from_directory(app_root, 'icon-256x256.png', mimetype='image/png')
-        else:
-            return "Favicon not found", 404
-    except Exception as e:
-        return f"Favicon error: {str(e)}", 500
+    return assets.response('icon-256x256.png') or ("Favicon not found", 404)
 
-@app.route('/')
+@recipe_app.route('/')
 def index():
-    return render_template('index.html')
+    """トップページ（描画結果をキャッシュし、常にETagで再検証させる）"""
+    if assets.get('index.html') is None or current_app.debug:
+        assets.add_bytes('index.html', render_template('index.html').encode('utf-8'), 'text/html; charset=utf-8',
+                         cache_control='no-cache')
+    return assets.response('index.html')
+
+@recipe_app.route('/health')
+def health_check():
+    """生存確認（プロセスが応答できれば200、受け入れ準備は /health/ready で確認する）"""
+    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
 
-@app.route('/debug-files')
+@recipe_app.route('/health/ready')
+def health_ready():
+    """受け入れ準備の確認（AIが有効ならGemini SDKの読み込みが終わるまで503）
+
+    SDKの読み込みに失敗した場合はルールベースで応答できるので、準備完了として ai を degraded にする。
+    """
+    if not model or not AI_MODE_ENABLED:
+        return jsonify({'status': 'ready', 'ai': 'disabled'})
+    if getattr(model, 'ready', True):
+        return jsonify({'status': 'ready', 'ai': 'ready'})
+    if getattr(model, 'error', None):
+        return jsonify({'status': 'ready', 'ai': 'degraded', 'error': model.error})
+    # gunicorn 以外（flask run など）で起動した場合もここで読み込みを始める
+    model.warm_up()
+    response = jsonify({'status': 'warming_up', 'ai': 'loading'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@recipe_app.route('/debug-files')
 def debug_files():
     try:
         app_root = os.path.dirname(os.path.abspath(__file__))
@@ -121,7 +289,7 @@ def debug_files():
         result = f"""
         <h2>デバッグ情報</h2>
         <p><strong>AI機能:</strong> {'有効' if model else '無効'}</p>
-        <p><strong>今日のAI使用回数:</strong> {usage_tracker.get(get_daily_usage_key(), 0)} / {DAILY_AI_LIMIT}</p>
+        <p><strong>今日のAI使用回数:</strong> {ai_quota.usage()} / {DAILY_AI_LIMIT}</p>
         <p><strong>AI生成確率:</strong> {AI_GENERATION_RATE * 100}%</p>
         <hr>
         <p><strong>app.pyの場所:</strong> {__file__}</p>
@@ -135,103 +303,206 @@ def debug_files():
         return f"デバッグエラー: {str(e)}"
 
 # AI生成レシピ機能
+def build_recipe_prompt(mood, ingredients, context="", user_preferences=""):
+    """レシピ生成用のプロンプトを組み立てる"""
+    return render_recipe_prompt(mood_description(mood), ingredient_names(ingredients), context, user_preferences)
+
 def generate_ai_recipe(mood, ingredients, context="", user_preferences=""):
     """Gemini 1.5 Flashを使用してレシピを生成"""
     try:
-        # 食材名の日本語変換
-        ingredient_names = {
-            'rice': 'お米', 'pasta': 'パスタ', 'bread': 'パン', 'udon': 'うどん', 'soba': 'そば',
-            'chicken': '鶏肉', 'pork': '豚肉', 'beef': '牛肉', 'ground_meat': 'ひき肉',
-            'salmon': '鮭', 'tuna': 'まぐろ', 'shrimp': 'えび',
-            'egg': '卵', 'milk': '牛乳', 'cheese': 'チーズ', 'tofu': '豆腐', 'natto': '納豆',
-            'onion': '玉ねぎ', 'carrot': 'にんじん', 'potato': 'じゃがいも', 'cabbage': 'キャベツ',
-            'tomato': 'トマト', 'cucumber': 'きゅうり', 'lettuce': 'レタス', 'spinach': 'ほうれん草',
-            'mushroom': 'きのこ類', 'bell_pepper': 'ピーマン', 'banana': 'バナナ', 'apple': 'りんご', 'lemon': 'レモン'
-        }
-        
-        mood_descriptions = {
-            'happy': '元気いっぱいで楽しい気分',
-            'tired': '疲れていて簡単で栄養のあるものが欲しい',
-            'healthy': 'ヘルシーで体に良いものを食べたい',
-            'comfort': '懐かしくて心温まる家庭的な料理が欲しい',
-            'adventure': '新しい味や珍しい料理に挑戦したい',
-            'spicy': '辛くて刺激的な料理が食べたい'
-        }
-        
-        japanese_ingredients = [ingredient_names.get(ing, ing) for ing in ingredients]
-        mood_desc = mood_descriptions.get(mood, mood)
+        prompt = build_recipe_prompt(mood, ingredients, context, user_preferences)
+        return llm_client.generate(prompt)
         
-        prompt = f"""あなたは料理研究家で、親しみやすく実用的なレシピを提案する専門家です。
+    except Exception as e:
+        print(f"AI生成エラー: {e}")
+        return None
 
-**今回の状況:**
-- 気分: {mood_desc}
-- 使用できる食材: {', '.join(japanese_ingredients)}
-- 追加の要望: {context}
-- 好み: {user_preferences}
+def find_cached_ai_recipe(cache_key, mood, ingredients, context="", user_preferences="", preference=None):
+    """生成済みのAIレシピ（Recipe か文字列）を探す（戻り値: (レシピ, 'precomputed' / 'exact' / 'similar' / None)）
 
-**お願い:**
-上記の状況を考慮して、実際に作れる美味しいレシピを1つ提案してください。
+    事前生成ファイル、完全一致のキャッシュの順に見て、なければ類似キャッシュで近い条件のレシピを探す。
+    preference（ユーザーの好み）を渡すと、類似キャッシュの候補を好みで並べ替える。
+    """
+    if precomputed_recipes is not None:
+        ai_recipe = precomputed_recipes.get(cache_key)
+        if ai_recipe is not None:
+            return ai_recipe, 'precomputed'
+    ai_recipe = recipe_cache.get(cache_key)
+    if ai_recipe is not None:
+        return ai_recipe, 'exact'
+    if similarity_cache is not None:
+        match = similarity_cache.lookup(mood, ingredients, context, user_preferences, preference)
+        if match is not None:
+            return match[0], 'similar'
+    return None, None
 
-**回答形式（必ずこの形式で回答してください）:**
+# キャッシュの種類 → レシピの返却方法（メトリクス用）
+CACHE_MATCH_METHODS = {'exact': 'cached', 'similar': 'similar', 'precomputed': 'precomputed'}
 
-## レシピ名
-（魅力的で分かりやすい名前）
+def remember_ai_recipe(cache_key, mood, ingredients, ai_recipe, context="", user_preferences=""):
+    """生成したAIレシピ（Recipe か文字列）をキャッシュ・類似キャッシュ・レシピ集に保存
 
-## 調理情報
-- ⏰ 調理時間: XX分
-- 📊 難易度: ★☆☆ または ★★☆ または ★★★
-- 🍽️ 人数: X人分
+    要望（context）や好みを反映したレシピは、同じ要望・好みのキー（make_cache_key）の
+    完全一致のキャッシュにだけ保存する。類似キャッシュとレシピ集は他のユーザーにも返すため、
+    個人向けのレシピは入れない。
+    """
+    recipe_cache.set(cache_key, ai_recipe)
+    if context or user_preferences:
+        return
+    if similarity_cache is not None:
+        similarity_cache.add(cache_key, mood, ingredients, ai_recipe)
+    if recipe_corpus is not None:
+        recipe_corpus.learn(cache_key, mood, ingredients, recipe_markdown(ai_recipe))
 
-## 材料
-（具体的な分量も含めて）
-- 主な食材（3-5個）
-- 調味料・その他（3-5個）
+def generate_and_cache_ai_recipe(cache_key, mood, ingredients, context="", user_preferences=""):
+    """AI使用枠を確保してレシピを生成し、成功したらキャッシュに保存
 
-## 作り方
-1. 【下準備】具体的な準備内容
-2. 【工程1】詳細な手順
-3. 【工程2】詳細な手順
-4. 【工程3】詳細な手順
-5. 【完成】仕上げの手順
+    応答はここで一度だけ Recipe に変換し、以降はそれを使う（形式どおりでなければ文字列のまま）。
+    """
+    # AI使用枠を確保できた場合のみAI生成を試行
+    reservation = reserve_ai_usage()
+    if reservation is None:
+        return None
+    
+    print("AI生成を試行中...")
+    ai_recipe = generate_ai_recipe(mood, ingredients, context, user_preferences)
+    if ai_recipe:
+        ai_recipe = recipe_or_text(ai_recipe)
+        reservation.commit()
+        remember_ai_recipe(cache_key, mood, ingredients, ai_recipe, context, user_preferences)
+    else:
+        reservation.refund()
+    return ai_recipe
 
-## コツ・ポイント
-（失敗しないための具体的なアドバイス）
+def generate_shared_ai_recipe(cache_key, mood, ingredients, context="", user_preferences=""):
+    """同じ条件で生成中のリクエストがあればその結果を共有してAI生成（戻り値: (レシピ, 共有・キャッシュ由来か)）"""
+    def generate():
+        return generate_and_cache_ai_recipe(cache_key, mood, ingredients, context, user_preferences)
+    
+    if ai_singleflight is not None:
+        return ai_singleflight.do(cache_key, generate)
+    return generate(), False
 
-## なぜこのレシピなのか
-（今の気分や状況にぴったりな理由）
+def generate_ai_recipe_pack(mood, items, user_preferences=""):
+    """同じ気分の複数リクエストを1つのプロンプトでまとめて生成
 
-**重要な注意事項:**
-- 実際に作れるレシピにしてください
-- 分量は具体的に書いてください
-- 調理時間は現実的にしてください
-- 使用できる食材を中心に構成してください（すべて使う必要はありません）"""
+    items は (キャッシュキー, 食材, 追加の要望) のリスト。戻り値は {キャッシュキー: (レシピ, キャッシュ由来か)}。
+    同じ条件で生成中の項目（別のリクエストやバッチ）はプロンプトに含めず、その結果を共有する。
+    """
+    if len(items) == 1:
+        cache_key, ingredients, context = items[0]
+        ai_recipe, from_cache = generate_shared_ai_recipe(cache_key, mood, ingredients, context, user_preferences)
+        return {cache_key: (ai_recipe, from_cache)} if ai_recipe else {}
+    
+    if ai_singleflight is None:
+        generated = generate_ai_recipe_pack_items(mood, items, user_preferences)
+        return {cache_key: (ai_recipe, False) for cache_key, ai_recipe in generated.items()}
+    
+    items_by_key = {item[0]: item for item in items}
+    shared = ai_singleflight.do_many(
+        list(items_by_key),
+        lambda keys: generate_ai_recipe_pack_items(mood, [items_by_key[key] for key in keys], user_preferences)
+    )
+    return {cache_key: result for cache_key, result in shared.items() if result[0]}
 
-        response = model.generate_content(prompt)
-        return response.text.strip()
-        
+def generate_ai_recipe_pack_items(mood, items, user_preferences=""):
+    """items を1つのプロンプトで生成してキャッシュに保存する（戻り値: {キャッシュキー: レシピ}）
+
+    AI使用枠は1件ずつ確保し、応答に含まれていたレシピの分だけ確定する（残りは返却）。
+    """
+    if len(items) == 1:
+        cache_key, ingredients, context = items[0]
+        ai_recipe = generate_and_cache_ai_recipe(cache_key, mood, ingredients, context, user_preferences)
+        return {cache_key: ai_recipe} if ai_recipe else {}
+    
+    reservations = []
+    for _ in items:
+        reservation = reserve_ai_usage()
+        if reservation is None:
+            break
+        reservations.append(reservation)
+    # 枠が足りない分はルールベースになる
+    items = items[:len(reservations)]
+    if len(items) == 1:
+        reservations[0].refund()
+        return generate_ai_recipe_pack_items(mood, items, user_preferences)
+    if not items:
+        return {}
+    
+    print(f"AIまとめ生成を試行中...（{len(items)}件）")
+    generated = {}
+    try:
+        prompt = render_batch_recipe_prompt(
+            mood_description(mood),
+            [(ingredient_names(ingredients), context) for _, ingredients, context in items],
+            user_preferences
+        )
+        # 出力がリクエスト数に比例して長くなるので締め切りも延ばす
+        recipes = split_batch_recipes(llm_client.generate(prompt, timeout=LLM_TIMEOUT * len(items)), len(items))
     except Exception as e:
-        print(f"AI生成エラー: {e}")
-        return None
+        print(f"AIまとめ生成エラー: {e}")
+        recipes = [None] * len(items)
+    
+    for (cache_key, ingredients, context), reservation, ai_recipe in zip(items, reservations, recipes):
+        if ai_recipe:
+            ai_recipe = recipe_or_text(ai_recipe)
+            reservation.commit()
+            remember_ai_recipe(cache_key, mood, ingredients, ai_recipe, context, user_preferences)
+            generated[cache_key] = ai_recipe
+        else:
+            reservation.refund()
+    return generated
+
+def generate_multi_ai_recipes(mood, ingredients, context="", user_preferences=""):
+    """1つのプロンプトで5品提案させる（旧 app_no_HF.py の方式、戻り値: (提案の文字列, キャッシュ由来か)）
+
+    提案は単品のレシピとは別のキーでキャッシュし、AI使用枠は1リクエストで1回分使う。
+    5品の提案文には要望と好みを入れないので、キャッシュキーにも含めない。
+    """
+    cache_key = 'multi:' + make_cache_key(mood, ingredients)
+    cached = recipe_cache.get(cache_key)
+    if cached is not None:
+        return recipe_markdown(cached), True
+    reservation = reserve_ai_usage()
+    if reservation is None:
+        return None, False
+    
+    print("AI生成（5品提案）を試行中...")
+    try:
+        # 出力が単品の数倍の長さになるので締め切りも延ばす
+        text = llm_client.generate(render_multi_recipe_prompt(catalog_mood_name(mood), ingredient_names(ingredients)),
+                                   timeout=LLM_TIMEOUT * 2)
+    except Exception as e:
+        print(f"AI生成エラー（5品提案）: {e}")
+        text = None
+    if text:
+        reservation.commit()
+        recipe_cache.set(cache_key, text)
+    else:
+        reservation.refund()
+    return text, False
 
 # 従来のルールベースレシピ生成（フォールバック用）
-def generate_rule_based_recipe(mood, ingredients):
+def generate_rule_based_recipe(mood, ingredients, preference=None):
     """従来のルールベースでレシピ生成（フォールバック用）"""
-    ingredient_names = {
-        'rice': 'お米', 'pasta': 'パスタ', 'bread': 'パン', 'udon': 'うどん', 'soba': 'そば',
-        'chicken': '鶏肉', 'pork': '豚肉', 'beef': '牛肉', 'ground_meat': 'ひき肉',
-        'salmon': '鮭', 'tuna': 'まぐろ', 'shrimp': 'えび',
-        'egg': '卵', 'milk': '牛乳', 'cheese': 'チーズ', 'tofu': '豆腐', 'natto': '納豆',
-        'onion': '玉ねぎ', 'carrot': 'にんじん', 'potato': 'じゃがいも', 'cabbage': 'キャベツ',
-        'tomato': 'トマト', 'cucumber': 'きゅうり', 'lettuce': 'レタス', 'spinach': 'ほうれん草',
-        'mushroom': 'きのこ類', 'bell_pepper': 'ピーマン', 'banana': 'バナナ', 'apple': 'りんご', 'lemon': 'レモン'
-    }
+    # レシピ集に食材・気分の合うレシピがあればそれを使う（好みがあれば近い候補を好みで並べ替える）
+    if recipe_corpus is not None:
+        match = recipe_corpus.lookup(mood, ingredients, preference)
+        if match is not None:
+            return match.recipe.text
+    return generate_template_recipe(mood, ingredients)
+
+def generate_template_recipe(mood, ingredients):
+    """気分ごとの定型レシピ"""
+    japanese_ingredients = ingredient_names(ingredients)
+    main_ingredient = INGREDIENT_NAMES.get(ingredients[0], '野菜') if ingredients else '野菜'
     
     mood_recipes = {
         'happy': {
-            'name': f'元気いっぱい{ingredient_names.get(ingredients[0] if ingredients else "野菜", "野菜")}炒め',
+            'name': f'元気いっぱい{main_ingredient}炒め',
             'time': '15分',
             'difficulty': '★★☆',
-            'ingredients': [ingredient_names.get(ing, ing) for ing in ingredients[:3]],
+            'ingredients': japanese_ingredients[:3],
             'seasonings': ['醤油', 'みりん', 'ごま油', '塩'],
             'steps': [
                 '材料を食べやすい大きさに切る',
@@ -241,10 +512,10 @@ def generate_rule_based_recipe(mood, ingredients):
             'tips': '強火で手早く炒めると美味しくなります'
         },
         'tired': {
-            'name': f'疲労回復{ingredient_names.get(ingredients[0] if ingredients else "野菜", "野菜")}スープ',
+            'name': f'疲労回復{main_ingredient}スープ',
             'time': '20分',
             'difficulty': '★☆☆',
-            'ingredients': [ingredient_names.get(ing, ing) for ing in ingredients[:3]],
+            'ingredients': japanese_ingredients[:3],
             'seasonings': ['コンソメ', '塩', 'こしょう'],
             'steps': [
                 '材料を切る',
@@ -280,117 +551,198 @@ def generate_rule_based_recipe(mood, ingredients):
 ---
 *このレシピは従来システムで生成されました*"""
 
-@app.route('/api/recipes', methods=['POST'])
-def get_recipes():
-    try:
-        data = request.get_json()
-        mood = data.get('mood', 'happy')
-        ingredients = data.get('ingredients', [])
-        context = data.get('context', '')  # 追加の要望
-        force_ai = data.get('force_ai', False)  # AI強制使用フラグ
-        
-        # 食材名変換
-        ingredient_names = {
-            'rice': 'お米', 'pasta': 'パスタ', 'bread': 'パン', 'udon': 'うどん', 'soba': 'そば',
-            'chicken': '鶏肉', 'pork': '豚肉', 'beef': '牛肉', 'ground_meat': 'ひき肉',
-            'salmon': '鮭', 'tuna': 'まぐろ', 'shrimp': 'えび',
-            'egg': '卵', 'milk': '牛乳', 'cheese': 'チーズ', 'tofu': '豆腐', 'natto': '納豆',
-            'onion': '玉ねぎ', 'carrot': 'にんじん', 'potato': 'じゃがいも', 'cabbage': 'キャベツ',
-            'tomato': 'トマト', 'cucumber': 'きゅうり', 'lettuce': 'レタス', 'spinach': 'ほうれん草',
-            'mushroom': 'きのこ類', 'bell_pepper': 'ピーマン', 'banana': 'バナナ', 'apple': 'りんご', 'lemon': 'レモン'
-        }
-        
-        mood_names = {
-            'happy': '元気いっぱい',
-            'tired': '疲れ気味',
-            'healthy': 'ヘルシー志向',
-            'comfort': '家庭的な気分',
-            'adventure': '冒険したい',
-            'spicy': 'スパイシー'
-        }
-        
-        selected_ingredient_names = [ingredient_names.get(ing, ing) for ing in ingredients]
-        mood_name = mood_names.get(mood, mood)
-        
-        # ユーザーの過去の好みを取得（セッションから）
-        user_preferences = session.get('user_preferences', '')
-        
-        # AI生成 vs ルールベース判定
-        use_ai = False
-        generation_method = "rule_based"
-        
-        if force_ai or (can_use_ai() and should_use_ai()):
-            # AI生成を試行
-            print("AI生成を試行中...")
-            ai_recipe = generate_ai_recipe(mood, ingredients, context, user_preferences)
-            
-            if ai_recipe:
-                increment_ai_usage()
-                use_ai = True
-                generation_method = "ai_generated"
-                
-                # セッションに使用状況を記録
-                if 'recipe_history' not in session:
-                    session['recipe_history'] = []
-                
-                session['recipe_history'].append({
-                    'timestamp': datetime.now().isoformat(),
-                    'mood': mood,
-                    'ingredients': ingredients,
-                    'method': 'ai',
-                    'success': True
-                })
-                
-                recipes_text = f"""【今日の気分】: {mood_name}
+def describe_request(mood, ingredients):
+    """表示用の気分名と食材名（日本語）を返す"""
+    return catalog_mood_name(mood), ingredient_names(ingredients)
+
+def ai_recipes_header(mood_name, selected_ingredient_names):
+    """AIレシピの前に付ける見出し"""
+    return f"""【今日の気分】: {mood_name}
 【使用可能な食材】: {', '.join(selected_ingredient_names)}
 【生成方法】: 🤖 AI Chef（Gemini 1.5 Flash）
 
-{ai_recipe}
+"""
+
+AI_RECIPES_FOOTER = """
 
 ---
 💡 **AI Chefより**: このレシピはあなたの気分と食材を考慮して特別に作成しました！
 🔄 **より良いレシピを**: 「もう少し簡単に」「辛くして」などの要望があれば、再度お試しください。
 📝 **フィードバック**: 作ってみた感想を教えていただけると、次回より良い提案ができます。"""
-                
-                return jsonify({
-                    'success': True,
-                    'recipes': recipes_text,
-                    'generation_method': generation_method,
-                    'ai_usage_remaining': DAILY_AI_LIMIT - usage_tracker.get(get_daily_usage_key(), 0)
-                })
-        
-        # フォールバック: ルールベースレシピ生成
-        print("ルールベース生成にフォールバック")
-        rule_recipe = generate_rule_based_recipe(mood, ingredients)
-        
-        # セッションに記録
-        if 'recipe_history' not in session:
-            session['recipe_history'] = []
-        
-        session['recipe_history'].append({
-            'timestamp': datetime.now().isoformat(),
-            'mood': mood,
-            'ingredients': ingredients,
-            'method': 'rule_based',
-            'success': True
-        })
-        
-        recipes_text = f"""【今日の気分】: {mood_name}
+
+def rule_based_recipes_header(mood_name, selected_ingredient_names):
+    """ルールベースレシピの前に付ける見出し"""
+    return f"""【今日の気分】: {mood_name}
 【使用可能な食材】: {', '.join(selected_ingredient_names)}
 【生成方法】: 📋 クラシックレシピ
 
-{rule_recipe}
+"""
+
+def rule_based_recipes_footer():
+    """ルールベースレシピの後に付ける案内"""
+    return f"""
 
 ---
 🤖 **AI Chefを試してみませんか？**: より創造的でパーソナライズされたレシピをお求めなら、「AI Chef」ボタンをお試しください！
-⚡ **今日のAI使用可能回数**: あと{DAILY_AI_LIMIT - usage_tracker.get(get_daily_usage_key(), 0)}回"""
+⚡ **今日のAI使用可能回数**: あと{ai_usage_remaining()}回"""
+
+def user_preference_vector():
+    """セッションに保存したユーザーの好み（プロンプトとキャッシュキーには signature() だけを使う）"""
+    return PreferenceVector.from_session(session.get('preference_vector'))
+
+def record_recipe_history(mood, ingredients, method, cached=False):
+    """セッションにレシピ生成履歴を記録"""
+    if 'recipe_history' not in session:
+        session['recipe_history'] = []
+    
+    entry = {
+        'timestamp': datetime.now().isoformat(),
+        'mood': mood,
+        'ingredients': ingredients,
+        'method': method,
+        'success': True
+    }
+    if method == 'ai':
+        entry['cached'] = cached
+    session['recipe_history'].append(entry)
+    session.modified = True
+    if event_log is not None:
+        event_log.emit('recipe', mood=mood, ingredients=ingredients, method=method, cached=cached)
+
+# レシピの生成方式（RECIPE_ENGINE でアプリごと、engine でリクエストごとに選ぶ）
+# 並びは品質の高い順（コストが同じならこの順に選ぶ）
+recipe_engines = EngineRegistry([
+    SingleAIEngine(
+        lambda mood, ingredients, context, user_preferences: generate_shared_ai_recipe(
+            make_cache_key(mood, ingredients, context, user_preferences), mood, ingredients, context, user_preferences
+        ),
+        can_use_ai,
+        latency=LLM_TIMEOUT / 4,
+    ),
+    MultiRecipeAIEngine(generate_multi_ai_recipes, can_use_ai, latency=LLM_TIMEOUT / 2),
+    CorpusEngine(recipe_corpus),
+    RuleBasedEngine(generate_template_recipe),
+])
+
+def parse_engine_options(data):
+    """リクエストの engine と latency_target を取り出す（不正なら ValueError）"""
+    engine = data.get('engine') or current_app.config['RECIPE_ENGINE']
+    if engine != AUTO and recipe_engines.get(engine) is None:
+        raise ValueError(f"engine は {(AUTO,) + recipe_engines.names} のいずれかで指定してください")
+    latency_target = data.get('latency_target', current_app.config['RECIPE_LATENCY_TARGET'])
+    if latency_target is not None:
+        latency_target = float(latency_target)
+    return engine, latency_target
+
+SELECTION_REQUIRED_MESSAGE = '気分と食材を選択してください'
+
+def selection_missing(mood, ingredients):
+    """気分と食材の選択を必須にする設定（RECIPE_REQUIRE_SELECTION、旧 app_no_HF.py）で、どちらかが空か"""
+    return current_app.config['RECIPE_REQUIRE_SELECTION'] and (not mood or not ingredients)
+
+def generate_recipe_result(mood, ingredients, context, force_ai, preference, endpoint, engine=AUTO, latency_target=None):
+    """レシピを1件生成する（/api/recipes と非同期ジョブで共通）
+
+    engine が auto なら、保存済みのAIレシピを探し、なければAI振り分けの判定でAIのエンジンを使うか決める。
+    AIのエンジンは latency_target（秒）を満たすもののうちコストの低いものを選ぶ。
+    生成できなければAIを使わないエンジン（レシピ集 → 定型レシピ）にフォールバックする。
+
+    戻り値: (レスポンスの内容, 履歴に記録する生成方法 'ai' / 'rule_based', キャッシュ由来か)
+    """
+    mood_name, selected_ingredient_names = describe_request(mood, ingredients)
+    recipe_request = RecipeRequest(mood, ingredients, context, preference)
+    
+    # 同じ条件で生成済みのAIレシピがあればAPIを呼ばずに再利用
+    result, used_engine = None, None
+    if engine in (AUTO, 'single_ai'):
+        user_preferences = preference.signature()
+        cache_key = make_cache_key(mood, ingredients, context, user_preferences)
+        ai_recipe, cache_match = find_cached_ai_recipe(cache_key, mood, ingredients, context, user_preferences, preference)
+        if ai_recipe is not None:
+            result, used_engine = EngineResult(ai_recipe, True, cache_match), recipe_engines.get('single_ai')
+    
+    ai_attempted = False
+    if result is None:
+        use_ai = engine == AUTO and (force_ai or should_use_ai())
+        for candidate in recipe_engines.plan(engine, use_ai, latency_target):
+            ai_attempted = ai_attempted or candidate.uses_ai
+            result = candidate.run(recipe_request)
+            if result is not None:
+                used_engine = candidate
+                break
+    
+    if used_engine.uses_ai:
+        record_recipe_response(endpoint, CACHE_MATCH_METHODS.get(result.cache_match, 'ai_generated'))
         
-        return jsonify({
+        recipes_text = ai_recipes_header(mood_name, selected_ingredient_names) + recipe_markdown(result.recipe) + AI_RECIPES_FOOTER
+        
+        return {
             'success': True,
             'recipes': recipes_text,
-            'generation_method': generation_method,
-            'ai_usage_remaining': DAILY_AI_LIMIT - usage_tracker.get(get_daily_usage_key(), 0)
-        })
+            'recipe': recipe_dict(result.recipe),
+            'generation_method': 'ai_generated',
+            'engine': used_engine.name,
+            'from_cache': result.from_cache,
+            'cache_match': result.cache_match
+        }, 'ai', result.from_cache
+
+    # フォールバック: ルールベースレシピ生成
+    print("ルールベース生成にフォールバック")
+    record_recipe_response(endpoint, 'fallback' if ai_attempted else 'rule_based')
+    
+    recipes_text = rule_based_recipes_header(mood_name, selected_ingredient_names) + result.recipe + rule_based_recipes_footer()
+    
+    return {
+        'success': True,
+        'recipes': recipes_text,
+        'recipe': recipe_dict(result.recipe),
+        'generation_method': 'rule_based',
+        'engine': used_engine.name,
+        'fallback': ai_attempted
+    }, 'rule_based', False
+
+@recipe_app.route('/api/recipes', methods=['POST'])
+def get_recipes():
+    try:
+        data = request.get_json()
+        if selection_missing(data.get('mood'), data.get('ingredients')):
+            return jsonify({'success': False, 'error': SELECTION_REQUIRED_MESSAGE, 'generation_method': 'error'}), 400
+        mood = data.get('mood', 'happy')
+        ingredients = data.get('ingredients', [])
+        context = data.get('context', '')  # 追加の要望
+        force_ai = data.get('force_ai', False)  # AI強制使用フラグ
+        
+        # ユーザーの過去の好みを取得（セッションから）
+        preference = user_preference_vector()
+        
+        # 生成方式（engine）とレイテンシの目標（latency_target 秒）。省略時はアプリの設定
+        try:
+            engine, latency_target = parse_engine_options(data)
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e), 'generation_method': 'error'}), 400
+        
+        # AIを強制する（AIのエンジンを指定した）リクエストは、AI使用回数を直接消費するので厳しく制限する
+        uses_ai = force_ai or (engine != AUTO and recipe_engines.get(engine).uses_ai)
+        limited = rate_limit_response('recipes_ai' if uses_ai else 'recipes')
+        if limited is not None:
+            return limited
+        
+        # async=true ならジョブとして積み、結果は /api/jobs/<id> で受け取る
+        if data.get('async'):
+            return enqueue_recipe_job(mood, ingredients, context, force_ai, preference, data.get('lane', 'chat'),
+                                      engine, latency_target)
+        
+        result, method, from_cache = generate_recipe_result(mood, ingredients, context, force_ai, preference, '/api/recipes',
+                                                            engine, latency_target)
+        
+        # セッションに使用状況を記録
+        record_recipe_history(mood, ingredients, method, cached=from_cache)
+        
+        result['ai_usage_remaining'] = ai_usage_remaining()
+        # 旧 app_no_HF.py の応答と同じく、表示名の気分・食材と生成時刻も返す
+        result['mood'], result['ingredients'] = describe_request(mood, ingredients)
+        result['timestamp'] = datetime.now().isoformat()
+        return jsonify(result)
         
     except Exception as e:
         print(f"レシピ生成エラー: {e}")
@@ -400,79 +752,507 @@ def get_recipes():
             'generation_method': 'error'
         }), 500
 
+# 非同期ジョブ
+def run_recipe_job(payload):
+    """ジョブとして積まれたレシピ生成を実行（セッションがないので履歴はイベントログにだけ残す）"""
+    mood = payload['mood']
+    ingredients = payload['ingredients']
+    preference = PreferenceVector.from_session(payload.get('preference'))
+    result, method, from_cache = generate_recipe_result(
+        mood, ingredients, payload['context'], payload['force_ai'], preference, '/api/recipes/async',
+        payload.get('engine', AUTO), payload.get('latency_target')
+    )
+    if event_log is not None:
+        event_log.emit('recipe', mood=mood, ingredients=ingredients, method=method, cached=from_cache)
+    return result
+
+job_workers = JobWorkerPool(job_queue, {'recipe': run_recipe_job}, workers=JOB_WORKERS) if job_queue is not None else None
+
+def enqueue_recipe_job(mood, ingredients, context, force_ai, preference, lane, engine=AUTO, latency_target=None):
+    """レシピ生成をジョブとして積み、ジョブIDを返す（同じ条件のジョブがあればそれを返す）"""
+    if job_queue is None:
+        return jsonify({'success': False, 'error': '非同期モードは無効です'}), 400
+    job_workers.start()
+    cache_key = make_cache_key(mood, ingredients, context, preference.signature())
+    payload = {
+        'mood': mood,
+        'ingredients': ingredients,
+        'context': context,
+        'force_ai': bool(force_ai),
+        'preference': preference.to_session(),
+        'engine': engine,
+        'latency_target': latency_target
+    }
+    try:
+        job_id, deduplicated = job_queue.enqueue('recipe', payload, lane=lane,
+                                                 dedup_key=f'{cache_key}:{int(bool(force_ai))}:{engine}')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'deduplicated': deduplicated,
+        'status_url': f'/api/jobs/{job_id}',
+        # この間隔より長くポーリングが途切れると、待機中のジョブは取り消される
+        'poll_within_seconds': job_queue.abandon_after
+    }), 202
+
+@recipe_app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """ジョブの状態と、完了していれば結果を返す（ポーリングのたびにジョブの生存を延長する）"""
+    if job_queue is None:
+        return jsonify({'success': False, 'error': '非同期モードは無効です'}), 404
+    job_workers.start()
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'ジョブが見つかりません'}), 404
+    return jsonify({'success': True, **job})
+
+@recipe_app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """ジョブを取り消す（実行中の生成は止まらないが、結果は保存しない）"""
+    if job_queue is None:
+        return jsonify({'success': False, 'error': '非同期モードは無効です'}), 404
+    if not job_queue.cancel(job_id):
+        return jsonify({'success': False, 'error': '取り消せるジョブが見つかりません'}), 404
+    return jsonify({'success': True, 'job_id': job_id, 'status': 'cancelled'})
+
+# バッチ生成
+def parse_batch_item(item):
+    """バッチの1件を検証して (気分, 食材, 追加の要望, AI強制) を返す"""
+    if not isinstance(item, dict):
+        raise ValueError('各リクエストはオブジェクトで指定してください')
+    mood = item.get('mood', 'happy')
+    ingredients = item.get('ingredients', [])
+    context = item.get('context', '')
+    if not isinstance(mood, str) or not isinstance(context, str):
+        raise ValueError('mood と context は文字列で指定してください')
+    if not isinstance(ingredients, list) or not all(isinstance(i, str) for i in ingredients):
+        raise ValueError('ingredients は文字列のリストで指定してください')
+    if selection_missing(item.get('mood'), ingredients):
+        raise ValueError(SELECTION_REQUIRED_MESSAGE)
+    return mood, ingredients, context, bool(item.get('force_ai', False))
+
+@recipe_app.route('/api/recipes/batch', methods=['POST'])
+def batch_recipes():
+    """複数の気分・食材の組み合わせをまとめて生成する
+
+    同じ条件のリクエストは1回にまとめ、キャッシュにないものは同じ気分ごとに
+    BATCH_PACK_SIZE 件ずつ1つのプロンプトで生成する（プロンプト同士は並行して送る）。
+    結果は入力と同じ順で返し、失敗した項目だけをエラーやルールベースにする。
+    
+    engine・latency_target は /api/recipes と同じ（バッチ全体に1つ）。まとめて生成できるのは
+    single_ai だけなので、それ以外のエンジンでは1件ずつそのエンジンで生成する。
+    
+    AIを強制する項目（force_ai やAIのエンジンの指定）は、/api/recipes と同じく recipes_ai の
+    レート制限を1件ごとに1回分使う（キャッシュにあった分・重複分は使わない）。
+    制限を超えた項目はAIを使わずに返す（rate_limited: true）。
+    """
+    limited = rate_limit_response('recipes_batch')
+    if limited is not None:
+        return limited
+    data = request.get_json(silent=True) or {}
+    items = data.get('requests')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': 'requests にリクエストのリストを指定してください'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'success': False, 'error': f'一度に指定できるリクエストは{BATCH_MAX_ITEMS}件までです'}), 400
+    force_ai_all = data.get('force_ai', False)
+    try:
+        engine, latency_target = parse_engine_options(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    preference = user_preference_vector()
+    user_preferences = preference.signature()
+    
+    # 同じ条件のリクエストをまとめる
+    results = [None] * len(items)
+    unique = {}
+    for index, item in enumerate(items):
+        try:
+            mood, ingredients, context, force_ai = parse_batch_item(item)
+        except ValueError as e:
+            results[index] = {'index': index, 'success': False, 'error': str(e)}
+            continue
+        cache_key = make_cache_key(mood, ingredients, context, user_preferences)
+        entry = unique.setdefault(cache_key, {
+            'mood': mood, 'ingredients': ingredients, 'context': context, 'force_ai': False, 'indexes': []
+        })
+        entry['force_ai'] = entry['force_ai'] or force_ai or force_ai_all
+        entry['indexes'].append(index)
+    
+    # キャッシュにないものを気分ごとに分け、BATCH_PACK_SIZE 件ずつ1つのプロンプトにする
+    ai_recipes = {}
+    engine_results = {}
+    groups = {}
+    single_entries = []
+    for cache_key, entry in unique.items():
+        if engine not in (AUTO, 'single_ai'):
+            if recipe_engines.get(engine).uses_ai and not check_rate_limit('recipes_ai').allowed:
+                entry['rate_limited'] = True
+                continue
+            single_entries.append(cache_key)
+            continue
+        cached_recipe, _ = find_cached_ai_recipe(
+            cache_key, entry['mood'], entry['ingredients'], entry['context'], user_preferences, preference
+        )
+        if cached_recipe is not None:
+            ai_recipes[cache_key] = (cached_recipe, True)
+            continue
+        # 生成計画の先頭が single_ai のものだけをまとめ生成する（使えなければAIを使わないエンジン）
+        wants_ai = engine == AUTO and (entry['force_ai'] or should_use_ai())
+        if recipe_engines.plan(engine, wants_ai, latency_target)[0].name == 'single_ai':
+            if (engine != AUTO or entry['force_ai']) and not check_rate_limit('recipes_ai').allowed:
+                entry['rate_limited'] = True
+                continue
+            entry['ai_attempted'] = True
+            groups.setdefault(entry['mood'], []).append((cache_key, entry['ingredients'], entry['context']))
+    packs = [
+        (mood, group[i:i + BATCH_PACK_SIZE])
+        for mood, group in groups.items()
+        for i in range(0, len(group), BATCH_PACK_SIZE)
+    ]
+    
+    if packs or single_entries:
+        workers = min(BATCH_MAX_CONCURRENCY, len(packs) + len(single_entries))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recipe-batch') as executor:
+            futures = [executor.submit(generate_ai_recipe_pack, mood, pack, user_preferences) for mood, pack in packs]
+            single_futures = {
+                cache_key: executor.submit(
+                    generate_recipe_result, unique[cache_key]['mood'], unique[cache_key]['ingredients'],
+                    unique[cache_key]['context'], unique[cache_key]['force_ai'], preference, '/api/recipes/batch',
+                    engine, latency_target
+                )
+                for cache_key in single_entries
+            }
+            for future in futures:
+                try:
+                    ai_recipes.update(future.result())
+                except Exception as e:
+                    print(f"AIまとめ生成エラー: {e}")
+            for cache_key, future in single_futures.items():
+                try:
+                    engine_results[cache_key] = future.result()
+                except Exception as e:
+                    print(f"レシピ生成エラー（{engine}）: {e}")
+    
+    summary = {'total': len(items), 'unique': len(unique), 'prompts': len(packs),
+               'ai_generated': 0, 'cached': 0, 'rule_based': 0, 'fallback': 0, 'failed': 0, 'rate_limited': 0}
+    for cache_key, entry in unique.items():
+        mood, ingredients = entry['mood'], entry['ingredients']
+        mood_name, selected_ingredient_names = describe_request(mood, ingredients)
+        ai_recipe, from_cache = ai_recipes.get(cache_key, (None, False))
+        if cache_key in engine_results:
+            # 指定のエンジンで生成した結果（メトリクスは generate_recipe_result で記録済み）
+            engine_result, history_method, from_cache = engine_results[cache_key]
+            generation_method = engine_result['generation_method']
+            if history_method == 'ai':
+                method = 'cached' if from_cache else 'ai_generated'
+                # 5品提案は1件ごとに1つのプロンプト
+                summary['prompts'] += method == 'ai_generated'
+            else:
+                method = 'fallback' if engine_result['fallback'] else 'rule_based'
+            recipe, recipes_text = engine_result['recipe'], engine_result['recipes']
+            record_recipe_history(mood, ingredients, history_method, cached=from_cache)
+        elif ai_recipe:
+            generation_method = 'ai_generated'
+            method = 'cached' if from_cache else 'ai_generated'
+            recipe = recipe_dict(ai_recipe)
+            recipes_text = ai_recipes_header(mood_name, selected_ingredient_names) + recipe_markdown(ai_recipe)
+            record_recipe_history(mood, ingredients, 'ai', cached=from_cache)
+        else:
+            generation_method = 'rule_based'
+            method = 'fallback' if entry.get('ai_attempted') else 'rule_based'
+            rule_recipe = generate_rule_based_recipe(mood, ingredients, preference)
+            recipe = recipe_dict(rule_recipe)
+            recipes_text = rule_based_recipes_header(mood_name, selected_ingredient_names) + rule_recipe
+            record_recipe_history(mood, ingredients, 'rule_based')
+        if cache_key not in engine_results:
+            record_recipe_response('/api/recipes/batch', method)
+        summary[method] += len(entry['indexes'])
+        if entry.get('rate_limited'):
+            summary['rate_limited'] += len(entry['indexes'])
+        
+        for position, index in enumerate(entry['indexes']):
+            results[index] = {
+                'index': index,
+                'success': True,
+                'recipes': recipes_text,
+                'recipe': recipe,
+                'generation_method': generation_method,
+                'from_cache': from_cache,
+                'fallback': method == 'fallback',
+                'rate_limited': entry.get('rate_limited', False),
+                'duplicate_of': entry['indexes'][0] if position else None,
+                # この項目でAI使用回数を1回消費したか（重複分・キャッシュ分は消費しない）
+                'ai_usage_consumed': 1 if method == 'ai_generated' and not position else 0
+            }
+    summary['failed'] = sum(1 for result in results if not result['success'])
+    
+    return jsonify({
+        'success': summary['failed'] < len(items),
+        'engine': engine,
+        'results': results,
+        'summary': summary,
+        'ai_usage_remaining': ai_usage_remaining()
+    })
+
+# ストリーミング（Server-Sent Events）
+def sse_event(event, data):
+    """SSEの1イベント分の文字列を作る"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def sse_response(events):
+    """イベントのジェネレータをSSEレスポンスとして返す"""
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # リバースプロキシでのバッファリングを無効化
+        }
+    )
+
+def stream_recipe_result(mood, ingredients, context, force_ai, preference, engine, latency_target):
+    """逐次生成できないエンジンのレシピを生成し終えてから、1つの chunk としてSSEで返す"""
+    result, method, from_cache = generate_recipe_result(mood, ingredients, context, force_ai, preference,
+                                                        '/api/recipes/stream', engine, latency_target)
+    record_recipe_history(mood, ingredients, method, cached=from_cache)
+    
+    def generate_events():
+        yield sse_event('meta', {
+            'generation_method': result['generation_method'],
+            'engine': result['engine'],
+            'from_cache': result.get('from_cache', False),
+            'cache_match': result.get('cache_match')
+        })
+        yield sse_event('chunk', {'text': result['recipes']})
+        yield sse_event('done', {
+            'generation_method': result['generation_method'],
+            'from_cache': result.get('from_cache', False),
+            'recipe': result['recipe'],
+            'ai_usage_remaining': ai_usage_remaining()
+        })
+    
+    return sse_response(generate_events())
+
+@recipe_app.route('/api/recipes/stream', methods=['POST'])
+def stream_recipes():
+    """レシピを生成しながらSSEで逐次返す（/api/recipes のストリーミング版）
+
+    イベント: meta → chunk* → (fallback → chunk*) → done
+    AI生成が途中で失敗した場合は fallback イベントの後にルールベースレシピを送る。
+    
+    engine・latency_target は /api/recipes と同じ。逐次送れるのは single_ai だけなので、
+    それ以外のエンジンを使う場合は生成し終えたレシピを1つの chunk で送る。
+    """
+    data = request.get_json() or {}
+    if selection_missing(data.get('mood'), data.get('ingredients')):
+        return jsonify({'success': False, 'error': SELECTION_REQUIRED_MESSAGE, 'generation_method': 'error'}), 400
+    mood = data.get('mood', 'happy')
+    ingredients = data.get('ingredients', [])
+    context = data.get('context', '')
+    force_ai = data.get('force_ai', False)
+    try:
+        engine, latency_target = parse_engine_options(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e), 'generation_method': 'error'}), 400
+    
+    uses_ai = force_ai or (engine != AUTO and recipe_engines.get(engine).uses_ai)
+    limited = rate_limit_response('recipes_ai' if uses_ai else 'recipes')
+    if limited is not None:
+        return limited
+    
+    mood_name, selected_ingredient_names = describe_request(mood, ingredients)
+    preference = user_preference_vector()
+    user_preferences = preference.signature()
+    
+    cache_key = make_cache_key(mood, ingredients, context, user_preferences)
+    cached_recipe, cache_match = None, None
+    if engine in (AUTO, 'single_ai'):
+        cached_recipe, cache_match = find_cached_ai_recipe(cache_key, mood, ingredients, context, user_preferences, preference)
+    reservation = None
+    if cached_recipe is None:
+        # 生成計画の先頭が single_ai のときだけ逐次生成する（AI振り分けの判定は1回だけ行う）
+        wants_ai = engine == AUTO and (force_ai or should_use_ai())
+        if recipe_engines.plan(engine, wants_ai, latency_target)[0].name != 'single_ai':
+            return stream_recipe_result(mood, ingredients, context, wants_ai, preference, engine, latency_target)
+        reservation = reserve_ai_usage()
+    use_ai = cached_recipe is not None or reservation is not None
+    
+    # レスポンス本文の送信前にCookieが確定するため、履歴は開始時点の判定で記録する
+    if use_ai:
+        record_recipe_history(mood, ingredients, 'ai', cached=cached_recipe is not None)
+    else:
+        record_recipe_history(mood, ingredients, 'rule_based')
+    
+    def generate():
+        try:
+            yield from generate_events()
+        finally:
+            # 途中で切断された場合などに確保したAI使用枠を返却（確定済みなら何もしない）
+            if reservation is not None:
+                reservation.refund()
+    
+    def generate_events():
+        if use_ai:
+            yield sse_event('meta', {
+                'generation_method': 'ai_generated',
+                'engine': 'single_ai',
+                'from_cache': cached_recipe is not None,
+                'cache_match': cache_match
+            })
+            yield sse_event('chunk', {'text': ai_recipes_header(mood_name, selected_ingredient_names)})
+            
+            if cached_recipe is not None:
+                record_recipe_response('/api/recipes/stream', CACHE_MATCH_METHODS[cache_match])
+                yield sse_event('chunk', {'text': recipe_markdown(cached_recipe)})
+                yield sse_event('chunk', {'text': AI_RECIPES_FOOTER})
+                yield sse_event('done', {
+                    'generation_method': 'ai_generated',
+                    'from_cache': True,
+                    'recipe': recipe_dict(cached_recipe),
+                    'ai_usage_remaining': ai_usage_remaining()
+                })
+                return
+            
+            print("AI生成（ストリーミング）を試行中...")
+            parts = []
+            try:
+                prompt = build_recipe_prompt(mood, ingredients, context, user_preferences)
+                for text in llm_client.stream(prompt):
+                    parts.append(text)
+                    yield sse_event('chunk', {'text': text})
+                ai_recipe = ''.join(parts).strip()
+                if not ai_recipe:
+                    raise ValueError('空のレスポンス')
+            except Exception as e:
+                print(f"AI生成エラー（ストリーミング）: {e}")
+                reservation.refund()
+                yield sse_event('fallback', {'reason': str(e)})
+            else:
+                ai_recipe = recipe_or_text(ai_recipe)
+                reservation.commit()
+                remember_ai_recipe(cache_key, mood, ingredients, ai_recipe, context, user_preferences)
+                record_recipe_response('/api/recipes/stream', 'ai_generated')
+                yield sse_event('chunk', {'text': AI_RECIPES_FOOTER})
+                yield sse_event('done', {
+                    'generation_method': 'ai_generated',
+                    'from_cache': False,
+                    'recipe': recipe_dict(ai_recipe),
+                    'ai_usage_remaining': ai_usage_remaining()
+                })
+                return
+        else:
+            yield sse_event('meta', {'generation_method': 'rule_based', 'from_cache': False})
+        
+        # フォールバック: ルールベースレシピ（最初からでもAI失敗後でも同じストリームで送る）
+        print("ルールベース生成にフォールバック（ストリーミング）")
+        record_recipe_response('/api/recipes/stream', 'fallback' if use_ai else 'rule_based')
+        yield sse_event('chunk', {'text': rule_based_recipes_header(mood_name, selected_ingredient_names)})
+        rule_recipe = generate_rule_based_recipe(mood, ingredients, preference)
+        yield sse_event('chunk', {'text': rule_recipe})
+        yield sse_event('chunk', {'text': rule_based_recipes_footer()})
+        yield sse_event('done', {
+            'generation_method': 'rule_based',
+            'from_cache': False,
+            'recipe': recipe_dict(rule_recipe),
+            'ai_usage_remaining': ai_usage_remaining()
+        })
+    
+    return sse_response(generate())
+
+def build_chef_prompt(mood, ingredients, user_message, conversation_history):
+    """AI Chefとの対話用のプロンプトを組み立てる
+
+    会話履歴は直近の往復だけを全文で入れ、それより前は要約にする。
+    要約はセッションに保存し、次のメッセージでは新しく押し出された往復の分だけ追加する。
+    """
+    summary = session.get('ai_conversation_summary')
+    chat = chat_context.build(conversation_history, summary)
+    if chat.summary is not summary and chat.summary['items']:
+        session['ai_conversation_summary'] = chat.summary
+    observe_chef_context(chat.original_tokens, chat.tokens)
+    return render_chef_prompt(mood, ingredient_names(ingredients), user_message, chat.history_lines)
+
+def ai_limit_reached_response():
+    """AI使用回数上限に達した時のレスポンス"""
+    return jsonify({
+        'success': False,
+        'error': f'今日のAI使用回数上限（{DAILY_AI_LIMIT}回）に達しました。明日再度お試しください。',
+        'ai_usage_remaining': 0
+    }), 429
+
+def record_conversation(user_message, ai_response):
+    """セッションにAI Chefとの会話を記録"""
+    if 'ai_conversation' not in session:
+        session['ai_conversation'] = []
+    
+    session['ai_conversation'].append({
+        'user': user_message,
+        'ai': ai_response,
+        'timestamp': datetime.now().isoformat()
+    })
+    
+    # 古い会話履歴を削除（最新10件のみ保持）
+    if len(session['ai_conversation']) > 10:
+        session['ai_conversation'] = session['ai_conversation'][-10:]
+    session.modified = True
+
+def ai_busy_response(message):
+    """AI生成が混雑している時のレスポンス"""
+    response = jsonify({
+        'success': False,
+        'error': f'AI Chefが混雑しています。しばらくしてから再度お試しください: {message}'
+    })
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
 # AI Chef専用エンドポイント
-@app.route('/api/ai-chef', methods=['POST'])
+@recipe_app.route('/api/ai-chef', methods=['POST'])
 def ai_chef_chat():
     """AI Chefとの対話専用エンドポイント"""
+    reservation = None
     try:
         data = request.get_json()
         user_message = data.get('message', '')
         mood = data.get('mood', 'happy')
         ingredients = data.get('ingredients', [])
         
-        if not can_use_ai():
-            return jsonify({
-                'success': False,
-                'error': f'今日のAI使用回数上限（{DAILY_AI_LIMIT}回）に達しました。明日再度お試しください。',
-                'ai_usage_remaining': 0
-            }), 429
+        limited = rate_limit_response('chef')
+        if limited is not None:
+            return limited
+        
+        reservation = reserve_ai_usage()
+        if reservation is None:
+            return ai_limit_reached_response()
         
         # 会話履歴を考慮したプロンプト
         conversation_history = session.get('ai_conversation', [])
-        
-        # 食材の日本語変換
-        ingredient_names = {
-            'rice': 'お米', 'pasta': 'パスタ', 'bread': 'パン', 'udon': 'うどん', 'soba': 'そば',
-            'chicken': '鶏肉', 'pork': '豚肉', 'beef': '牛肉', 'ground_meat': 'ひき肉',
-            'salmon': '鮭', 'tuna': 'まぐろ', 'shrimp': 'えび',
-            'egg': '卵', 'milk': '牛乳', 'cheese': 'チーズ', 'tofu': '豆腐', 'natto': '納豆',
-            'onion': '玉ねぎ', 'carrot': 'にんじん', 'potato': 'じゃがいも', 'cabbage': 'キャベツ',
-            'tomato': 'トマト', 'cucumber': 'きゅうり', 'lettuce': 'レタス', 'spinach': 'ほうれん草',
-            'mushroom': 'きのこ類', 'bell_pepper': 'ピーマン', 'banana': 'バナナ', 'apple': 'りんご', 'lemon': 'レモン'
-        }
-        
-        japanese_ingredients = [ingredient_names.get(ing, ing) for ing in ingredients]
-        
-        context = f"""あなたは親しみやすいAI料理シェフです。ユーザーとフレンドリーに会話しながら、実用的な料理アドバイスを提供してください。
-
-現在の状況:
-- ユーザーの気分: {mood}
-- 利用可能な食材: {', '.join(japanese_ingredients)}
-- ユーザーからのメッセージ: "{user_message}"
-
-過去の会話履歴:
-{chr(10).join([f'ユーザー: {h["user"]}' + chr(10) + f'AI Chef: {h["ai"]}' for h in conversation_history[-3:]])}
-
-以下の点に注意して回答してください:
-1. フレンドリーで親しみやすい口調
-2. 実際に作れる具体的なアドバイス
-3. 必要に応じてレシピや調理のコツを提供
-4. 食材の代替案や応用も提案
-5. 簡潔で分かりやすい説明"""
+        context = build_chef_prompt(mood, ingredients, user_message, conversation_history)
 
-        response = model.generate_content(context)
-        ai_response = response.text.strip()
+        try:
+            ai_response = llm_client.generate(context)
+        except (LLMOverloadedError, LLMCircuitOpenError) as e:
+            # 混雑時や上流の障害中はワーカーを待たせずにすぐ返す
+            return ai_busy_response(str(e))
+        except LLMTimeoutError as e:
+            return jsonify({
+                'success': False,
+                'error': f'AI Chefの応答が時間内に返りませんでした: {str(e)}'
+            }), 504
         
         # 会話履歴を更新
-        if 'ai_conversation' not in session:
-            session['ai_conversation'] = []
-        
-        session['ai_conversation'].append({
-            'user': user_message,
-            'ai': ai_response,
-            'timestamp': datetime.now().isoformat()
-        })
-        
-        # 古い会話履歴を削除（最新10件のみ保持）
-        if len(session['ai_conversation']) > 10:
-            session['ai_conversation'] = session['ai_conversation'][-10:]
+        record_conversation(user_message, ai_response)
         
-        increment_ai_usage()
+        reservation.commit()
         
         return jsonify({
             'success': True,
             'response': ai_response,
-            'ai_usage_remaining': DAILY_AI_LIMIT - usage_tracker.get(get_daily_usage_key(), 0)
+            # 回答がレシピの形式で書かれていれば構造化したもの（雑談などは None）
+            'recipe': recipe_dict(ai_response),
+            'ai_usage_remaining': ai_usage_remaining()
         })
         
     except Exception as e:
@@ -481,9 +1261,75 @@ def ai_chef_chat():
             'success': False,
             'error': f'AI Chefが一時的に利用できません: {str(e)}'
         }), 500
+    
+    finally:
+        # 生成に失敗した場合は確保したAI使用枠を返却（確定済みなら何もしない）
+        if reservation is not None:
+            reservation.refund()
+
+@recipe_app.route('/api/ai-chef/stream', methods=['POST'])
+def ai_chef_stream():
+    """AI Chefの回答をSSEで逐次返す（/api/ai-chef のストリーミング版）
+
+    イベント: chunk* → done、途中で失敗した場合は error。
+    サーバーサイドセッションでは完了後に会話履歴へ保存する。Cookieセッションは
+    本文の送信前に確定するため、その場合この回答は会話履歴に保存されない。
+    """
+    data = request.get_json() or {}
+    user_message = data.get('message', '')
+    mood = data.get('mood', 'happy')
+    ingredients = data.get('ingredients', [])
+    
+    limited = rate_limit_response('chef')
+    if limited is not None:
+        return limited
+    if llm_client.in_flight >= llm_client.max_concurrency:
+        return ai_busy_response('同時実行数の上限に達しています')
+    if llm_client.circuit_open:
+        return ai_busy_response('AIの呼び出しが続けて失敗しているため、一時的に停止しています')
+    
+    reservation = reserve_ai_usage()
+    if reservation is None:
+        return ai_limit_reached_response()
+    
+    conversation_history = session.get('ai_conversation', [])
+    prompt = build_chef_prompt(mood, ingredients, user_message, conversation_history)
+    
+    def generate():
+        received = False
+        parts = []
+        ai_response = ''
+        
+        try:
+            for text in llm_client.stream(prompt):
+                received = True
+                parts.append(text)
+                yield sse_event('chunk', {'text': text})
+        except Exception as e:
+            print(f"AI Chat エラー（ストリーミング）: {e}")
+            reservation.refund()
+            yield sse_event('error', {'error': f'AI Chefが一時的に利用できません: {str(e)}'})
+            return
+        else:
+            if received:
+                reservation.commit()
+                ai_response = ''.join(parts).strip()
+                # レスポンス送信後でもサーバー側のセッションは更新できる
+                if isinstance(current_app.session_interface, ServerSideSessionInterface):
+                    record_conversation(user_message, ai_response)
+                    current_app.session_interface.persist(current_app, session)
+        finally:
+            # 途中で切断された場合などは確保したAI使用枠を返却（確定済みなら何もしない）
+            reservation.refund()
+        yield sse_event('done', {
+            'recipe': recipe_dict(ai_response),
+            'ai_usage_remaining': ai_usage_remaining()
+        })
+    
+    return sse_response(generate())
 
 # フィードバック機能
-@app.route('/api/feedback', methods=['POST'])
+@recipe_app.route('/api/feedback', methods=['POST'])
 def submit_feedback():
     """ユーザーフィードバックを受信"""
     try:
@@ -502,13 +1348,24 @@ def submit_feedback():
             'recipe_data': recipe_data,
             'timestamp': datetime.now().isoformat()
         })
+        session.modified = True
+        if event_log is not None:
+            event_log.emit(
+                'feedback',
+                feedback=feedback_type,
+                text=feedback_text,
+                mood=recipe_data.get('mood'),
+                generation_method=recipe_data.get('generation_method'),
+                recipe_name=recipe_data.get('recipe_name'),
+                ingredients=recipe_data.get('ingredients') or []
+            )
         
-        # ユーザーの好みを学習（簡易版）
-        if feedback_type == 'like':
-            preferences = session.get('user_preferences', '')
-            if recipe_data.get('generation_method') == 'ai_generated':
-                preferences += f" 好み: {recipe_data.get('mood', '')}の時の料理,"
-            session['user_preferences'] = preferences[-500:]  # 最新500文字のみ保持
+        # ユーザーの好みを学習（気分・食材ごとの親和度を更新）
+        if feedback_type in ('like', 'dislike'):
+            preference = user_preference_vector()
+            preference.update(recipe_data.get('mood'), recipe_data.get('ingredients') or [], feedback_type == 'like')
+            session['preference_vector'] = preference.to_session()
+            session.pop('user_preferences', None)  # 以前の形式（好みの文字列）
         
         return jsonify({
             'success': True,
@@ -522,57 +1379,135 @@ def submit_feedback():
             'error': str(e)
         }), 500
 
+def session_stats():
+    """このアプリのセッションストアの統計（Cookieセッションなら backend だけ）"""
+    store = current_app.extensions.get('session_store')
+    return store.stats() if store is not None else {'backend': 'cookie'}
+
 # 統計情報エンドポイント
-@app.route('/api/stats')
+@recipe_app.route('/api/stats')
 def get_stats():
     """利用統計を返す"""
     try:
-        today_key = get_daily_usage_key()
-        
         return jsonify({
             'ai_enabled': model is not None,
+            'ai_model': model.stats() if isinstance(model, LazyGenerativeModel) else None,
             'daily_limit': DAILY_AI_LIMIT,
-            'today_usage': usage_tracker.get(today_key, 0),
-            'remaining_usage': DAILY_AI_LIMIT - usage_tracker.get(today_key, 0),
+            'today_usage': ai_quota.usage(),
+            'remaining_usage': ai_usage_remaining(),
             'ai_generation_rate': AI_GENERATION_RATE,
             'user_session_recipes': len(session.get('recipe_history', [])),
-            'user_feedback_count': len(session.get('feedback_history', []))
+            'user_feedback_count': len(session.get('feedback_history', [])),
+            'user_preference_signature': user_preference_vector().signature(),
+            'recipe_cache': recipe_cache.stats(),
+            'llm_client': llm_client.stats(),
+            'ai_quota': ai_quota.stats(),
+            'singleflight': ai_singleflight.stats() if ai_singleflight is not None else {'mode': 'off'},
+            'session_store': session_stats(),
+            'rate_limit': rate_limiter.stats() if rate_limiter is not None else {'backend': 'off'},
+            'precomputed_recipes': precomputed_recipes.stats() if precomputed_recipes is not None else {'enabled': False},
+            'similarity_cache': similarity_cache.stats() if similarity_cache is not None else {'enabled': False},
+            'recipe_corpus': recipe_corpus.stats() if recipe_corpus is not None else {'enabled': False},
+            'ai_routing': ai_router.stats(),
+            'chef_context': chat_context.stats(),
+            'static_assets': assets.stats(),
+            'image_library': image_library.stats(),
+            'event_log': event_log.stats() if event_log is not None else {'enabled': False},
+            'job_queue': dict(job_queue.stats(), **job_workers.stats()) if job_queue is not None else {'enabled': False},
+            'recipe_engines': dict(recipe_engines.stats(), default=current_app.config['RECIPE_ENGINE'])
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# 画像生成API（既存）
-@app.route('/api/generate-image', methods=['POST'])
+# 料理画像API（レシピに合うローカルのサムネイルを返す）
+@recipe_app.route('/api/generate-image', methods=['POST'])
 def generate_image():
+    """料理名・食材・気分に合うサムネイルのURLと srcset を返す（同じ料理には常に同じ画像）"""
     try:
-        data = request.get_json()
-        recipe_name = data.get('recipe_name')
-        ingredients = data.get('ingredients', [])
-        
-        # サンプル画像URLs
-        sample_images = [
-            'https://images.unsplash.com/photo-1565299624946-b28f40a0ca4b?w=512&h=512&fit=crop&auto=format&q=80',
-            'https://images.unsplash.com/photo-1567620905732-2d1ec7ab7445?w=512&h=512&fit=crop&auto=format&q=80',
-            'https://images.unsplash.com/photo-1565958011703-44f9829ba187?w=512&h=512&fit=crop&auto=format&q=80',
-            'https://images.unsplash.com/photo-1504674900247-0877df9cc836?w=512&h=512&fit=crop&auto=format&q=80',
-            'https://images.unsplash.com/photo-1516684810915-8c1de8b4bb61?w=512&h=512&fit=crop&auto=format&q=80'
-        ]
+        data = request.get_json(silent=True) or {}
+        recipe_name = data.get('recipe_name') or ''
+        ingredients = data.get('ingredients') or []
+        if not isinstance(ingredients, list):
+            return jsonify({'success': False, 'error': 'ingredients は食材のリストで指定してください'}), 400
         
-        selected_image = random.choice(sample_images)
+        match = image_library.lookup(recipe_name, ingredients, data.get('mood'))
+        if match.url is None:
+            return jsonify({'success': False, 'error': '画像が見つかりません'}), 404
         
         return jsonify({
             'success': True,
-            'image_url': selected_image
+            'image_url': match.url,
+            'srcset': match.srcset,
+            'sizes': DEFAULT_SIZES if match.srcset else '',
+            'image_title': match.entry.title if match.entry is not None else None,
+            'placeholder': match.entry is None
         })
         
     except Exception as e:
-        print(f"画像生成エラー: {e}")
+        print(f"画像取得エラー: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+# 人気の組み合わせの事前生成（flask --app app precompute）
+@recipe_app.cli.command('precompute')
+@click.option('--combinations', 'combinations_path', type=click.Path(exists=True), help='組み合わせのファイル（JSONか「気分: 食材, 食材」の行）')
+@click.option('--from-history', 'history_path', type=click.Path(exists=True), help='組み合わせを集計するセッションストア（SQLite）')
+@click.option('--top', default=100, show_default=True, help='履歴から取り出す組み合わせの数')
+@click.option('--rate', default=0.5, show_default=True, help='1秒あたりの生成回数の上限')
+@click.option('--limit', type=int, help='今回生成する件数の上限')
+@click.option('--checkpoint', 'checkpoint_path', default=os.path.join('instance', 'precompute_checkpoint.jsonl'), show_default=True, help='再開用のチェックポイント')
+@click.option('--output', 'output_path', default=lambda: os.environ.get('PRECOMPUTED_RECIPES_PATH', os.path.join('instance', 'precomputed_recipes.bin')), help='参照ファイルの出力先')
+def precompute_command(combinations_path, history_path, top, rate, limit, checkpoint_path, output_path):
+    """人気の組み合わせのAIレシピを生成し、アプリが読み込む参照ファイルを作る
+
+    オフラインの作業なので1日のAI使用回数のクォータは消費しない（--rate と --limit で調整する）。
+    """
+    combinations = []
+    if history_path:
+        combinations += mine_session_history(history_path, top)
+    if combinations_path:
+        combinations += read_combinations(combinations_path)
+    if combinations and not model:
+        raise click.ClickException('GEMINI_API_KEYが設定されていないため生成できません')
+    
+    generated, failed = run_precompute(combinations, generate_ai_recipe, checkpoint_path, rate=rate, limit=limit, log=click.echo)
+    records = [(key, record['text']) for key, record in load_checkpoint(checkpoint_path).items()]
+    count = write_lookup_file(output_path, records, recipe_serializer, convert=recipe_or_text)
+    click.echo(f"生成 {generated} 件、失敗 {failed} 件。{output_path} に {count} 件を書き出しました（アプリの再起動後に有効）")
+
+def create_app(config=None):
+    """Flaskアプリを作成する
+
+    config で app.config を上書きする（RECIPE_ENGINE: 既定の生成方式、RECIPE_LATENCY_TARGET: 目標の秒数、
+    RECIPE_REQUIRE_SELECTION: 気分か食材が空のリクエストを400にするか）。
+    キャッシュ・クォータ・Geminiクライアントなどはプロセス内で共有するので、
+    設定の違うアプリ（app.py と app_no_HF.py）を同じプロセスで動かしてもよい。
+    """
+    flask_app = Flask(__name__, static_folder='.', static_url_path='/static')
+    flask_app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here')
+    latency_target = os.environ.get('RECIPE_LATENCY_TARGET')
+    flask_app.config.update(
+        RECIPE_ENGINE=os.environ.get('RECIPE_ENGINE', AUTO),
+        RECIPE_LATENCY_TARGET=float(latency_target) if latency_target else None,
+        RECIPE_REQUIRE_SELECTION=os.environ.get('RECIPE_REQUIRE_SELECTION', 'false').lower() == 'true',
+    )
+    flask_app.config.update(config or {})
+    engine = flask_app.config['RECIPE_ENGINE']
+    if engine != AUTO and recipe_engines.get(engine) is None:
+        raise ValueError(f"RECIPE_ENGINE は {(AUTO,) + recipe_engines.names} のいずれかで指定してください: {engine}")
+    
+    # セッションの中身はサーバー側に保存し、Cookieにはidだけを置く（SESSION_BACKEND: sqlite / cookie）
+    flask_app.extensions['session_store'] = init_session_store(flask_app)
+    # ルートごとのレイテンシ計測と /metrics
+    instrumentation.init_app(flask_app)
+    flask_app.register_blueprint(recipe_app)
+    return flask_app
+
+app = create_app()
+
 if __name__ == '__main__':
     # 起動時の情報表示
     print("🍳 AI Recipe App 起動中...")
@@ -580,5 +1515,6 @@ if __name__ == '__main__':
     print(f"📊 1日のAI使用上限: {DAILY_AI_LIMIT}回")
     print(f"🎲 AI生成確率: {AI_GENERATION_RATE * 100}%")
     print(f"🔑 API Key設定: {'✅' if GEMINI_API_KEY else '❌'}")
+    print(f"🍽️ 生成方式: {app.config['RECIPE_ENGINE']}")
     
-    app.run(debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=True)
\ No newline at end of file
@@ -1,121 +1,16 @@
-from flask import Flask, render_template, request, jsonify
-import google.generativeai as genai
-import os
-from datetime import datetime
-
-app = Flask(__name__)
-
-# ★ Gemini APIキー設定（環境変数から）
-genai.configure(api_key=os.environ.get('GEMINI_API_KEY'))
-
-# ★ Geminiモデル定義（1.5 Flashを使用）
-model = genai.GenerativeModel('models/gemini-1.5-flash')
-
-# 気分一覧
-MOODS = [
-    {"id": "salty", "name": "塩味のもの", "emoji": "🧂"},
-    {"id": "spicy", "name": "からいもの", "emoji": "🌶️"},
-    {"id": "sweet", "name": "甘めのもの", "emoji": "🍯"},
-    {"id": "energizing", "name": "元気がでるもの", "emoji": "💪"},
-    {"id": "light", "name": "軽いもの", "emoji": "🥗"},
-    {"id": "gentle", "name": "胃にやさしいもの", "emoji": "☕"}
-]
-
-# 食材リスト
-INGREDIENTS = [
-    {"id": "rice", "name": "お米", "category": "主食"},
-    {"id": "pasta", "name": "パスタ", "category": "主食"},
-    {"id": "bread", "name": "パン", "category": "主食"},
-    {"id": "udon", "name": "うどん", "category": "主食"},
-    {"id": "soba", "name": "そば", "category": "主食"},
-    {"id": "chicken", "name": "鶏肉", "category": "肉類"},
-    {"id": "pork", "name": "豚肉", "category": "肉類"},
-    {"id": "beef", "name": "牛肉", "category": "肉類"},
-    {"id": "ground_meat", "name": "ひき肉", "category": "肉類"},
-    {"id": "salmon", "name": "鮭", "category": "魚類"},
-    {"id": "tuna", "name": "まぐろ", "category": "魚類"},
-    {"id": "shrimp", "name": "えび", "category": "魚類"},
-    {"id": "egg", "name": "卵", "category": "卵・乳製品"},
-    {"id": "milk", "name": "牛乳", "category": "卵・乳製品"},
-    {"id": "cheese", "name": "チーズ", "category": "卵・乳製品"},
-    {"id": "tofu", "name": "豆腐", "category": "大豆製品"},
-    {"id": "natto", "name": "納豆", "category": "大豆製品"},
-    {"id": "onion", "name": "玉ねぎ", "category": "野菜"},
-    {"id": "carrot", "name": "にんじん", "category": "野菜"},
-    {"id": "potato", "name": "じゃがいも", "category": "野菜"},
-    {"id": "cabbage", "name": "キャベツ", "category": "野菜"},
-    {"id": "tomato", "name": "トマト", "category": "野菜"},
-    {"id": "cucumber", "name": "きゅうり", "category": "野菜"},
-    {"id": "lettuce", "name": "レタス", "category": "野菜"},
-    {"id": "spinach", "name": "ほうれん草", "category": "野菜"},
-    {"id": "mushroom", "name": "きのこ類", "category": "野菜"},
-    {"id": "bell_pepper", "name": "ピーマン", "category": "野菜"},
-    {"id": "banana", "name": "バナナ", "category": "果物"},
-    {"id": "apple", "name": "りんご", "category": "果物"},
-    {"id": "lemon", "name": "レモン", "category": "果物"}
-]
-
-# ルートページ
-@app.route('/')
-def index():
-    return render_template('index.html', moods=MOODS, ingredients=INGREDIENTS)
-
-# レシピ生成API
-@app.route('/api/recipes', methods=['POST'])
-def get_recipes():
-    try:
-        data = request.json
-        mood = data.get('mood')
-        selected_ingredients = data.get('ingredients', [])
+"""5品提案モードのエントリポイント
 
-        if not mood or not selected_ingredients:
-            return jsonify({'error': '気分と食材を選択してください'}), 400
+以前は別に実装していたが、app.create_app の生成方式に multi_ai（1つのプロンプトで5品提案）を
+既定にしたアプリとして作る。クォータ・キャッシュ・/health などは app.py と共通。
+以前と同じく気分か食材が空のリクエストは400にする（応答の mood・ingredients・timestamp も同じ）。
 
-        ingredient_names = [
-            next((i['name'] for i in INGREDIENTS if i['id'] == ingredient_id), ingredient_id)
-            for ingredient_id in selected_ingredients
-        ]
-        mood_name = next((m['name'] for m in MOODS if m['id'] == mood), mood)
-
-        prompt = f"""
-あなたは経験豊富な日本の家庭料理の料理人です。
-以下の条件に基づいて、5つの料理レシピを提案してください。
-
-【気分・好み】: {mood_name}
-【使用可能な食材】: {', '.join(ingredient_names)}
-
-以下の形式で5つのレシピを提案してください：
-
-1. **料理名**
-   - 調理時間: XX分
-   - 難易度: ★☆☆（3段階）
-   - 材料: 使用する食材を列挙
-   - 作り方: 3〜5ステップで簡潔に
-   - ポイント: 美味しく作るコツ
-
-※注意:
-- 選択された食材はなるべくすべて使用してください。
-- 気分に合った味付け・調理法を選んでください。
-- 一般的な調味料（醤油・塩・胡椒など）は使用可能。
-- 初心者でも作れるレシピを心がけてください。
+    gunicorn -c gunicorn.conf.py app_no_HF:app
 """
+import os
 
-        response = model.generate_content(prompt)
-        return jsonify({
-            'success': True,
-            'mood': mood_name,
-            'ingredients': ingredient_names,
-            'recipes': response.text,
-            'timestamp': datetime.now().isoformat()
-        })
-
-    except Exception as e:
-        return jsonify({'error': f'レシピ生成中にエラーが発生しました: {str(e)}'}), 500
+from app import create_app
 
-# ヘルスチェック用
-@app.route('/health')
-def health_check():
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
+app = create_app({'RECIPE_ENGINE': 'multi_ai', 'RECIPE_REQUIRE_SELECTION': True})
 
 # 実行
 if __name__ == '__main__':
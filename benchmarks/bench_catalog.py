@@ -0,0 +1,143 @@
+"""カタログ・プロンプトテンプレートのマイクロベンチマーク
+
+以前のように関数内で参照表とプロンプトを毎回組み立てる方式と、
+catalog.py / prompts.py の事前構築済みの表・テンプレートを使う方式を比べ、
+1リクエストあたりの処理時間と、呼び出し中に確保されたメモリのピーク
+（tracemalloc）を表示する。
+
+    python benchmarks/bench_catalog.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import ingredient_names, mood_description, mood_name  # noqa: E402
+from prompts import render_recipe_prompt  # noqa: E402
+
+MOOD = 'happy'
+INGREDIENTS = ['rice', 'egg', 'chicken', 'onion', 'carrot']
+
+
+def legacy_request(mood, ingredients, context="", user_preferences=""):
+    """変更前の get_recipes + generate_ai_recipe 相当の処理"""
+    # get_recipes 内の参照表
+    ingredient_table = {
+        'rice': 'お米', 'pasta': 'パスタ', 'bread': 'パン', 'udon': 'うどん', 'soba': 'そば',
+        'chicken': '鶏肉', 'pork': '豚肉', 'beef': '牛肉', 'ground_meat': 'ひき肉',
+        'salmon': '鮭', 'tuna': 'まぐろ', 'shrimp': 'えび',
+        'egg': '卵', 'milk': '牛乳', 'cheese': 'チーズ', 'tofu': '豆腐', 'natto': '納豆',
+        'onion': '玉ねぎ', 'carrot': 'にんじん', 'potato': 'じゃがいも', 'cabbage': 'キャベツ',
+        'tomato': 'トマト', 'cucumber': 'きゅうり', 'lettuce': 'レタス', 'spinach': 'ほうれん草',
+        'mushroom': 'きのこ類', 'bell_pepper': 'ピーマン', 'banana': 'バナナ', 'apple': 'りんご', 'lemon': 'レモン'
+    }
+    mood_names = {
+        'happy': '元気いっぱい', 'tired': '疲れ気味', 'healthy': 'ヘルシー志向',
+        'comfort': '家庭的な気分', 'adventure': '冒険したい', 'spicy': 'スパイシー'
+    }
+    selected = [ingredient_table.get(ing, ing) for ing in ingredients]
+    display_name = mood_names.get(mood, mood)
+
+    # generate_ai_recipe 内の参照表とプロンプト
+    ingredient_table = {
+        'rice': 'お米', 'pasta': 'パスタ', 'bread': 'パン', 'udon': 'うどん', 'soba': 'そば',
+        'chicken': '鶏肉', 'pork': '豚肉', 'beef': '牛肉', 'ground_meat': 'ひき肉',
+        'salmon': '鮭', 'tuna': 'まぐろ', 'shrimp': 'えび',
+        'egg': '卵', 'milk': '牛乳', 'cheese': 'チーズ', 'tofu': '豆腐', 'natto': '納豆',
+        'onion': '玉ねぎ', 'carrot': 'にんじん', 'potato': 'じゃがいも', 'cabbage': 'キャベツ',
+        'tomato': 'トマト', 'cucumber': 'きゅうり', 'lettuce': 'レタス', 'spinach': 'ほうれん草',
+        'mushroom': 'きのこ類', 'bell_pepper': 'ピーマン', 'banana': 'バナナ', 'apple': 'りんご', 'lemon': 'レモン'
+    }
+    mood_descriptions = {
+        'happy': '元気いっぱいで楽しい気分',
+        'tired': '疲れていて簡単で栄養のあるものが欲しい',
+        'healthy': 'ヘルシーで体に良いものを食べたい',
+        'comfort': '懐かしくて心温まる家庭的な料理が欲しい',
+        'adventure': '新しい味や珍しい料理に挑戦したい',
+        'spicy': '辛くて刺激的な料理が食べたい'
+    }
+    japanese_ingredients = [ingredient_table.get(ing, ing) for ing in ingredients]
+    mood_desc = mood_descriptions.get(mood, mood)
+    prompt = f"""あなたは料理研究家で、親しみやすく実用的なレシピを提案する専門家です。
+
+**今回の状況:**
+- 気分: {mood_desc}
+- 使用できる食材: {', '.join(japanese_ingredients)}
+- 追加の要望: {context}
+- 好み: {user_preferences}
+
+**お願い:**
+上記の状況を考慮して、実際に作れる美味しいレシピを1つ提案してください。
+
+**回答形式（必ずこの形式で回答してください）:**
+
+## レシピ名
+（魅力的で分かりやすい名前）
+
+## 調理情報
+- ⏰ 調理時間: XX分
+- 📊 難易度: ★☆☆ または ★★☆ または ★★★
+- 🍽️ 人数: X人分
+
+## 材料
+（具体的な分量も含めて）
+- 主な食材（3-5個）
+- 調味料・その他（3-5個）
+
+## 作り方
+1. 【下準備】具体的な準備内容
+2. 【工程1】詳細な手順
+3. 【工程2】詳細な手順
+4. 【工程3】詳細な手順
+5. 【完成】仕上げの手順
+
+## コツ・ポイント
+（失敗しないための具体的なアドバイス）
+
+## なぜこのレシピなのか
+（今の気分や状況にぴったりな理由）
+
+**重要な注意事項:**
+- 実際に作れるレシピにしてください
+- 分量は具体的に書いてください
+- 調理時間は現実的にしてください
+- 使用できる食材を中心に構成してください（すべて使う必要はありません）"""
+    return display_name, selected, prompt
+
+
+def catalog_request(mood, ingredients, context="", user_preferences=""):
+    """catalog.py / prompts.py を使った現在の処理"""
+    selected = ingredient_names(ingredients)
+    display_name = mood_name(mood)
+    prompt = render_recipe_prompt(mood_description(mood), selected, context, user_preferences)
+    return display_name, selected, prompt
+
+
+def measure_peak_allocation(func, repeat=1000):
+    """1回の呼び出し中に確保されたメモリのピーク（バイト、平均）を測る"""
+    tracemalloc.start()
+    func(MOOD, INGREDIENTS)  # 初回の遅延初期化を除外
+    total = 0
+    for _ in range(repeat):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func(MOOD, INGREDIENTS)
+        _, peak = tracemalloc.get_traced_memory()
+        total += peak - current
+    tracemalloc.stop()
+    return total / repeat
+
+
+def main():
+    number = 20000
+    print(f"{'方式':<10}{'時間/回(µs)':>14}{'確保ピーク/回(B)':>20}")
+    for label, func in (('legacy', legacy_request), ('catalog', catalog_request)):
+        seconds = timeit.timeit(lambda: func(MOOD, INGREDIENTS), number=number)
+        peak = measure_peak_allocation(func)
+        print(f"{label:<10}{seconds / number * 1e6:>14.2f}{peak:>20.0f}")
+
+
+if __name__ == '__main__':
+    main()
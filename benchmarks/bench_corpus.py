@@ -0,0 +1,59 @@
+"""レシピ集の検索のマイクロベンチマーク
+
+同梱データに加えて、ランダムな食材・気分の組み合わせのレシピを指定件数まで登録し、
+recipe_corpus.RecipeCorpus.lookup の1回あたりの時間を表示する。
+
+    python benchmarks/bench_corpus.py --recipes 5000
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import INGREDIENTS, MOODS  # noqa: E402
+from recipe_corpus import RecipeCorpus  # noqa: E402
+
+
+def build_corpus(size, seed=0):
+    rng = random.Random(seed)
+    corpus = RecipeCorpus(max_learned=size)
+    corpus.load_dataset()
+    ingredient_ids = [ingredient.id for ingredient in INGREDIENTS]
+    mood_ids = [mood.id for mood in MOODS]
+    for i in range(size - len(corpus)):
+        ingredients = rng.sample(ingredient_ids, rng.randint(2, 6))
+        corpus.learn(f'synthetic:{i}', rng.choice(mood_ids), ingredients, f'## 合成レシピ{i}')
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipes', type=int, default=5000, help='登録するレシピ数')
+    parser.add_argument('--number', type=int, default=20000, help='検索回数')
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.recipes)
+    rng = random.Random(1)
+    ingredient_ids = [ingredient.id for ingredient in INGREDIENTS]
+    mood_ids = [mood.id for mood in MOODS]
+    queries = [(rng.choice(mood_ids), rng.sample(ingredient_ids, rng.randint(1, 8))) for _ in range(1000)]
+
+    print(f"{'選択食材数':<10}{'時間/回(µs)':>14}")
+    for size in (1, 3, 5, 8):
+        sized = [(mood, ingredients[:size]) for mood, ingredients in queries if len(ingredients) >= size]
+        position = iter(range(10 ** 9))
+
+        def lookup():
+            mood, ingredients = sized[next(position) % len(sized)]
+            corpus.lookup(mood, ingredients)
+
+        seconds = timeit.timeit(lookup, number=args.number)
+        print(f"{size:<10}{seconds / args.number * 1e6:>14.2f}")
+    print(f"レシピ数: {len(corpus)}")
+
+
+if __name__ == '__main__':
+    main()
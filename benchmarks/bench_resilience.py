@@ -0,0 +1,85 @@
+"""Gemini呼び出しの耐障害性のベンチマーク
+
+ローカルの代替モデル（fake_model.py）で遅延とエラーを注入し、LLMClient を
+サーキットブレーカー・リトライ・ヘッジの有無で比べる。上流のAPIは呼ばない。
+
+- outage: 上流が全て失敗する。ブレーカーがあれば数回で失敗を即答に切り替える
+- flaky: 一部の呼び出しが失敗する。リトライで成功率が上がる
+- tail: 一部の呼び出しだけ大きく遅れる。ヘッジでp99が下がる
+
+    python benchmarks/bench_resilience.py --requests 500
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_model import FakeGenerativeModel  # noqa: E402
+from llm_client import LLMClient  # noqa: E402
+from resilience import CircuitBreaker, HedgePolicy, RetryPolicy  # noqa: E402
+
+SCENARIOS = {
+    'outage': dict(latency=0.2, jitter=0.05, error_rate=1.0),
+    'flaky': dict(latency=0.05, jitter=0.02, error_rate=0.3),
+    'tail': dict(latency=0.05, jitter=0.02, slow_rate=0.03, slow_latency=1.5),
+}
+
+VARIANTS = {
+    'baseline': lambda: {},
+    'breaker': lambda: {'breaker': CircuitBreaker(failure_threshold=5, reset_timeout=60)},
+    'retry': lambda: {'retry': RetryPolicy(max_attempts=3, base_delay=0.02, max_delay=0.1, min_attempt_time=0.1)},
+    'hedge': lambda: {'hedge': HedgePolicy(min_samples=10, min_delay=0.05)},
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run(scenario, variant, requests, concurrency, timeout, seed=0):
+    model = FakeGenerativeModel(tokens_per_second=0, seed=seed, **SCENARIOS[scenario])
+    client = LLMClient(model, max_concurrency=concurrency * 2, timeout=timeout, acquire_timeout=1.0,
+                       **VARIANTS[variant]())
+
+    def call(_):
+        started = time.perf_counter()
+        try:
+            client.generate('ベンチマーク用のプロンプト')
+            ok = True
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, range(requests)))
+    latencies = [seconds * 1000 for _, seconds in results]
+    return {
+        'success': sum(ok for ok, _ in results) / len(results),
+        'p50': statistics.median(latencies),
+        'p99': percentile(latencies, 0.99),
+        'upstream_calls': model.calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500, help='シナリオごとのリクエスト数')
+    parser.add_argument('--concurrency', type=int, default=4, help='同時に送るリクエスト数')
+    parser.add_argument('--timeout', type=float, default=3.0, help='1リクエストの締め切り（秒）')
+    args = parser.parse_args()
+
+    print(f"{'シナリオ':<10}{'構成':<10}{'成功率':>8}{'p50 ms':>9}{'p99 ms':>9}{'上流呼出':>9}")
+    for scenario in SCENARIOS:
+        for variant in VARIANTS:
+            result = run(scenario, variant, args.requests, args.concurrency, args.timeout)
+            print(f"{scenario:<10}{variant:<10}{result['success']:>8.0%}{result['p50']:>9.0f}"
+                  f"{result['p99']:>9.0f}{result['upstream_calls']:>9}")
+
+
+if __name__ == '__main__':
+    main()
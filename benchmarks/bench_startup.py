@@ -0,0 +1,67 @@
+"""起動時間（import app）の内訳
+
+新しいPythonプロセスで `python -X importtime -c "import app"` を実行し、
+モジュールごとの読み込み時間（配下のモジュールを含む累計）の上位と合計を表示する。
+Gemini SDK（google.generativeai）が起動時に読み込まれていないかもここで確認できる。
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --module app_no_HF --top 30
+    python benchmarks/bench_startup.py --repeat 5   # 合計時間の最小・中央値
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SDK_PREFIX = 'google.generativeai'
+
+
+def profile_import(module):
+    """importtime の出力を [(モジュール名, 自身のμs, 累計のμs, 深さ)] にして返す"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'),
+    )
+    if result.returncode != 0:
+        tail = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError('\n'.join(tail[-10:]))
+    rows = []
+    for line in result.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='import app の起動時間の内訳')
+    parser.add_argument('--module', default='app', help='読み込むモジュール')
+    parser.add_argument('--top', type=int, default=20, help='表示するモジュール数')
+    parser.add_argument('--repeat', type=int, default=1, help='合計時間を測る回数')
+    args = parser.parse_args()
+
+    totals = []
+    for _ in range(args.repeat):
+        rows = profile_import(args.module)
+        totals.append(sum(row[1] for row in rows))
+
+    # 最上位（直接 import された）モジュールの累計が、そのモジュールによる起動時間
+    top_level = sorted((row for row in rows if row[3] == 1), key=lambda row: -row[2])
+    sdk_loaded = any(row[0].startswith(SDK_PREFIX) for row in rows)
+
+    print(f'import {args.module}: モジュール {len(rows)}個, '
+          f'合計 {min(totals) / 1000:.1f}ms (最小) / {statistics.median(totals) / 1000:.1f}ms (中央値)')
+    print(f'Gemini SDK: {"起動時に読み込まれています" if sdk_loaded else "起動時には読み込まれていません"}')
+    print(f'\n{"モジュール":<40}{"累計ms":>10}{"自身ms":>10}')
+    for name, self_us, cumulative_us, _ in top_level[:args.top]:
+        print(f'{name:<40}{cumulative_us / 1000:>10.1f}{self_us / 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
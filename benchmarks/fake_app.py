@@ -0,0 +1,23 @@
+"""代替モデルを組み込んだアプリ（gunicornでの負荷試験用）
+
+    FAKE_MODEL_LATENCY=1.0 FAKE_MODEL_ERROR_RATE=0.1 \\
+        gunicorn -c gunicorn.conf.py benchmarks.fake_app:app
+
+実際のGemini APIは呼ばれない。GEMINI_API_KEY が未設定でもAI経路が有効になる。
+"""
+import os
+
+os.environ.setdefault('GEMINI_API_KEY', 'benchmark-dummy-key')
+
+import app as app_module  # noqa: E402
+from benchmarks.fake_model import FakeGenerativeModel, install_fake_model  # noqa: E402
+
+fake_model = install_fake_model(app_module, FakeGenerativeModel(
+    latency=float(os.environ.get('FAKE_MODEL_LATENCY', '1.0')),
+    jitter=float(os.environ.get('FAKE_MODEL_JITTER', '0.2')),
+    tokens_per_second=float(os.environ.get('FAKE_MODEL_TOKENS_PER_SECOND', '200')),
+    error_rate=float(os.environ.get('FAKE_MODEL_ERROR_RATE', '0')),
+    stream_error_rate=float(os.environ.get('FAKE_MODEL_STREAM_ERROR_RATE', '0')),
+))
+
+app = app_module.app
@@ -0,0 +1,132 @@
+"""ベンチマーク用のGemini代替モデル
+
+`genai.GenerativeModel` と同じ `generate_content(prompt, stream=False)` を持ち、
+実際のAPIを呼ばずに応答する。待ち時間・出力速度・エラー率を設定できる。
+まとめて生成するプロンプト（/api/recipes/batch）にはリクエストの数だけレシピを返す。
+"""
+import random
+import threading
+import time
+
+from prompts import BATCH_RECIPE_REQUEST_HEADING
+
+SAMPLE_RECIPE = """## ふわとろ卵の親子丼
+
+## 調理情報
+- ⏰ 調理時間: 15分
+- 📊 難易度: ★☆☆
+- 🍽️ 人数: 2人分
+
+## 材料
+- 鶏もも肉 200g
+- 卵 3個
+- 玉ねぎ 1/2個
+- ご飯 2膳分
+- 醤油 大さじ2、みりん 大さじ2、砂糖 小さじ1、だし 100ml
+
+## 作り方
+1. 【下準備】鶏肉を一口大に、玉ねぎを薄切りにする
+2. 【工程1】フライパンにだしと調味料を入れて煮立てる
+3. 【工程2】鶏肉と玉ねぎを入れて5分煮る
+4. 【工程3】溶き卵を2回に分けて回し入れる
+5. 【完成】半熟のうちにご飯にのせる
+
+## コツ・ポイント
+卵は混ぜすぎず、白身が少し残るくらいにするとふわっと仕上がります。
+
+## なぜこのレシピなのか
+手早く作れてお腹も満たされる、元気が欲しい日にぴったりの一品です。"""
+
+
+class FakeModelError(Exception):
+    """注入されたエラー"""
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """待ち時間・出力速度・エラーを設定できる代替モデル
+
+    latency: 最初の出力までの秒数（平均）
+    jitter: latency に加えるばらつき（0〜jitter秒の一様乱数）
+    tokens_per_second: 出力速度（1文字を1トークンとみなす）。0なら即時
+    error_rate: 呼び出しが失敗する確率
+    slow_rate: 呼び出しが遅くなる確率（ロングテールの再現、ヘッジの確認用）
+    slow_latency: 遅くなった呼び出しに加える秒数
+    stream_error_rate: ストリーミングの途中で失敗する確率
+    """
+
+    def __init__(self, latency=1.0, jitter=0.2, tokens_per_second=200.0, error_rate=0.0,
+                 stream_error_rate=0.0, slow_rate=0.0, slow_latency=5.0, text=SAMPLE_RECIPE,
+                 chunk_size=40, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.stream_error_rate = stream_error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.text = text
+        self.chunk_size = chunk_size
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def _roll(self, rate):
+        with self._lock:
+            return self._random.random() < rate
+
+    def _first_token_delay(self):
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if self._random.random() < self.slow_rate:
+                delay += self.slow_latency
+            return delay
+
+    def _fail(self, message):
+        with self._lock:
+            self.errors += 1
+        raise FakeModelError(message)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self._first_token_delay())
+        if self._roll(self.error_rate):
+            self._fail('注入されたエラー: 上流が利用できません')
+        text = self._response_text(prompt)
+        if stream:
+            return self._stream(text)
+        if self.tokens_per_second:
+            time.sleep(len(text) / self.tokens_per_second)
+        return FakeResponse(text)
+
+    def _response_text(self, prompt):
+        numbers = BATCH_RECIPE_REQUEST_HEADING.findall(str(prompt))
+        if not numbers:
+            return self.text
+        return '\n\n'.join(f'=== レシピ {number} ===\n{self.text}' for number in numbers)
+
+    def _stream(self, text):
+        fail_midway = self._roll(self.stream_error_rate)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        for index, chunk in enumerate(chunks):
+            if fail_midway and index == len(chunks) // 2:
+                self._fail('注入されたエラー: ストリームが途中で切断されました')
+            if self.tokens_per_second:
+                time.sleep(len(chunk) / self.tokens_per_second)
+            yield FakeResponse(chunk)
+
+    def stats(self):
+        return {'calls': self.calls, 'errors': self.errors}
+
+
+def install_fake_model(app_module, model):
+    """app.py のモジュールレベルの model を代替モデルに差し替える"""
+    app_module.model = model
+    app_module.llm_client.model = model
+    return model
@@ -0,0 +1,369 @@
+"""負荷試験・レイテンシ計測ハーネス
+
+実際のGemini APIを呼ばずに /api/recipes・/api/ai-chef・/api/feedback の
+スループットとレイテンシを測る。シナリオごとに代替モデル（fake_model.py）の
+待ち時間・出力速度・エラー率を設定し、並列ユーザー数ぶんのスレッドで負荷をかける。
+
+    # アプリをプロセス内で直接呼ぶ（既定）
+    python benchmarks/loadtest.py
+
+    # gunicornで起動したアプリに対して実行
+    FAKE_MODEL_LATENCY=1.0 gunicorn -c gunicorn.conf.py benchmarks.fake_app:app &
+    python benchmarks/loadtest.py --url http://127.0.0.1:5000
+
+    # 前回の結果と比較
+    python benchmarks/loadtest.py --compare benchmarks/results/前回.json
+
+結果（p50/p95/p99レイテンシ、リクエスト/秒、AI/ルールベースの割合、Cookieサイズ）は
+JSONで benchmarks/results/ に保存される。
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_model import FakeGenerativeModel, install_fake_model  # noqa: E402
+from catalog import INGREDIENTS, MOODS  # noqa: E402
+
+# 人気の組み合わせに偏ったトラフィック
+POPULAR_COMBOS = [
+    ('happy', ['rice', 'egg', 'chicken']),
+    ('tired', ['udon', 'egg', 'onion']),
+    ('healthy', ['tofu', 'spinach', 'carrot']),
+    ('comfort', ['potato', 'carrot', 'pork', 'onion']),
+]
+
+SCENARIOS = [
+    {
+        'name': 'recipes_mixed',
+        'description': '人気の組み合わせ7割 + ランダム3割、AI/ルールベースは通常判定',
+        'endpoint': '/api/recipes',
+        'concurrency': 16,
+        'requests': 400,
+        'model': {'latency': 0.8, 'jitter': 0.4, 'tokens_per_second': 400},
+        'payload': 'mixed_recipe',
+    },
+    {
+        'name': 'recipes_force_ai_unique',
+        'description': '毎回異なる要望でAI生成を強制（キャッシュが効かない最悪ケース）',
+        'endpoint': '/api/recipes',
+        'concurrency': 16,
+        'requests': 200,
+        'model': {'latency': 0.8, 'jitter': 0.4, 'tokens_per_second': 400},
+        'payload': 'unique_force_ai',
+    },
+    {
+        'name': 'recipes_hot_combo',
+        'description': '全員が同じ組み合わせでAI生成を強制（キャッシュ・まとめ実行の効果）',
+        'endpoint': '/api/recipes',
+        'concurrency': 32,
+        'requests': 400,
+        'model': {'latency': 0.8, 'jitter': 0.4, 'tokens_per_second': 400},
+        'payload': 'hot_combo',
+    },
+    {
+        'name': 'recipes_flaky_upstream',
+        'description': '上流の3割が失敗・遅延大（フォールバックの効果）',
+        'endpoint': '/api/recipes',
+        'concurrency': 16,
+        'requests': 200,
+        'model': {'latency': 2.0, 'jitter': 2.0, 'tokens_per_second': 200, 'error_rate': 0.3},
+        'payload': 'unique_force_ai',
+    },
+    {
+        'name': 'ai_chef_conversation',
+        'description': '1ユーザーが連続して会話（会話履歴とCookieサイズの増加）',
+        'endpoint': '/api/ai-chef',
+        'concurrency': 8,
+        'requests': 160,
+        'model': {'latency': 0.8, 'jitter': 0.4, 'tokens_per_second': 400},
+        'payload': 'chat',
+    },
+    {
+        'name': 'feedback',
+        'description': 'フィードバック送信（上流呼び出しなし）',
+        'endpoint': '/api/feedback',
+        'concurrency': 16,
+        'requests': 800,
+        'model': {'latency': 0.0, 'jitter': 0.0, 'tokens_per_second': 0},
+        'payload': 'feedback',
+    },
+]
+
+
+def build_payload(kind, rng, index):
+    """シナリオの種類に応じたリクエスト本文"""
+    if kind == 'mixed_recipe':
+        if rng.random() < 0.7:
+            mood, ingredients = rng.choice(POPULAR_COMBOS)
+        else:
+            mood = rng.choice(MOODS).id
+            ingredients = [ingredient.id for ingredient in rng.sample(INGREDIENTS, rng.randint(2, 5))]
+        return {'mood': mood, 'ingredients': ingredients}
+    if kind == 'unique_force_ai':
+        mood = rng.choice(MOODS).id
+        ingredients = [ingredient.id for ingredient in rng.sample(INGREDIENTS, rng.randint(2, 5))]
+        return {'mood': mood, 'ingredients': ingredients, 'context': f'ベンチマーク {index}', 'force_ai': True}
+    if kind == 'hot_combo':
+        mood, ingredients = POPULAR_COMBOS[0]
+        return {'mood': mood, 'ingredients': ingredients, 'force_ai': True}
+    if kind == 'chat':
+        mood, ingredients = rng.choice(POPULAR_COMBOS)
+        return {'message': f'もう少し簡単にできますか？（{index}回目）', 'mood': mood, 'ingredients': ingredients}
+    if kind == 'feedback':
+        mood, ingredients = rng.choice(POPULAR_COMBOS)
+        return {
+            'type': rng.choice(['like', 'dislike', 'suggestion']),
+            'text': '美味しかったです',
+            'recipe_data': {'mood': mood, 'ingredients': ingredients, 'generation_method': 'ai_generated'},
+        }
+    raise ValueError(f'未知のペイロード種別: {kind}')
+
+
+def classify(endpoint, status, body):
+    """レスポンスを生成方法ごとに分類"""
+    if status >= 500 or body is None:
+        return 'error'
+    if endpoint == '/api/ai-chef':
+        return 'ai_generated' if status == 200 else f'rejected_{status}'
+    if endpoint == '/api/feedback':
+        return 'feedback'
+    return body.get('generation_method', 'unknown')
+
+
+class InProcessUser:
+    """Flaskのテストクライアントでアプリを直接呼ぶ1ユーザー"""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+        self.cookie_bytes = 0
+
+    def post(self, endpoint, payload):
+        response = self.client.post(endpoint, json=payload)
+        for header in response.headers.getlist('Set-Cookie'):
+            self.cookie_bytes = len(header.split(';', 1)[0])
+        try:
+            body = response.get_json(silent=True)
+        except Exception:
+            body = None
+        return response.status_code, body
+
+
+class HttpUser:
+    """HTTPで起動済みのサーバーを呼ぶ1ユーザー（Cookieを保持）"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+        self.cookie_bytes = 0
+
+    def post(self, endpoint, payload):
+        request = urllib.request.Request(
+            self.base_url + endpoint,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        try:
+            with self.opener.open(request, timeout=120) as response:
+                status, raw = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, raw = e.code, e.read()
+        self.cookie_bytes = sum(len(cookie.name) + len(cookie.value or '') + 1 for cookie in self.cookies)
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            body = None
+        return status, body
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_scenario(scenario, make_user, seed):
+    """1シナリオを実行して集計結果を返す"""
+    rng = random.Random(seed)
+    payloads = [build_payload(scenario['payload'], rng, i) for i in range(scenario['requests'])]
+    users = [make_user() for _ in range(scenario['concurrency'])]
+    latencies = []
+    methods = {}
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker(user_index):
+        user = users[user_index]
+        for payload in payloads[user_index::len(users)]:
+            started = time.perf_counter()
+            try:
+                status, body = user.post(scenario['endpoint'], payload)
+            except Exception:
+                status, body = 599, None
+            elapsed = time.perf_counter() - started
+            method = classify(scenario['endpoint'], status, body)
+            with lock:
+                latencies.append(elapsed)
+                methods[method] = methods.get(method, 0) + 1
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(users)) as executor:
+        list(executor.map(worker, range(len(users))))
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    total = len(latencies)
+    cookie_sizes = [user.cookie_bytes for user in users]
+    ai_count = methods.get('ai_generated', 0)
+    rule_count = methods.get('rule_based', 0)
+    return {
+        'name': scenario['name'],
+        'description': scenario['description'],
+        'endpoint': scenario['endpoint'],
+        'concurrency': scenario['concurrency'],
+        'requests': total,
+        'duration_s': round(duration, 3),
+        'requests_per_second': round(total / duration, 2) if duration else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99': round(percentile(latencies, 0.99) * 1000, 2),
+            'mean': round(sum(latencies) / total * 1000, 2) if total else 0.0,
+            'max': round(latencies[-1] * 1000, 2) if total else 0.0,
+        },
+        'status_counts': statuses,
+        'generation_methods': methods,
+        'ai_ratio': round(ai_count / (ai_count + rule_count), 4) if ai_count + rule_count else None,
+        'cookie_bytes': {
+            'max': max(cookie_sizes) if cookie_sizes else 0,
+            'mean': round(sum(cookie_sizes) / len(cookie_sizes), 1) if cookie_sizes else 0,
+        },
+        'model': scenario['model'],
+    }
+
+
+def prepare_in_process_app():
+    """ベンチマーク用の設定でアプリを読み込む（ストアは一時ディレクトリ）"""
+    workdir = tempfile.mkdtemp(prefix='recipe-bench-')
+    os.environ.setdefault('GEMINI_API_KEY', 'benchmark-dummy-key')
+    os.environ.setdefault('DAILY_AI_LIMIT', '1000000')
+    os.environ.setdefault('RECIPE_CACHE_BACKEND', 'memory')
+    os.environ.setdefault('AI_QUOTA_BACKEND', 'memory')
+    # 全ユーザーが同じIPから送るので、IPごとのレート制限は試験の邪魔になる（--url の場合はサーバー側の設定に従う）
+    os.environ.setdefault('RATE_LIMIT_BACKEND', 'off')
+    os.environ.setdefault('SESSION_STORE_PATH', os.path.join(workdir, 'sessions.sqlite3'))
+    import app as app_module
+    return app_module
+
+
+def reset_app_state(app_module):
+    """シナリオ間でキャッシュ・クォータの状態を持ち越さない"""
+    from quota import MemoryQuotaStore
+    from recipe_cache import create_cache_from_env
+    from singleflight import create_singleflight_from_env
+
+    app_module.recipe_cache = create_cache_from_env()
+    app_module.ai_quota = MemoryQuotaStore(app_module.DAILY_AI_LIMIT)
+    app_module.ai_singleflight = create_singleflight_from_env(app_module.recipe_cache)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def print_summary(results, baseline=None):
+    baseline_by_name = {s['name']: s for s in (baseline or {}).get('scenarios', [])}
+    header = f"{'シナリオ':<26}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'AI率':>7}{'Cookie':>8}"
+    print(header)
+    for s in results['scenarios']:
+        ai_ratio = '-' if s['ai_ratio'] is None else f"{s['ai_ratio']:.0%}"
+        line = (f"{s['name']:<26}{s['requests_per_second']:>9.1f}{s['latency_ms']['p50']:>9.0f}"
+                f"{s['latency_ms']['p95']:>9.0f}{s['latency_ms']['p99']:>9.0f}{ai_ratio:>7}{s['cookie_bytes']['max']:>8}")
+        print(line)
+        previous = baseline_by_name.get(s['name'])
+        if previous:
+            def delta(current, before):
+                return f"{(current - before) / before:+.0%}" if before else 'n/a'
+            print(f"{'  (前回比)':<26}{delta(s['requests_per_second'], previous['requests_per_second']):>9}"
+                  f"{delta(s['latency_ms']['p50'], previous['latency_ms']['p50']):>9}"
+                  f"{delta(s['latency_ms']['p95'], previous['latency_ms']['p95']):>9}"
+                  f"{delta(s['latency_ms']['p99'], previous['latency_ms']['p99']):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='レシピAPIの負荷試験')
+    parser.add_argument('--url', help='起動済みサーバーのURL（省略時はプロセス内で実行）')
+    parser.add_argument('--scenario', action='append', help='実行するシナリオ名（複数指定可）')
+    parser.add_argument('--scale', type=float, default=1.0, help='リクエスト数の倍率')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='結果JSONの保存先（省略時は benchmarks/results/ に自動命名）')
+    parser.add_argument('--compare', help='比較対象の過去の結果JSON')
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if not args.scenario or s['name'] in args.scenario]
+    if not scenarios:
+        parser.error('該当するシナリオがありません: ' + ', '.join(s['name'] for s in SCENARIOS))
+
+    app_module = None if args.url else prepare_in_process_app()
+    results = {
+        'meta': {
+            'git_commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'target': args.url or 'in-process',
+            'seed': args.seed,
+        },
+        'scenarios': [],
+    }
+
+    for scenario in scenarios:
+        scenario = dict(scenario, requests=max(int(scenario['requests'] * args.scale), 1))
+        if app_module is not None:
+            reset_app_state(app_module)
+            model = install_fake_model(app_module, FakeGenerativeModel(seed=args.seed, **scenario['model']))
+            result = run_scenario(scenario, lambda: InProcessUser(app_module.app), args.seed)
+            result['upstream'] = model.stats()
+        else:
+            result = run_scenario(scenario, lambda: HttpUser(args.url), args.seed)
+        results['scenarios'].append(result)
+        print(f"完了: {scenario['name']} ({result['requests']}件, {result['duration_s']}秒)", file=sys.stderr)
+
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results',
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{results['meta']['git_commit'] or 'nogit'}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_summary(results, baseline)
+    print(f"結果を保存しました: {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""気分・食材のカタログ
+
+app.py と app_no_HF.py で別々に持っていた気分・食材の定義を1か所にまとめたもの。
+インポート時に一度だけ組み立て、以降は変更できない（タプルと読み取り専用の辞書）。
+リクエスト処理中は辞書の参照だけで済む。
+"""
+from collections import namedtuple
+from types import MappingProxyType
+
+Mood = namedtuple('Mood', ['id', 'name', 'emoji', 'description'])
+Ingredient = namedtuple('Ingredient', ['id', 'name', 'category'])
+
+# 気分一覧（前半6つは app.py の画面、後半5つは app_no_HF.py の気分）
+MOODS = (
+    Mood('happy', '元気いっぱい', '😄', '元気いっぱいで楽しい気分'),
+    Mood('tired', '疲れ気味', '😴', '疲れていて簡単で栄養のあるものが欲しい'),
+    Mood('healthy', 'ヘルシー志向', '🥗', 'ヘルシーで体に良いものを食べたい'),
+    Mood('comfort', '家庭的な気分', '🏠', '懐かしくて心温まる家庭的な料理が欲しい'),
+    Mood('adventure', '冒険したい', '🌟', '新しい味や珍しい料理に挑戦したい'),
+    Mood('spicy', 'スパイシー', '🌶️', '辛くて刺激的な料理が食べたい'),
+    Mood('salty', '塩味のもの', '🧂', '塩味の効いた料理が食べたい'),
+    Mood('sweet', '甘めのもの', '🍯', '甘めの味付けの料理が食べたい'),
+    Mood('energizing', '元気がでるもの', '💪', '元気が出るスタミナのある料理が食べたい'),
+    Mood('light', '軽いもの', '🥗', '軽くてさっぱりした料理が食べたい'),
+    Mood('gentle', '胃にやさしいもの', '☕', '胃にやさしい料理が食べたい'),
+)
+
+# 食材リスト
+INGREDIENTS = (
+    Ingredient('rice', 'お米', '主食'),
+    Ingredient('pasta', 'パスタ', '主食'),
+    Ingredient('bread', 'パン', '主食'),
+    Ingredient('udon', 'うどん', '主食'),
+    Ingredient('soba', 'そば', '主食'),
+    Ingredient('chicken', '鶏肉', '肉類'),
+    Ingredient('pork', '豚肉', '肉類'),
+    Ingredient('beef', '牛肉', '肉類'),
+    Ingredient('ground_meat', 'ひき肉', '肉類'),
+    Ingredient('salmon', '鮭', '魚類'),
+    Ingredient('tuna', 'まぐろ', '魚類'),
+    Ingredient('shrimp', 'えび', '魚類'),
+    Ingredient('egg', '卵', '卵・乳製品'),
+    Ingredient('milk', '牛乳', '卵・乳製品'),
+    Ingredient('cheese', 'チーズ', '卵・乳製品'),
+    Ingredient('tofu', '豆腐', '大豆製品'),
+    Ingredient('natto', '納豆', '大豆製品'),
+    Ingredient('onion', '玉ねぎ', '野菜'),
+    Ingredient('carrot', 'にんじん', '野菜'),
+    Ingredient('potato', 'じゃがいも', '野菜'),
+    Ingredient('cabbage', 'キャベツ', '野菜'),
+    Ingredient('tomato', 'トマト', '野菜'),
+    Ingredient('cucumber', 'きゅうり', '野菜'),
+    Ingredient('lettuce', 'レタス', '野菜'),
+    Ingredient('spinach', 'ほうれん草', '野菜'),
+    Ingredient('mushroom', 'きのこ類', '野菜'),
+    Ingredient('bell_pepper', 'ピーマン', '野菜'),
+    Ingredient('banana', 'バナナ', '果物'),
+    Ingredient('apple', 'りんご', '果物'),
+    Ingredient('lemon', 'レモン', '果物'),
+)
+
+# id → 定義 の索引
+MOODS_BY_ID = MappingProxyType({mood.id: mood for mood in MOODS})
+INGREDIENTS_BY_ID = MappingProxyType({ingredient.id: ingredient for ingredient in INGREDIENTS})
+
+# id → 表示名 などのよく使う参照表
+MOOD_NAMES = MappingProxyType({mood.id: mood.name for mood in MOODS})
+MOOD_DESCRIPTIONS = MappingProxyType({mood.id: mood.description for mood in MOODS})
+INGREDIENT_NAMES = MappingProxyType({ingredient.id: ingredient.name for ingredient in INGREDIENTS})
+
+# id → カタログ内の位置（ベクトル化やビット集合で使う）
+MOOD_INDEX = MappingProxyType({mood.id: i for i, mood in enumerate(MOODS)})
+INGREDIENT_INDEX = MappingProxyType({ingredient.id: i for i, ingredient in enumerate(INGREDIENTS)})
+
+
+def mood_name(mood_id):
+    """気分の表示名（未知のidはそのまま返す）"""
+    return MOOD_NAMES.get(mood_id, mood_id)
+
+
+def mood_description(mood_id):
+    """プロンプト用の気分の説明（未知のidはそのまま返す）"""
+    return MOOD_DESCRIPTIONS.get(mood_id, mood_id)
+
+
+def ingredient_names(ingredient_ids):
+    """食材idのリストを日本語名のリストに変換（未知のidはそのまま）"""
+    get = INGREDIENT_NAMES.get
+    return [get(ingredient_id, ingredient_id) for ingredient_id in ingredient_ids]
@@ -0,0 +1,156 @@
+"""AI Chefの会話履歴の圧縮
+
+これまでは直近3往復のAIの回答を全文プロンプトに入れていたため、回答が長いほど
+プロンプトが大きくなり、レイテンシとコストが増えていた。ここでは会話履歴を
+
+- それより前の往復の要約（1往復1行、ユーザーの質問とAIが提案したレシピ名など）
+- 直近の往復（全文）
+
+にして、トークン数の見積もりが上限を超えないように詰める。要約は新しく押し出された往復の分だけ
+作ってセッションに保存し、メッセージのたびに履歴全体を要約し直さない。
+要約はローカルで機械的に作る（要約のためにAIを呼ぶとクォータを消費するため）。
+"""
+import os
+import re
+from collections import namedtuple
+
+from recipe_model import parse_recipe
+
+# トークン数の見積もり: 日本語（かな・漢字・全角記号）は1文字1トークン、
+# それ以外の英数字などは4文字で1トークンとみなす
+_WIDE_CHARS = re.compile(r'[　-ヿ㐀-鿿豈-﫿＀-￯]')
+_NARROW_RUNS = re.compile(r'[^\s　-ヿ㐀-鿿豈-﫿＀-￯]+')
+_SENTENCE_END = re.compile(r'(?<=[。！？!?])')
+_MARKDOWN = re.compile(r'[#*`>|]+')
+
+ChatContext = namedtuple('ChatContext', ['history_lines', 'summary', 'tokens', 'original_tokens'])
+
+
+def estimate_tokens(text):
+    """文字列のトークン数の概算"""
+    if not text:
+        return 0
+    wide = len(_WIDE_CHARS.findall(text))
+    narrow = sum((len(run) + 3) // 4 for run in _NARROW_RUNS.findall(text))
+    return wide + narrow
+
+
+def _shorten(text, limit):
+    text = ' '.join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def summarize_turn(turn):
+    """1往復を要約の1行にする（レシピの回答ならレシピ名、それ以外は最初の1文）"""
+    question = _shorten(turn.get('user', ''), 60)
+    answer = turn.get('ai', '')
+    recipe = parse_recipe(answer)
+    if recipe is not None:
+        headline = f'「{recipe.name}」のレシピを提案'
+    else:
+        plain = _MARKDOWN.sub('', answer).strip()
+        headline = _shorten(_SENTENCE_END.split(plain, maxsplit=1)[0], 80) if plain else '（回答なし）'
+    return f'ユーザー「{question}」→ AI Chef: {headline}'
+
+
+def _format_turn(turn):
+    return f'ユーザー: {turn["user"]}\nAI Chef: {turn["ai"]}'
+
+
+def _summary_block(items):
+    return 'これまでの会話の要約:\n' + '\n'.join(f'- {item}' for item in items)
+
+
+class ChatContextManager:
+    """会話履歴を「要約＋直近の往復」にしてトークン数の上限内に収める
+
+    token_budget: 会話履歴の部分に使うトークン数の上限（見積もり）
+    recent_turns: 全文で入れる直近の往復の数
+    summary_max_items: 要約に残す往復の数（古いものから捨てる）
+    legacy_turns: 比較用の従来方式（全文で入れていた往復の数、削減量の計算に使う）
+    """
+
+    def __init__(self, token_budget=600, recent_turns=1, summary_max_items=8, legacy_turns=3):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.summary_max_items = summary_max_items
+        self.legacy_turns = legacy_turns
+        self.builds = 0
+        self.turns_summarized = 0
+        self.truncated = 0
+        self.tokens = 0
+        self.original_tokens = 0
+
+    def update_summary(self, history, summary=None):
+        """要約に未反映の往復（直近の往復より前のもの）だけを要約に加える
+
+        summary は前回の戻り値（{'items': [...], 'until': 最後に要約した往復の timestamp}）。
+        """
+        items = list(summary['items']) if summary else []
+        until = summary.get('until') if summary else None
+        older = history[:-self.recent_turns] if self.recent_turns else list(history)
+        added = 0
+        for turn in older:
+            timestamp = turn.get('timestamp')
+            if until is not None and timestamp is not None and timestamp <= until:
+                continue
+            items.append(summarize_turn(turn))
+            until = timestamp or until
+            added += 1
+        if not added and summary:
+            return summary
+        self.turns_summarized += added
+        return {'items': items[-self.summary_max_items:], 'until': until}
+
+    def build(self, history, summary=None):
+        """プロンプトに入れる会話履歴の行を組み立てる（戻り値: ChatContext）"""
+        summary = self.update_summary(history, summary)
+        recent = history[-self.recent_turns:] if self.recent_turns else []
+        recent_lines = [_format_turn(turn) for turn in recent]
+        items = list(summary['items'])
+
+        def total(lines, items):
+            block = estimate_tokens(_summary_block(items)) if items else 0
+            return block + sum(estimate_tokens(line) for line in lines)
+
+        # 上限を超える場合は古い要約から捨て、それでも超える場合は直近の回答を先頭だけにする
+        while items and total(recent_lines, items) > self.token_budget:
+            items.pop(0)
+        if recent_lines and total(recent_lines, items) > self.token_budget:
+            self.truncated += 1
+            turn = recent[-1]
+            head = _format_turn({'user': turn['user'], 'ai': ''})
+            room = max(self.token_budget - total(recent_lines[:-1], items) - estimate_tokens(head), 0)
+            answer = turn['ai']
+            while answer and estimate_tokens(answer) > room:
+                answer = answer[:len(answer) * 3 // 4]
+            recent_lines[-1] = head + (answer + '…（以下省略）' if answer else '（省略）')
+
+        lines = ([_summary_block(items)] if items else []) + recent_lines
+        tokens = total(recent_lines, items)
+        original_tokens = sum(estimate_tokens(_format_turn(turn)) for turn in history[-self.legacy_turns:])
+        self.builds += 1
+        self.tokens += tokens
+        self.original_tokens += original_tokens
+        return ChatContext(lines, summary, tokens, original_tokens)
+
+    def stats(self):
+        return {
+            'token_budget': self.token_budget,
+            'recent_turns': self.recent_turns,
+            'builds': self.builds,
+            'turns_summarized': self.turns_summarized,
+            'truncated': self.truncated,
+            'history_tokens': self.tokens,
+            'history_tokens_before_compaction': self.original_tokens,
+            'tokens_saved': self.original_tokens - self.tokens,
+        }
+
+
+def create_chat_context_from_env():
+    """環境変数の設定から会話履歴の圧縮を作成"""
+    return ChatContextManager(
+        token_budget=int(os.environ.get('CHEF_CONTEXT_TOKEN_BUDGET', '600')),
+        recent_turns=int(os.environ.get('CHEF_CONTEXT_RECENT_TURNS', '1')),
+        summary_max_items=int(os.environ.get('CHEF_CONTEXT_SUMMARY_ITEMS', '8')),
+    )
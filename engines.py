@@ -0,0 +1,199 @@
+"""レシピの生成方式（エンジン）
+
+これまで app.py（AI1品＋ルールベース）と app_no_HF.py（1つのプロンプトで5品提案）は
+別々のエントリポイントで、同じ画面を別のコードで処理していた。ここでは生成方式を
+RecipeEngine として揃え、app.create_app の設定（RECIPE_ENGINE）やリクエストごとの
+engine 指定で選べるようにする。
+
+- single_ai: Geminiで1品生成（キャッシュ・同時リクエストのまとめ込みあり）
+- multi_ai: 1つのプロンプトでGeminiに5品提案させる（旧 app_no_HF.py）
+- corpus: ローカルのレシピ集から気分・食材の合うレシピを返す（合うものがなければ返さない）
+- rule_based: 気分ごとの定型レシピ
+
+各エンジンはコスト（1リクエストあたりのAI使用回数）と想定レイテンシ（秒）を持つ。
+想定レイテンシは実際に生成した時間の移動平均で更新する。EngineRegistry.plan は
+レイテンシの目標を満たすエンジンのうち、コストの低いもの（同じなら登録順）から並べる。
+"""
+import threading
+import time
+from collections import namedtuple
+
+# cost: 1リクエストあたりのAI使用回数、latency: 想定レイテンシ（秒）
+EngineProfile = namedtuple('EngineProfile', ['cost', 'latency'])
+
+# preference は PreferenceVector
+RecipeRequest = namedtuple('RecipeRequest', ['mood', 'ingredients', 'context', 'preference'])
+
+# recipe は Recipe か文字列、cache_match は 'exact' / 'similar' / 'precomputed' / None
+EngineResult = namedtuple('EngineResult', ['recipe', 'from_cache', 'cache_match'])
+
+AUTO = 'auto'
+
+
+class RecipeEngine:
+    """生成方式の共通部分（generate をサブクラスで実装する）"""
+
+    name = None
+    uses_ai = False
+
+    def __init__(self, cost, latency, smoothing=0.2):
+        self.cost = cost
+        self.latency = latency
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.misses = 0
+
+    def available(self):
+        return True
+
+    def profile(self):
+        return EngineProfile(self.cost, self.latency)
+
+    def generate(self, recipe_request):
+        """レシピを生成する（生成できなければ None）"""
+        raise NotImplementedError
+
+    def run(self, recipe_request):
+        """generate を呼び、生成にかかった時間で想定レイテンシを更新する"""
+        started = time.perf_counter()
+        result = self.generate(recipe_request)
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self.calls += 1
+            if result is None:
+                self.misses += 1
+            elif not result.from_cache:
+                # キャッシュから返した分は生成の速さを表さないので含めない
+                self.latency += self.smoothing * (seconds - self.latency)
+        return result
+
+    def stats(self):
+        return {
+            'cost': self.cost,
+            'latency': round(self.latency, 4),
+            'available': self.available(),
+            'calls': self.calls,
+            'misses': self.misses,
+        }
+
+
+class SingleAIEngine(RecipeEngine):
+    """Geminiで1品生成する
+
+    generate: (mood, ingredients, context, user_preferences) → (レシピ, キャッシュ由来か)
+    available: AIを使えるか（モデルの設定とクォータの残り）を返す関数
+    """
+
+    name = 'single_ai'
+    uses_ai = True
+
+    def __init__(self, generate, available, cost=1, latency=3.0):
+        super().__init__(cost, latency)
+        self._generate = generate
+        self._available = available
+
+    def available(self):
+        return self._available()
+
+    def generate(self, recipe_request):
+        recipe, from_cache = self._generate(recipe_request.mood, recipe_request.ingredients, recipe_request.context,
+                                            recipe_request.preference.signature())
+        if not recipe:
+            return None
+        return EngineResult(recipe, from_cache, 'exact' if from_cache else None)
+
+
+class MultiRecipeAIEngine(SingleAIEngine):
+    """1つのプロンプトでGeminiに5品提案させる（出力が長いぶん遅い）"""
+
+    name = 'multi_ai'
+
+    def __init__(self, generate, available, cost=1, latency=8.0):
+        super().__init__(generate, available, cost, latency)
+
+
+class CorpusEngine(RecipeEngine):
+    """ローカルのレシピ集から選ぶ（corpus は RecipeCorpus）"""
+
+    name = 'corpus'
+
+    def __init__(self, corpus, cost=0, latency=0.005):
+        super().__init__(cost, latency)
+        self.corpus = corpus
+
+    def available(self):
+        return self.corpus is not None
+
+    def generate(self, recipe_request):
+        match = self.corpus.lookup(recipe_request.mood, recipe_request.ingredients, recipe_request.preference)
+        if match is None:
+            return None
+        return EngineResult(match.recipe.text, False, None)
+
+
+class RuleBasedEngine(RecipeEngine):
+    """気分ごとの定型レシピ（必ず生成できる）
+
+    generate: (mood, ingredients) → レシピの文字列
+    """
+
+    name = 'rule_based'
+
+    def __init__(self, generate, cost=0, latency=0.001):
+        super().__init__(cost, latency)
+        self._generate = generate
+
+    def generate(self, recipe_request):
+        return EngineResult(self._generate(recipe_request.mood, recipe_request.ingredients), False, None)
+
+
+class EngineRegistry:
+    """エンジンの一覧と、リクエストごとに試す順番の決定
+
+    engines は品質の高い順に並べる（コストが同じならこの順で選ぶ）。
+    """
+
+    def __init__(self, engines):
+        self._engines = {engine.name: engine for engine in engines}
+
+    @property
+    def names(self):
+        return tuple(self._engines)
+
+    def get(self, name):
+        return self._engines.get(name)
+
+    def candidates(self, uses_ai, latency_target=None):
+        """使えるエンジンのうち、レイテンシの目標を満たすものをコストの低い順に返す"""
+        engines = [engine for engine in self._engines.values() if engine.uses_ai == uses_ai and engine.available()]
+        if latency_target is not None:
+            engines = [engine for engine in engines if engine.latency <= latency_target]
+        order = list(self._engines)
+        return sorted(engines, key=lambda engine: (engine.cost, order.index(engine.name)))
+
+    def fallbacks(self, latency_target=None):
+        """AIを使わないエンジンを試す順番（目標を満たすものがなければ速い順）"""
+        engines = self.candidates(False, latency_target)
+        if not engines:
+            engines = sorted(self.candidates(False), key=lambda engine: engine.latency)
+        return engines
+
+    def plan(self, name=AUTO, use_ai=False, latency_target=None):
+        """試すエンジンを順に返す（最後はAIを使わないエンジン）
+
+        name に auto 以外を指定した場合はそのエンジンを先頭にする（使えなければ飛ばす）。
+        auto の場合は use_ai のときだけAIのエンジンを1つ選ぶ。
+        """
+        engines = []
+        if name != AUTO:
+            engine = self._engines[name]
+            if engine.available():
+                engines.append(engine)
+        elif use_ai:
+            engines += self.candidates(True, latency_target)[:1]
+        engines += [engine for engine in self.fallbacks(latency_target) if engine not in engines]
+        return engines
+
+    def stats(self):
+        return {name: engine.stats() for name, engine in self._engines.items()}
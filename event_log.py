@@ -0,0 +1,230 @@
+"""レシピ履歴とフィードバックのイベントログ
+
+これまで履歴とフィードバックはセッション（Cookie）にしかなく、サーバー側には残らなかった。
+ここではリクエスト処理からイベントをメモリ上のキューに積むだけにし、
+バックグラウンドのスレッドがまとめて追記専用のJSON Lines ファイルに書き出す。
+
+- ファイルはワーカーごとに別（events-<日時>-<pid>-<連番>.jsonl）で、追記のみ行う
+- 一定サイズを超えるか日付が変わったら新しいファイルに切り替える
+- fsync は batch（書き出すたび）/ interval（fsync_interval 秒ごと）/ off から選ぶ
+- キューが上限を超えた分は捨てて件数を数える（リクエスト処理を待たせない）
+
+集計はログを読み直して行う。
+
+    python event_log.py instance/events          # 気分・食材ごとの「いいね」率
+    python event_log.py instance/events --json
+"""
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+FSYNC_POLICIES = ('batch', 'interval', 'off')
+
+
+class EventLog:
+    """イベントをまとめて追記するログ"""
+
+    def __init__(self, directory, batch_size=256, flush_interval=1.0, max_pending=10000,
+                 segment_bytes=16 * 1024 * 1024, fsync='interval', fsync_interval=5.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f'fsync は {FSYNC_POLICIES} のいずれかです: {fsync}')
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        # deque の append / popleft はスレッドセーフなので、積む側はロックを取らない
+        self._pending = deque()
+        self._wakeup = threading.Event()
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._writer_pid = None
+        self._file = None
+        self._segment_day = None
+        self._last_fsync = 0.0
+        self.emitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.segments = 0
+        self.errors = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def emit(self, event_type, **fields):
+        """イベントを積む（書き出しはバックグラウンドで行う）"""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        fields['type'] = event_type
+        fields['ts'] = time.time()
+        self._pending.append(fields)
+        self.emitted += 1
+        if self._writer_pid != os.getpid():
+            self._start_writer()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _start_writer(self):
+        with self._write_lock:
+            # fork後の子プロセスには親のスレッドとファイルがないので作り直す
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+            self._file = None
+            self._writer = threading.Thread(target=self._run, name='event-log-writer', daemon=True)
+            self._writer.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self.errors += 1
+                print(f"イベントログ書き出しエラー: {e}")
+
+    def _segment(self):
+        day = datetime.now().strftime('%Y%m%d')
+        if self._file is not None and (self._segment_day != day or self._file.tell() >= self.segment_bytes):
+            self._close_segment()
+        if self._file is None:
+            # 同じ秒のうちに切り替えても別のファイルになるよう、プロセス内の連番を付ける
+            name = f"events-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.segments:04d}.jsonl"
+            self._file = open(os.path.join(self.directory, name), 'ab')
+            self._segment_day = day
+            self.segments += 1
+        return self._file
+
+    def _close_segment(self):
+        self._file.flush()
+        if self.fsync != 'off':
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+    def flush(self):
+        """積まれているイベントを書き出す"""
+        with self._write_lock:
+            while self._pending:
+                batch = []
+                while self._pending and len(batch) < self.batch_size:
+                    batch.append(self._pending.popleft())
+                data = ''.join(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n' for event in batch)
+                segment = self._segment()
+                segment.write(data.encode('utf-8'))
+                segment.flush()
+                now = time.monotonic()
+                if self.fsync == 'batch' or (self.fsync == 'interval' and now - self._last_fsync >= self.fsync_interval):
+                    os.fsync(segment.fileno())
+                    self._last_fsync = now
+                self.written += len(batch)
+                self.batches += 1
+
+    def stats(self):
+        return {
+            'directory': self.directory,
+            'pending': len(self._pending),
+            'emitted': self.emitted,
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'segments': self.segments,
+            'errors': self.errors,
+            'fsync': self.fsync,
+        }
+
+
+def read_events(directory):
+    """ログのイベントを古いファイルから順に返す（書き込み途中の行は飛ばす）"""
+    names = sorted(name for name in os.listdir(directory) if name.startswith('events-') and name.endswith('.jsonl'))
+    for name in names:
+        with open(os.path.join(directory, name), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def _rates(likes, dislikes):
+    return {
+        key: {
+            'likes': likes[key],
+            'dislikes': dislikes[key],
+            'like_rate': round(likes[key] / (likes[key] + dislikes[key]), 4),
+        }
+        for key in sorted(set(likes) | set(dislikes), key=lambda key: -(likes[key] + dislikes[key]))
+    }
+
+
+def aggregate_like_rates(events):
+    """フィードバックのイベントから気分・食材・生成方法ごとの「いいね」率を集計する"""
+    likes = {'mood': Counter(), 'ingredient': Counter(), 'generation_method': Counter()}
+    dislikes = {'mood': Counter(), 'ingredient': Counter(), 'generation_method': Counter()}
+    recipes = Counter()
+    for event in events:
+        if event.get('type') == 'recipe':
+            recipes[event.get('method')] += 1
+            continue
+        if event.get('type') != 'feedback' or event.get('feedback') not in ('like', 'dislike'):
+            continue
+        counts = likes if event['feedback'] == 'like' else dislikes
+        if event.get('mood'):
+            counts['mood'][event['mood']] += 1
+        if event.get('generation_method'):
+            counts['generation_method'][event['generation_method']] += 1
+        for ingredient in set(event.get('ingredients') or []):
+            counts['ingredient'][ingredient] += 1
+    return {
+        'recipes': dict(recipes),
+        'by_mood': _rates(likes['mood'], dislikes['mood']),
+        'by_ingredient': _rates(likes['ingredient'], dislikes['ingredient']),
+        'by_generation_method': _rates(likes['generation_method'], dislikes['generation_method']),
+    }
+
+
+def create_event_log_from_env():
+    """環境変数の設定からイベントログを作成（EVENT_LOG_ENABLED=false なら None）"""
+    if os.environ.get('EVENT_LOG_ENABLED', 'true').lower() != 'true':
+        return None
+    try:
+        return EventLog(
+            os.environ.get('EVENT_LOG_DIR', os.path.join('instance', 'events')),
+            batch_size=int(os.environ.get('EVENT_LOG_BATCH_SIZE', '256')),
+            flush_interval=float(os.environ.get('EVENT_LOG_FLUSH_INTERVAL', '1')),
+            segment_bytes=int(os.environ.get('EVENT_LOG_SEGMENT_BYTES', str(16 * 1024 * 1024))),
+            fsync=os.environ.get('EVENT_LOG_FSYNC', 'interval').lower(),
+        )
+    except (OSError, ValueError) as e:
+        print(f"イベントログの初期化エラー: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='イベントログから「いいね」率を集計する')
+    parser.add_argument('directory', nargs='?', default=os.path.join('instance', 'events'), help='ログのディレクトリ')
+    parser.add_argument('--json', action='store_true', help='JSONで出力する')
+    args = parser.parse_args()
+
+    report = aggregate_like_rates(read_events(args.directory))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print('生成方法ごとのレシピ数: ' + ', '.join(f'{method}={count}' for method, count in report['recipes'].items()))
+    for title, key in (('気分', 'by_mood'), ('食材', 'by_ingredient'), ('生成方法', 'by_generation_method')):
+        print(f'\n{title:<20}{"いいね":>8}{"よくない":>8}{"いいね率":>8}')
+        for name, row in report[key].items():
+            print(f'{name:<20}{row["likes"]:>8}{row["dislikes"]:>8}{row["like_rate"]:>8.0%}')
+
+
+if __name__ == '__main__':
+    main()
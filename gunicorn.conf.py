@@ -0,0 +1,48 @@
+# gunicorn設定
+# AI生成の待ち時間でワーカーが埋まらないよう、既定ではスレッドワーカー（gthread）で起動する。
+# geventを導入している環境では GUNICORN_WORKER_CLASS=gevent にすると1ワーカーで多数の生成を並行処理できる。
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '100'))  # gevent用
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+
+
+def post_fork(server, worker):
+    """ワーカーの起動直後にGemini SDKの読み込みをバックグラウンドで始める
+
+    SDKはアプリのインポート時には読み込まない（model_loader.py）ので、最初のAIリクエストが
+    読み込みを待たないようにここで先に読み込んでおく。
+    """
+    import threading
+
+    from model_loader import import_sdk
+
+    def run():
+        try:
+            import_sdk()
+        except ImportError as e:
+            worker.log.warning(f"Gemini SDKを読み込めません: {e}")
+
+    threading.Thread(target=run, name='genai-preload', daemon=True).start()
+
+
+def post_worker_init(worker):
+    """アプリの読み込み後にモデルを準備する（/health/ready は準備が終わるまで503）"""
+    import sys
+
+    model = getattr(sys.modules.get('app'), 'model', None)
+    if model is not None and hasattr(model, 'warm_up'):
+        model.warm_up()
+
+
+def child_exit(server, worker):
+    """終了したワーカーのメトリクスをアーカイブに合算する（METRICS_MULTIPROC_DIR を使う場合）"""
+    multiproc_dir = os.environ.get('METRICS_MULTIPROC_DIR')
+    if multiproc_dir:
+        from metrics import mark_process_dead
+
+        mark_process_dead(multiproc_dir, worker.pid)
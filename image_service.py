@@ -0,0 +1,249 @@
+"""レシピに合う料理画像（ローカルのサムネイル）を選ぶ
+
+以前の /api/generate-image は recipe_name と ingredients を見ずに Unsplash の大きな画像の
+URLをランダムに返していたため、料理と関係のない外部の画像を毎回ダウンロードさせていた。
+ここでは事前に縮小しておいたサムネイルの一覧（library.json）から、料理名のキーワード・
+食材・気分が最も合う画像を選ぶ。
+
+- 同じ点数の候補は (料理名, 食材, 気分) のハッシュで選ぶので、同じ料理には常に同じ画像を返す
+  （選んだ結果はプロセス内にもキャッシュする）
+- サムネイルは static_assets.AssetRegistry に登録し、ハッシュ入りのURL（immutable・ETag付き）で
+  自分のオリジンから配信する。幅ごとのURLを srcset で返すのでCDNにもそのままキャッシュできる
+- 一覧がない・合う画像がない場合はプレースホルダー（アイコン）を返す。IMAGE_FALLBACK=sample を
+  指定した場合だけ、一覧がないときに以前の Unsplash のサンプル画像（外部のオリジン）をキーのハッシュで選んで返す
+
+サムネイルの一覧は元の写真と説明のJSONから作る（Pillowが必要）。
+
+    python image_service.py photos.json --source photos/ --output images/ --widths 256,512,768
+
+photos.json の形式:
+
+    [{"name": "oyakodon", "title": "親子丼", "source": "oyakodon.jpg",
+      "keywords": ["親子丼", "丼"], "ingredients": ["rice", "egg", "chicken", "onion"], "moods": ["comfort"]}]
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from catalog import INGREDIENT_INDEX, MOOD_INDEX
+
+DEFAULT_WIDTHS = (256, 512, 768)
+IMAGE_ASSET_PREFIX = 'images/'
+DEFAULT_SIZES = '(max-width: 600px) 100vw, 600px'
+
+# 点数の重み（料理名のキーワードが合うことを最も重視する）
+KEYWORD_WEIGHT = 3.0
+INGREDIENT_WEIGHT = 2.0
+MOOD_WEIGHT = 1.0
+
+# IMAGE_FALLBACK=sample のとき、一覧がなければ返す画像（以前の /api/generate-image のサンプル画像）
+SAMPLE_IMAGE_URLS = (
+    'https://images.unsplash.com/photo-1565299624946-b28f40a0ca4b?w=512&h=512&fit=crop&auto=format&q=80',
+    'https://images.unsplash.com/photo-1567620905732-2d1ec7ab7445?w=512&h=512&fit=crop&auto=format&q=80',
+    'https://images.unsplash.com/photo-1565958011703-44f9829ba187?w=512&h=512&fit=crop&auto=format&q=80',
+    'https://images.unsplash.com/photo-1504674900247-0877df9cc836?w=512&h=512&fit=crop&auto=format&q=80',
+    'https://images.unsplash.com/photo-1516684810915-8c1de8b4bb61?w=512&h=512&fit=crop&auto=format&q=80',
+)
+
+# files は (幅, アセット名) を幅の小さい順に並べたもの
+ImageEntry = namedtuple('ImageEntry', ['name', 'title', 'keywords', 'ingredients', 'moods', 'files'])
+
+# entry は合った画像（プレースホルダーなら None）
+ImageMatch = namedtuple('ImageMatch', ['entry', 'url', 'srcset'])
+
+
+def recipe_image_key(recipe_name, ingredients, mood=None):
+    """画像の選択に使う正規化したキー（食材の順番や重複は区別しない）"""
+    return '|'.join([
+        (recipe_name or '').strip(),
+        ','.join(sorted({str(ingredient) for ingredient in ingredients or []})),
+        mood or '',
+    ])
+
+
+def _tie_breaker(key, name):
+    return hashlib.sha256(f'{key}\0{name}'.encode('utf-8')).digest()
+
+
+def score_image(entry, recipe_name, ingredients, mood):
+    """画像がレシピにどれだけ合うか（0なら合わない）"""
+    score = 0.0
+    if recipe_name and any(keyword in recipe_name for keyword in entry.keywords):
+        score += KEYWORD_WEIGHT
+    if ingredients and entry.ingredients:
+        # 食材の集合のJaccard係数
+        score += INGREDIENT_WEIGHT * len(entry.ingredients & ingredients) / len(entry.ingredients | ingredients)
+    if mood and mood in entry.moods:
+        score += MOOD_WEIGHT
+    return score
+
+
+class ImageLibrary:
+    """サムネイルの一覧と、レシピごとの画像の選択
+
+    assets: 画像を登録する AssetRegistry
+    placeholder: 合う画像がないときに返すアセット名（assets に登録済みのもの）
+    fallback_urls: 一覧が空のときに返す外部の画像のURL（空ならプレースホルダー）
+    """
+
+    def __init__(self, assets, entries=(), placeholder=None, cache_size=4096, fallback_urls=()):
+        self.assets = assets
+        self.entries = tuple(entries)
+        self.placeholder = placeholder
+        self.fallback_urls = tuple(fallback_urls)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.placeholders = 0
+        self.fallbacks = 0
+
+    @classmethod
+    def load(cls, path, assets, placeholder=None, **kwargs):
+        """library.json を読み、サムネイルを assets に登録して作る（ファイルがなければ空の一覧）"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                records = json.load(f)
+        except FileNotFoundError:
+            print(f"画像の一覧がありません{'' if kwargs.get('fallback_urls') else '（プレースホルダーを使います）'}: {path}")
+            return cls(assets, (), placeholder, **kwargs)
+        directory = os.path.dirname(path)
+        entries = []
+        for record in records:
+            files = []
+            for width, filename in sorted((int(width), filename) for width, filename in record['files'].items()):
+                name = IMAGE_ASSET_PREFIX + filename
+                if assets.add_file(name, os.path.join(directory, filename), 'image/jpeg') is not None:
+                    files.append((width, name))
+            if not files:
+                continue
+            entries.append(ImageEntry(
+                record['name'],
+                record.get('title', record['name']),
+                tuple(record.get('keywords', ())),
+                frozenset(i for i in record.get('ingredients', ()) if i in INGREDIENT_INDEX),
+                frozenset(m for m in record.get('moods', ()) if m in MOOD_INDEX),
+                tuple(files),
+            ))
+        return cls(assets, entries, placeholder, **kwargs)
+
+    def lookup(self, recipe_name, ingredients, mood=None):
+        """レシピに合う画像のURLと srcset を返す"""
+        key = recipe_image_key(recipe_name, ingredients, mood)
+        with self._lock:
+            entry = self._cache.get(key, False)
+            if entry is not False:
+                self._cache.move_to_end(key)
+                self.hits += 1
+        if entry is False:
+            self.misses += 1
+            entry = self._choose(key, recipe_name, frozenset(ingredients or ()), mood)
+            with self._lock:
+                self._cache[key] = entry
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        if entry is None and not self.entries and self.fallback_urls:
+            self.fallbacks += 1
+            index = int.from_bytes(_tie_breaker(key, 'fallback')[:4], 'big') % len(self.fallback_urls)
+            return ImageMatch(None, self.fallback_urls[index], '')
+        if entry is None:
+            self.placeholders += 1
+            url = self.assets.url(self.placeholder) if self.placeholder else None
+            return ImageMatch(None, url, '')
+        return ImageMatch(entry, self.url(entry), self.srcset(entry))
+
+    def _choose(self, key, recipe_name, ingredients, mood):
+        best, best_rank = None, None
+        for entry in self.entries:
+            score = score_image(entry, recipe_name, ingredients, mood)
+            if score <= 0:
+                continue
+            # 点数が同じならキーのハッシュで決める（同じ料理には同じ画像）
+            rank = (-score, _tie_breaker(key, entry.name))
+            if best_rank is None or rank < best_rank:
+                best, best_rank = entry, rank
+        return best
+
+    def url(self, entry, width=512):
+        """width 以下で最も大きいサムネイルのURL（なければ最小のもの）"""
+        candidates = [name for file_width, name in entry.files if file_width <= width] or [entry.files[0][1]]
+        return self.assets.url(candidates[-1])
+
+    def srcset(self, entry):
+        return ', '.join(f'{self.assets.url(name)} {width}w' for width, name in entry.files)
+
+    def stats(self):
+        return {
+            'images': len(self.entries),
+            'thumbnails': sum(len(entry.files) for entry in self.entries),
+            'cache_entries': len(self._cache),
+            'cache_hits': self.hits,
+            'cache_misses': self.misses,
+            'placeholders': self.placeholders,
+            'fallbacks': self.fallbacks,
+        }
+
+
+def create_image_library_from_env(assets, root, placeholder=None):
+    """環境変数の設定から画像の一覧を読み込む
+
+    IMAGE_LIBRARY_PATH: 一覧のファイル（既定は images/library.json）
+    IMAGE_FALLBACK: 一覧がないときに返す画像（既定の placeholder: アイコン、sample: Unsplash のサンプル画像）
+    """
+    path = os.environ.get('IMAGE_LIBRARY_PATH', os.path.join(root, 'images', 'library.json'))
+    fallback_urls = SAMPLE_IMAGE_URLS if os.environ.get('IMAGE_FALLBACK', 'placeholder').lower() == 'sample' else ()
+    try:
+        return ImageLibrary.load(path, assets, placeholder, fallback_urls=fallback_urls,
+                                 cache_size=int(os.environ.get('IMAGE_CACHE_SIZE', '4096')))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"画像の一覧の読み込みエラー: {e}")
+        return ImageLibrary(assets, (), placeholder, fallback_urls=fallback_urls)
+
+
+def build_library(photos, source_dir, output_dir, widths=DEFAULT_WIDTHS, quality=82):
+    """元の写真を幅ごとに縮小して output_dir に保存し、library.json を書き出す（戻り値: 画像数）"""
+    from PIL import Image  # 任意依存（一覧を作るときだけ必要）
+
+    os.makedirs(output_dir, exist_ok=True)
+    records = []
+    for photo in photos:
+        with Image.open(os.path.join(source_dir, photo['source'])) as image:
+            image = image.convert('RGB')
+            files = {}
+            for width in sorted(widths):
+                if width > image.width and files:
+                    break  # 元の写真より大きくはしない
+                resized = image.copy()
+                resized.thumbnail((width, width * image.height // image.width), Image.LANCZOS)
+                filename = f"{photo['name']}-{width}.jpg"
+                resized.save(os.path.join(output_dir, filename), 'JPEG', quality=quality, optimize=True, progressive=True)
+                files[str(width)] = filename
+        record = {key: photo[key] for key in ('name', 'title', 'keywords', 'ingredients', 'moods') if key in photo}
+        record['files'] = files
+        records.append(record)
+    with open(os.path.join(output_dir, 'library.json'), 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False, indent=2)
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='料理の写真からサムネイルの一覧（library.json）を作る')
+    parser.add_argument('photos', help='写真の説明のJSON')
+    parser.add_argument('--source', default='.', help='元の写真のディレクトリ')
+    parser.add_argument('--output', default='images', help='サムネイルと library.json の出力先')
+    parser.add_argument('--widths', default=','.join(map(str, DEFAULT_WIDTHS)), help='作る幅（カンマ区切り）')
+    parser.add_argument('--quality', type=int, default=82, help='JPEGの品質')
+    args = parser.parse_args()
+
+    with open(args.photos, encoding='utf-8') as f:
+        photos = json.load(f)
+    count = build_library(photos, args.source, args.output, [int(w) for w in args.widths.split(',')], args.quality)
+    print(f"{count} 件の画像を {args.output} に書き出しました")
+
+
+if __name__ == '__main__':
+    main()
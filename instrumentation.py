@@ -0,0 +1,107 @@
+"""アプリのホットパス計測
+
+ルートごとのレイテンシ、Gemini呼び出しの所要時間・エラー、プロンプト/応答サイズ、
+レシピの返却方法（AI・キャッシュ・類似キャッシュ・ルールベース・フォールバック）を記録し、
+/metrics で Prometheus 形式で返す。
+"""
+import time
+
+from flask import Response, g, request
+
+from metrics import create_registry_from_env
+
+SIZE_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000)
+
+registry = create_registry_from_env()
+
+REQUEST_DURATION = registry.histogram(
+    'recipe_http_request_duration_seconds',
+    'ルートごとのリクエスト処理時間（ストリーミングはヘッダー送信まで）',
+    ('route', 'method', 'status'),
+)
+GEMINI_CALLS = registry.counter(
+    'recipe_gemini_calls_total',
+    'Gemini呼び出しの回数（結果別）',
+    ('kind', 'outcome'),
+)
+GEMINI_CALL_DURATION = registry.histogram(
+    'recipe_gemini_call_duration_seconds',
+    'Gemini呼び出しの所要時間',
+    ('kind', 'outcome'),
+)
+PROMPT_CHARS = registry.histogram(
+    'recipe_gemini_prompt_chars',
+    'Geminiに送ったプロンプトの文字数',
+    ('kind',),
+    buckets=SIZE_BUCKETS,
+)
+RESPONSE_CHARS = registry.histogram(
+    'recipe_gemini_response_chars',
+    'Geminiから受け取った応答の文字数',
+    ('kind',),
+    buckets=SIZE_BUCKETS,
+)
+RECIPE_RESPONSES = registry.counter(
+    'recipe_responses_total',
+    'レシピの返却方法ごとの件数（ai_generated / cached / similar / rule_based / fallback）',
+    ('endpoint', 'method'),
+)
+CHEF_CONTEXT_TOKENS = registry.histogram(
+    'recipe_chef_context_tokens',
+    'AI Chefのプロンプトに入れた会話履歴のトークン数の見積もり（compacted: 圧縮後 / original: 従来方式）',
+    ('kind',),
+    buckets=TOKEN_BUCKETS,
+)
+CHEF_CONTEXT_TOKENS_SAVED = registry.counter(
+    'recipe_chef_context_tokens_saved_total',
+    '会話履歴の圧縮で削減したトークン数の見積もり',
+)
+
+
+def observe_llm_call(kind, outcome, seconds, prompt_chars, response_chars):
+    """LLMClient の observer として使う"""
+    GEMINI_CALLS.inc(kind, outcome)
+    if outcome == 'overloaded':
+        return
+    GEMINI_CALL_DURATION.observe(seconds, kind, outcome)
+    PROMPT_CHARS.observe(prompt_chars, kind)
+    if outcome == 'ok':
+        RESPONSE_CHARS.observe(response_chars, kind)
+
+
+def observe_chef_context(original_tokens, tokens):
+    """AI Chefの会話履歴を圧縮した結果を記録"""
+    CHEF_CONTEXT_TOKENS.observe(tokens, 'compacted')
+    CHEF_CONTEXT_TOKENS.observe(original_tokens, 'original')
+    if original_tokens > tokens:
+        CHEF_CONTEXT_TOKENS_SAVED.inc(amount=original_tokens - tokens)
+
+
+def record_recipe_response(endpoint, method):
+    """レシピをどの方法で返したかを記録"""
+    RECIPE_RESPONSES.inc(endpoint, method)
+
+
+def init_app(app):
+    """リクエストごとの計測と /metrics エンドポイントを登録"""
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started_at = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('request_started_at', None)
+        if started is not None:
+            # ラベルの種類が増えすぎないよう、URLではなくルートのパターンを使う
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            REQUEST_DURATION.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    registry.start_flusher()
+    return registry
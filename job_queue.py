@@ -0,0 +1,295 @@
+"""AI生成のバックグラウンドジョブ
+
+AI生成を待つ間、HTTP接続とgunicornのワーカーが塞がり、クライアントが切断しても
+生成は最後まで行われていた。/api/recipes に async=true を付けると、ここのキューに積んで
+すぐにジョブIDを返し、結果は /api/jobs/<id> をポーリングして受け取る。
+
+- キューはSQLite（WAL）に保存し、全ワーカープロセスで共有する（再起動しても消えない）
+- レーン: chat（対話的なリクエスト、優先）と bulk（まとめて生成するクライアント向け）
+- 同じ条件（dedup_key）のジョブが待機中・実行中・結果の保持期間内なら、新しく積まずに既存のIDを返す
+- abandon_after 秒以上ポーリングされていない待機中のジョブは実行せずに取り消す
+- 実行中のままリース期間を過ぎたジョブ（プロセスが落ちた場合など）は待機中に戻す
+
+結果の受け取りはポーリングのみ（任意のURLへのWebhook送信はSSRFの危険があるため行わない）。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+LANES = {'chat': 0, 'bulk': 1}  # レーン → 優先度（小さいほど先に実行）
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class JobQueue:
+    """SQLiteに保存するジョブキュー"""
+
+    def __init__(self, path, abandon_after=30.0, lease_timeout=120.0, result_ttl=3600.0):
+        self.path = path
+        self.abandon_after = abandon_after
+        self.lease_timeout = lease_timeout
+        self.result_ttl = result_ttl
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self.enqueued = 0
+        self.deduplicated = 0
+        self.abandoned = 0
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id TEXT PRIMARY KEY,'
+            ' kind TEXT NOT NULL,'
+            ' dedup_key TEXT,'
+            ' lane TEXT NOT NULL,'
+            ' priority INTEGER NOT NULL,'
+            ' status TEXT NOT NULL,'
+            ' payload TEXT NOT NULL,'
+            ' result TEXT,'
+            ' error TEXT,'
+            ' created_at REAL NOT NULL,'
+            ' started_at REAL,'
+            ' finished_at REAL,'
+            ' polled_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (status, priority, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key)')
+
+    def _connect(self):
+        # sqlite3の接続はスレッド間で共有できないためスレッドごとに持つ
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind, payload, lane='chat', dedup_key=None):
+        """ジョブを積む（戻り値: (ジョブID, 既存のジョブを使ったか)）"""
+        if lane not in LANES:
+            raise ValueError(f'lane は {tuple(LANES)} のいずれかで指定してください')
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if dedup_key is not None:
+                row = conn.execute(
+                    'SELECT id FROM jobs WHERE dedup_key = ? AND kind = ?'
+                    ' AND (status IN (?, ?) OR (status = ? AND finished_at > ?))'
+                    ' ORDER BY created_at DESC LIMIT 1',
+                    (dedup_key, kind, QUEUED, RUNNING, DONE, now - self.result_ttl)
+                ).fetchone()
+                if row is not None:
+                    conn.execute('UPDATE jobs SET polled_at = ? WHERE id = ?', (now, row[0]))
+                    conn.execute('COMMIT')
+                    self.deduplicated += 1
+                    return row[0], True
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                'INSERT INTO jobs (id, kind, dedup_key, lane, priority, status, payload, created_at, polled_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, dedup_key, lane, LANES[lane], QUEUED,
+                 json.dumps(payload, ensure_ascii=False), now, now)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self.enqueued += 1
+        self._wakeup.set()
+        return job_id, False
+
+    def claim(self):
+        """最も優先度の高い待機中のジョブを実行中にして (ID, 種類, 内容) を返す（なければ None）"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # ポーリングされなくなったジョブは取り消し、リースが切れたジョブは待機中に戻す
+            abandoned = conn.execute(
+                'UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE status = ? AND polled_at < ?',
+                (CANCELLED, now, '結果の確認がないため取り消しました', QUEUED, now - self.abandon_after)
+            ).rowcount
+            conn.execute(
+                'UPDATE jobs SET status = ?, started_at = NULL WHERE status = ? AND started_at < ?',
+                (QUEUED, RUNNING, now - self.lease_timeout)
+            )
+            row = conn.execute(
+                'SELECT id, kind, payload FROM jobs WHERE status = ? ORDER BY priority, created_at LIMIT 1',
+                (QUEUED,)
+            ).fetchone()
+            if row is not None:
+                conn.execute('UPDATE jobs SET status = ?, started_at = ? WHERE id = ?', (RUNNING, now, row[0]))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self.abandoned += abandoned
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def finish(self, job_id, result=None, error=None):
+        """実行結果を保存する（実行中に取り消されたジョブは更新しない）"""
+        self._connect().execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND status = ?',
+            (FAILED if error is not None else DONE,
+             json.dumps(result, ensure_ascii=False) if result is not None else None,
+             error, time.time(), job_id, RUNNING)
+        )
+
+    def get(self, job_id, touch=True):
+        """ジョブの状態と結果を返す（ポーリングとして記録する）。なければ None"""
+        conn = self._connect()
+        if touch:
+            conn.execute('UPDATE jobs SET polled_at = ? WHERE id = ?', (time.time(), job_id))
+        row = conn.execute(
+            'SELECT id, kind, lane, status, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ?',
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job_id, kind, lane, status, result, error, created_at, started_at, finished_at = row
+        job = {'job_id': job_id, 'kind': kind, 'lane': lane, 'status': status, 'created_at': created_at}
+        if status == QUEUED:
+            job['position'] = conn.execute(
+                'SELECT COUNT(*) FROM jobs WHERE status = ? AND (priority, created_at) <'
+                ' (SELECT priority, created_at FROM jobs WHERE id = ?)',
+                (QUEUED, job_id)
+            ).fetchone()[0]
+        if started_at is not None:
+            job['started_at'] = started_at
+        if finished_at is not None:
+            job['finished_at'] = finished_at
+        if result is not None:
+            job['result'] = json.loads(result)
+        if error is not None:
+            job['error'] = error
+        return job
+
+    def cancel(self, job_id):
+        """待機中・実行中のジョブを取り消す（取り消せたら True）"""
+        return self._connect().execute(
+            'UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ? AND status IN (?, ?)',
+            (CANCELLED, time.time(), '取り消されました', job_id, QUEUED, RUNNING)
+        ).rowcount > 0
+
+    def purge(self):
+        """保持期間を過ぎた終了済みのジョブを削除する"""
+        return self._connect().execute(
+            'DELETE FROM jobs WHERE status IN (?, ?, ?) AND finished_at < ?',
+            (DONE, FAILED, CANCELLED, time.time() - self.result_ttl)
+        ).rowcount
+
+    def wait(self, timeout):
+        """同じプロセスで積まれるか timeout 秒経つまで待つ"""
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def stats(self):
+        counts = dict(self._connect().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        return {
+            'jobs': counts,
+            'enqueued': self.enqueued,
+            'deduplicated': self.deduplicated,
+            'abandoned': self.abandoned,
+        }
+
+
+class JobWorkerPool:
+    """キューからジョブを取り出して実行するスレッド（ワーカープロセスごと）
+
+    handlers は {ジョブの種類: handler(payload) → 結果の辞書}。
+    """
+
+    def __init__(self, queue, handlers, workers=2, poll_interval=0.5, purge_interval=300.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.purge_interval = purge_interval
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        """スレッドを開始（fork後の子プロセスでは作り直す）"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                job = self.queue.claim()
+            except sqlite3.Error as e:
+                print(f"ジョブの取り出しエラー: {e}")
+                job = None
+            if job is None:
+                self._maybe_purge()
+                self.queue.wait(self.poll_interval)
+                continue
+            self._execute(*job)
+
+    def _execute(self, job_id, kind, payload):
+        handler = self.handlers.get(kind)
+        try:
+            if handler is None:
+                raise ValueError(f'未知のジョブの種類です: {kind}')
+            result = handler(payload)
+        except Exception as e:
+            self.failed += 1
+            print(f"ジョブ実行エラー: {e}")
+            self.queue.finish(job_id, error=str(e))
+            return
+        self.completed += 1
+        self.queue.finish(job_id, result=result)
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_interval
+        try:
+            self.queue.purge()
+        except sqlite3.Error as e:
+            print(f"ジョブの削除エラー: {e}")
+
+    def stats(self):
+        return {'workers': self.workers, 'completed': self.completed, 'failed': self.failed}
+
+
+def create_job_queue_from_env():
+    """環境変数の設定からジョブキューを作成（JOB_QUEUE_ENABLED=false なら None）"""
+    if os.environ.get('JOB_QUEUE_ENABLED', 'true').lower() != 'true':
+        return None
+    try:
+        return JobQueue(
+            os.environ.get('JOB_QUEUE_PATH', os.path.join('instance', 'jobs.sqlite3')),
+            abandon_after=float(os.environ.get('JOB_ABANDON_AFTER', '30')),
+            lease_timeout=float(os.environ.get('JOB_LEASE_TIMEOUT', '120')),
+            result_ttl=float(os.environ.get('JOB_RESULT_TTL', '3600')),
+        )
+    except (OSError, sqlite3.Error) as e:
+        print(f"ジョブキューの初期化エラー: {e}")
+        return None
@@ -0,0 +1,268 @@
+"""Geminiモデル呼び出し用クライアント
+
+モジュールレベルの `model` をラップし、以下を提供する。
+
+- 呼び出しごとの締め切り（タイムアウト）
+- 同時実行数の上限（超えた分は待たずに LLMOverloadedError）
+- ストリーミング生成（断片ごとに締め切りを確認）
+- サーキットブレーカー・リトライ・ヘッジ（resilience.py、渡した場合のみ）
+
+上流の呼び出しは専用のスレッドプールで実行するため、締め切りを過ぎた時点で
+リクエスト処理側はすぐに戻れる。gunicornを gthread / gevent ワーカーで動かせば
+1ワーカーで複数の生成を同時に処理できる（geventのモンキーパッチ下では
+threading のロックやキューはグリーンレット対応のものに置き換わる）。
+"""
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+
+class LLMError(Exception):
+    """LLMクライアントのエラーの基底クラス"""
+
+
+class LLMUnavailableError(LLMError):
+    """モデルが設定されていない"""
+
+
+class LLMOverloadedError(LLMError):
+    """同時実行数の上限に達している"""
+
+
+class LLMTimeoutError(LLMError):
+    """締め切りまでに応答がなかった"""
+
+
+class LLMCircuitOpenError(LLMError):
+    """上流の失敗が続いているため呼び出しを止めている"""
+
+
+_STREAM_END = object()
+
+
+class LLMClient:
+    """同時実行数と締め切りを管理するGeminiクライアント"""
+
+    def __init__(self, model, max_concurrency=8, timeout=20.0, acquire_timeout=0.05, observer=None,
+                 breaker=None, retry=None, hedge=None):
+        self.model = model
+        # observer(kind, outcome, seconds, prompt_chars, response_chars) で呼び出し結果を通知
+        self.observer = observer
+        self.breaker = breaker
+        self.retry = retry
+        self.hedge = hedge
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm')
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.retries = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @property
+    def available(self):
+        return self.model is not None
+
+    @property
+    def circuit_open(self):
+        """サーキットブレーカーにより上流の呼び出しを止めているか"""
+        return self.breaker is not None and self.breaker.state == self.breaker.OPEN
+
+    def _acquire(self):
+        """実行枠を確保して、呼び出しを始めた時刻を返す。空きがなければ待たずにエラーにする"""
+        if self.model is None:
+            raise LLMUnavailableError('AIモデルが設定されていません')
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self.rejected += 1
+            self._observe('call', 'overloaded', 0.0, 0, 0)
+            raise LLMOverloadedError('AI生成の同時実行数が上限に達しています')
+        if self.breaker is not None and not self.breaker.allow():
+            self._slots.release()
+            self._observe('call', 'circuit_open', 0.0, 0, 0)
+            raise LLMCircuitOpenError('AIの呼び出しが続けて失敗しているため、一時的に停止しています')
+        with self._lock:
+            self.in_flight += 1
+            self.calls += 1
+        return time.monotonic()
+
+    def _try_acquire(self):
+        """ヘッジ用に実行枠を確保する（空きがなければ False、エラーにはしない）
+
+        ヘッジはブレーカーが closed の間だけ送る。open なら上流を呼ばない約束を守り、
+        half_open なら試行の枠（half_open_max_calls）を超えて送らないようにする。
+        """
+        if self.breaker is not None and self.breaker.state != self.breaker.CLOSED:
+            return False
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self.in_flight += 1
+            self.calls += 1
+        return True
+
+    def _release(self, *_):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _record(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _observe(self, kind, outcome, seconds, prompt_chars, response_chars):
+        if self.observer is not None:
+            try:
+                self.observer(kind, outcome, seconds, prompt_chars, response_chars)
+            except Exception as e:
+                print(f"LLM呼び出しの記録エラー: {e}")
+
+    def _call(self, prompt, **kwargs):
+        return self.model.generate_content(prompt, **kwargs).text.strip()
+
+    def _record_outcome(self, ok, started_at):
+        if self.breaker is not None:
+            if ok:
+                self.breaker.record_success(started_at)
+            else:
+                self.breaker.record_failure(started_at)
+
+    def _submit(self, prompt):
+        try:
+            future = self._executor.submit(self._call, prompt)
+        except Exception:
+            self._release()
+            raise
+        # 締め切りを過ぎても上流の呼び出し自体は続くので、実行枠は完了時に返す
+        future.add_done_callback(self._release)
+        return future
+
+    def _wait_first(self, prompt, deadline):
+        """1回分の呼び出し。ヘッジが有効なら遅い場合にもう1本送り、先に成功した方を返す"""
+        futures = [self._submit(prompt)]
+        hedge_delay = self.hedge.delay() if self.hedge is not None else None
+        if hedge_delay is not None and hedge_delay < deadline - time.monotonic():
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done and self._try_acquire():
+                futures.append(self._submit(prompt))
+                self._record('hedged')
+
+        error = None
+        pending = futures
+        while pending:
+            done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                raise FutureTimeoutError()
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self._record('hedge_wins')
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def generate(self, prompt, timeout=None):
+        """プロンプトからテキストを生成する（締め切り付き、失敗時は締め切りの範囲内で再試行）"""
+        budget = timeout or self.timeout
+        deadline = time.monotonic() + budget
+        attempt = 0
+        while True:
+            attempt += 1
+            acquired_at = self._acquire()
+            started = time.perf_counter()
+            try:
+                text = self._wait_first(prompt, deadline)
+            except FutureTimeoutError:
+                self._record('timeouts')
+                self._record_outcome(False, acquired_at)
+                self._observe('generate', 'timeout', time.perf_counter() - started, len(prompt), 0)
+                raise LLMTimeoutError(f'AIの応答が{budget}秒以内に返りませんでした')
+            except Exception:
+                self._record('errors')
+                self._record_outcome(False, acquired_at)
+                self._observe('generate', 'error', time.perf_counter() - started, len(prompt), 0)
+                delay = self.retry.delay(attempt, deadline - time.monotonic()) if self.retry is not None else None
+                if delay is None:
+                    raise
+                self._record('retries')
+                time.sleep(delay)
+                continue
+            elapsed = time.perf_counter() - started
+            self._record_outcome(True, acquired_at)
+            if self.hedge is not None:
+                self.hedge.record(elapsed)
+            self._observe('generate', 'ok', elapsed, len(prompt), len(text))
+            return text
+
+    def stream(self, prompt, timeout=None):
+        """ストリーミング生成でテキスト断片を順に返す（全体に締め切り付き）"""
+        acquired_at = self._acquire()
+        deadline = time.monotonic() + (timeout or self.timeout)
+        chunks = queue.Queue()
+
+        def produce():
+            try:
+                for chunk in self.model.generate_content(prompt, stream=True):
+                    text = chunk.text
+                    if text:
+                        chunks.put(text)
+                chunks.put(_STREAM_END)
+            except Exception as e:
+                chunks.put(e)
+
+        try:
+            future = self._executor.submit(produce)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+
+        started = time.perf_counter()
+        received = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                item = chunks.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                self._record('timeouts')
+                self._record_outcome(False, acquired_at)
+                self._observe('stream', 'timeout', time.perf_counter() - started, len(prompt), received)
+                raise LLMTimeoutError(f'AIの応答が{timeout or self.timeout}秒以内に完了しませんでした')
+            if item is _STREAM_END:
+                self._record_outcome(True, acquired_at)
+                self._observe('stream', 'ok', time.perf_counter() - started, len(prompt), received)
+                return
+            if isinstance(item, Exception):
+                self._record('errors')
+                self._record_outcome(False, acquired_at)
+                self._observe('stream', 'error', time.perf_counter() - started, len(prompt), received)
+                raise item
+            received += len(item)
+            yield item
+
+    def stats(self):
+        """/api/stats 用の統計情報"""
+        return {
+            'available': self.available,
+            'max_concurrency': self.max_concurrency,
+            'timeout_seconds': self.timeout,
+            'in_flight': self.in_flight,
+            'calls': self.calls,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'retries': self.retries,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'circuit_breaker': self.breaker.stats() if self.breaker is not None else None,
+            'hedge': self.hedge.stats() if self.hedge is not None else None,
+        }
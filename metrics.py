@@ -0,0 +1,311 @@
+"""プロセス内メトリクスと Prometheus 形式での出力
+
+カウンタとヒストグラムはラベルの組ごとに辞書で持ち、記録は辞書の更新だけで済む。
+gunicornの複数ワーカーで動かす場合は METRICS_MULTIPROC_DIR を設定すると、
+各ワーカーが定期的に自分の値をディレクトリ内のファイルに書き出し、
+/metrics を受けたワーカーが全ファイルを合算して返す。
+ファイル名はPIDとプロセスごとのトークンで決めるので、PIDが再利用されても前のワーカーの値を上書きしない。
+終了したワーカーのファイルは gunicorn の child_exit で mark_process_dead() を呼んで
+1つのアーカイブに合算してから消す（カウンタは巻き戻らず、ファイルも増え続けない）。
+"""
+import atexit
+import bisect
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 終了したワーカーの値をまとめておくファイル（metrics-*.json に含まれるので通常どおり合算される）
+ARCHIVE_NAME = 'metrics-archive.json'
+_LOCK_NAME = '.metrics.lock'
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+class _DirectoryLock:
+    """アーカイブへの合算と /metrics の読み取りを排他する（読み手どうしは同時に読める）"""
+
+    def __init__(self, directory, exclusive):
+        self.path = os.path.join(directory, _LOCK_NAME)
+        self.operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        fcntl.flock(self.file, self.operation)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def _merge_snapshots(snapshots):
+    """複数プロセスのスナップショットを、ラベルの組ごとに足し合わせる"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, data in snapshot.items():
+            target = merged.setdefault(name, {
+                'type': data['type'],
+                'buckets': data.get('buckets'),
+                'help': data.get('help'),
+                'label_names': data.get('label_names'),
+                'values': {},
+            })
+            for labels, value in data['values']:
+                key = tuple(labels)
+                if data['type'] == 'histogram':
+                    current = target['values'].get(key)
+                    if current is None:
+                        target['values'][key] = [list(value[0]), value[1], value[2]]
+                    else:
+                        current[0] = [a + b for a, b in zip(current[0], value[0])]
+                        current[1] += value[1]
+                        current[2] += value[2]
+                else:
+                    target['values'][key] = target['values'].get(key, 0) + value
+    return merged
+
+
+def _read_snapshot(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(path, snapshot):
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def mark_process_dead(multiproc_dir, pid):
+    """終了したワーカーのファイルをアーカイブに合算して消す（gunicorn の child_exit から呼ぶ）"""
+    os.makedirs(multiproc_dir, exist_ok=True)
+    with _DirectoryLock(multiproc_dir, exclusive=True):
+        paths = glob.glob(os.path.join(multiproc_dir, f'metrics-{pid}-*.json'))
+        if not paths:
+            return
+        archive_path = os.path.join(multiproc_dir, ARCHIVE_NAME)
+        snapshots = [_read_snapshot(path) for path in [archive_path] + paths]
+        merged = _merge_snapshots([snapshot for snapshot in snapshots if snapshot])
+        archive = {}
+        for name, data in merged.items():
+            entry = {key: data[key] for key in ('type', 'buckets', 'help', 'label_names') if data[key] is not None}
+            entry['values'] = [[list(labels), value] for labels, value in data['values'].items()]
+            archive[name] = entry
+        _write_snapshot(archive_path, archive)
+        for path in paths:
+            os.remove(path)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """単調増加するカウンタ"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {'type': self.type, 'values': [[list(k), v] for k, v in self._values.items()]}
+
+
+class Histogram:
+    """バケットごとの件数・合計・件数を持つヒストグラム"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                # バケットごとの件数（最後は +Inf）、合計、件数
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'type': self.type,
+                'buckets': list(self.buckets),
+                'values': [[list(k), [list(v[0]), v[1], v[2]]] for k, v in self._values.items()],
+            }
+
+
+class MetricsRegistry:
+    """メトリクスの登録・書き出し・合算を行う"""
+
+    def __init__(self, multiproc_dir=None, flush_interval=5.0):
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._collectors = []
+        self._live_collectors = []
+        self._flusher = None
+        self._file_pid = None
+        self._file_name = None
+
+    def counter(self, name, documentation, label_names=()):
+        return self._metrics.setdefault(name, Counter(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, documentation, label_names, buckets))
+
+    def register_collector(self, collect):
+        """プロセスごとの累積値を返す関数を登録（ワーカー間で合算される）
+
+        collect() は (名前, 説明, {ラベル: 値}, 値) のリストを返す。値はカウンタとして扱う。
+        """
+        self._collectors.append(collect)
+
+    def register_live_collector(self, collect):
+        """出力時にその場で計算する値を登録（共有ストアの残量などのゲージ、合算しない）"""
+        self._live_collectors.append(collect)
+
+    def _snapshot(self):
+        snapshot = {name: metric.snapshot() for name, metric in self._metrics.items()}
+        for collect in self._collectors:
+            try:
+                samples = collect()
+            except Exception as e:
+                print(f"メトリクス収集エラー: {e}")
+                continue
+            for name, documentation, labels, value in samples:
+                entry = snapshot.setdefault(name, {'type': 'counter', 'help': documentation, 'values': []})
+                entry['label_names'] = list(labels.keys())
+                entry['values'].append([list(labels.values()), value])
+        return snapshot
+
+    def flush(self):
+        """このプロセスの値をディレクトリに書き出す"""
+        if not self.multiproc_dir:
+            return
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        pid = os.getpid()
+        if self._file_pid != pid:
+            # fork 後のプロセスでは別の名前にする（PIDが再利用されても過去のファイルと重ならない）
+            self._file_pid = pid
+            self._file_name = f'metrics-{pid}-{uuid.uuid4().hex[:8]}.json'
+        _write_snapshot(os.path.join(self.multiproc_dir, self._file_name), self._snapshot())
+
+    def start_flusher(self):
+        """定期的に書き出すバックグラウンドスレッドを開始（ワーカーごとに1つ）"""
+        if not self.multiproc_dir or (self._flusher and self._flusher.is_alive()):
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"メトリクス書き出しエラー: {e}")
+
+        self._flusher = threading.Thread(target=loop, name='metrics-flusher', daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def _merged_snapshots(self):
+        if not self.multiproc_dir:
+            return [self._snapshot()]
+        self.flush()
+        # アーカイブへの合算中に読むと、同じワーカーの値を二重に数えたり取りこぼしたりする
+        with _DirectoryLock(self.multiproc_dir, exclusive=False):
+            paths = glob.glob(os.path.join(self.multiproc_dir, 'metrics-*.json'))
+            snapshots = [_read_snapshot(path) for path in paths]
+        return [snapshot for snapshot in snapshots if snapshot is not None]
+
+    def render(self):
+        """Prometheusのテキスト形式で出力"""
+        merged = _merge_snapshots(self._merged_snapshots())
+
+        lines = []
+        for name in sorted(merged):
+            data = merged[name]
+            metric = self._metrics.get(name)
+            documentation = metric.documentation if metric else (data.get('help') or name)
+            label_names = metric.label_names if metric else tuple(data.get('label_names') or ())
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {data["type"]}')
+            for labels, value in sorted(data['values'].items()):
+                if data['type'] == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(list(data['buckets']) + [float('inf')], value[0]):
+                        cumulative += count
+                        le = _format_value(float(bound))
+                        lines.append(f'{name}_bucket{_format_labels(label_names, labels, ("le", le))} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(label_names, labels)} {_format_value(value[1])}')
+                    lines.append(f'{name}_count{_format_labels(label_names, labels)} {value[2]}')
+                else:
+                    lines.append(f'{name}{_format_labels(label_names, labels)} {_format_value(value)}')
+
+        seen = set()
+        for collect in self._live_collectors:
+            try:
+                samples = collect()
+            except Exception as e:
+                print(f"メトリクス収集エラー: {e}")
+                continue
+            for name, documentation, labels, value in samples:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f'# HELP {name} {documentation}')
+                    lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name}{_format_labels(tuple(labels.keys()), tuple(labels.values()))} {_format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def create_registry_from_env():
+    """環境変数の設定からレジストリを作成"""
+    return MetricsRegistry(
+        multiproc_dir=os.environ.get('METRICS_MULTIPROC_DIR') or None,
+        flush_interval=float(os.environ.get('METRICS_FLUSH_INTERVAL', '5')),
+    )
@@ -0,0 +1,84 @@
+"""Gemini SDK（google.generativeai）の遅延読み込み
+
+google.generativeai の読み込みはgRPCやprotobufを含めて重く、これまではアプリの
+インポート時に毎回行っていたため、静的ファイルやルールベースのレシピしか返さない
+ワーカーでも起動が遅かった。LazyGenerativeModel は GenerativeModel と同じ呼び出し方ができ、
+最初に生成するとき（または warm_up を呼んだとき）に初めてSDKを読み込む。
+
+gunicorn では post_fork でSDKの読み込みをバックグラウンドで始め（gunicorn.conf.py）、
+/health/ready は読み込みが終わるまで 503 を返す。
+"""
+import threading
+import time
+
+SDK_MODULE = 'google.generativeai'
+
+
+def import_sdk():
+    """SDKを読み込む（2回目以降は sys.modules から返るので速い）"""
+    import google.generativeai as genai
+    return genai
+
+
+class LazyGenerativeModel:
+    """初めて使うときにSDKを読み込んで genai.GenerativeModel を作る"""
+
+    def __init__(self, api_key, model_name='gemini-1.5-flash'):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+        # 読み込み中は _lock を持ったままなので、warm_up（/health/ready から呼ぶ）は別のロックで待たずに返す
+        self._warm_up_lock = threading.Lock()
+        self._warm_up_thread = None
+        self.load_seconds = None
+        self.error = None
+
+    @property
+    def ready(self):
+        return self._model is not None
+
+    def load(self):
+        """SDKを読み込んでモデルを作る（スレッドセーフ、作成済みならそれを返す）"""
+        if self._model is not None:
+            return self._model
+        with self._lock:
+            if self._model is None:
+                started = time.perf_counter()
+                try:
+                    genai = import_sdk()
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+                except Exception as e:
+                    self.error = f'{type(e).__name__}: {e}'
+                    raise
+                self.error = None
+                self.load_seconds = time.perf_counter() - started
+                print(f"Gemini SDKを読み込みました（{self.load_seconds:.2f}秒）")
+        return self._model
+
+    def warm_up(self):
+        """バックグラウンドで読み込みを始める（開始済みなら何もしない）"""
+        with self._warm_up_lock:
+            if self._model is not None or (self._warm_up_thread and self._warm_up_thread.is_alive()):
+                return
+
+            def run():
+                try:
+                    self.load()
+                except Exception as e:
+                    print(f"Gemini SDKの読み込みエラー: {e}")
+
+            self._warm_up_thread = threading.Thread(target=run, name='genai-warm-up', daemon=True)
+            self._warm_up_thread.start()
+
+    def generate_content(self, *args, **kwargs):
+        return self.load().generate_content(*args, **kwargs)
+
+    def stats(self):
+        return {
+            'model': self.model_name,
+            'loaded': self.ready,
+            'load_seconds': round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            'error': self.error,
+        }
@@ -0,0 +1,232 @@
+"""人気の組み合わせのAIレシピを事前生成する
+
+利用は一部の気分・食材の組み合わせに偏るので、それらをオフラインでまとめて生成しておき、
+アプリは起動時に読み込んだ参照ファイルから返す（ピーク時でもAPIを呼ばない）。
+
+    flask --app app precompute --from-history instance/sessions.sqlite3 --top 200
+    flask --app app precompute --combinations combos.txt --rate 0.5
+
+- 組み合わせはセッション履歴（SQLiteのセッションストア）から集計するか、ファイルで指定する
+- 生成は1件ずつ、指定した間隔をあけて行う
+- 生成済みの分はチェックポイント（JSON Lines）に追記し、途中で止めても続きから再開できる
+- 最後にチェックポイントの内容から参照ファイルを作る
+
+参照ファイルは読み取り専用で、アプリはメモリマップして二分探索する。
+キーはキャッシュと同じ make_cache_key（要望・好みが空の場合）のハッシュ値。
+
+    マジック(8) 件数(4) 予約(4)
+    レコード × 件数（キー16バイト・本文の位置8バイト・長さ4バイト・予約4バイト、キー順）
+    本文（RecipeSerializer で直列化したレシピ）
+"""
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import time
+from collections import Counter
+
+from recipe_cache import make_cache_key
+
+MAGIC = b'RCPPRE01'
+_HEADER = struct.Struct('<8sII')
+_RECORD = struct.Struct('<16sQII')
+_KEY_SIZE = 16
+
+
+def lookup_key(cache_key):
+    """キャッシュキー（sha256の16進文字列）を参照ファイルのキー（先頭16バイト）にする"""
+    return bytes.fromhex(cache_key)[:_KEY_SIZE]
+
+
+def parse_combination(line):
+    """「happy: rice, egg」形式の1行を (気分, 食材) にする"""
+    mood, _, ingredients = line.partition(':')
+    return mood.strip(), [ingredient.strip() for ingredient in ingredients.split(',') if ingredient.strip()]
+
+
+def read_combinations(path):
+    """組み合わせのファイルを読む（JSONの配列か、1行1件の「気分: 食材, 食材」形式）"""
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+    if content.lstrip().startswith('['):
+        return [(item['mood'], list(item['ingredients'])) for item in json.loads(content)]
+    return [
+        parse_combination(line)
+        for line in content.splitlines()
+        if line.strip() and not line.lstrip().startswith('#')
+    ]
+
+
+def mine_session_history(path, top=100):
+    """セッションストアのレシピ履歴から、よく使われる組み合わせを多い順に返す"""
+    counts = Counter()
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        for (data,) in conn.execute('SELECT data FROM sessions'):
+            try:
+                history = json.loads(data).get('recipe_history') or []
+            except ValueError:
+                continue
+            for entry in history:
+                if isinstance(entry, dict) and entry.get('mood') and entry.get('ingredients'):
+                    counts[(entry['mood'], tuple(sorted(entry['ingredients'])))] += 1
+    finally:
+        conn.close()
+    return [(mood, list(ingredients)) for (mood, ingredients), _ in counts.most_common(top)]
+
+
+def load_checkpoint(path):
+    """チェックポイントから生成済みの {キャッシュキー: 記録} を読む"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 書き込み途中で止まった最終行
+            done[record['key']] = record
+    return done
+
+
+def _drop_partial_line(path):
+    """書き込み途中で止まった最終行を切り詰める（続きの追記が同じ行につながらないように）"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+def run_precompute(combinations, generate, checkpoint_path, rate=0.5, limit=None, log=print):
+    """未生成の組み合わせを generate(mood, ingredients) で生成し、チェックポイントに追記する
+
+    rate は1秒あたりの生成回数の上限。戻り値は (今回生成した件数, 失敗した件数)。
+    """
+    done = load_checkpoint(checkpoint_path)
+    pending = []
+    seen = set(done)
+    for mood, ingredients in combinations:
+        key = make_cache_key(mood, ingredients)
+        if key not in seen:
+            seen.add(key)
+            pending.append((key, mood, ingredients))
+    if limit is not None:
+        pending = pending[:limit]
+    log(f"生成済み {len(done)} 件、今回の対象 {len(pending)} 件")
+
+    directory = os.path.dirname(checkpoint_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    _drop_partial_line(checkpoint_path)
+    interval = 1.0 / rate if rate > 0 else 0.0
+    generated = failed = 0
+    next_call = time.monotonic()
+    with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+        for index, (key, mood, ingredients) in enumerate(pending, 1):
+            wait = next_call - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            next_call = time.monotonic() + interval
+
+            text = generate(mood, ingredients)
+            if not text:
+                failed += 1
+                log(f"[{index}/{len(pending)}] 失敗: {mood} {ingredients}")
+                continue
+            record = {'key': key, 'mood': mood, 'ingredients': ingredients, 'text': text}
+            checkpoint.write(json.dumps(record, ensure_ascii=False) + '\n')
+            checkpoint.flush()
+            generated += 1
+            log(f"[{index}/{len(pending)}] 生成: {mood} {ingredients}")
+    return generated, failed
+
+
+def write_lookup_file(path, records, serializer, convert=None):
+    """(キャッシュキー, 値) の組から参照ファイルを作る（一時ファイルに書いてから置き換える）"""
+    entries = {}
+    for cache_key, value in records:
+        entries[lookup_key(cache_key)] = serializer.dumps(convert(value) if convert else value)
+
+    offset = _HEADER.size + _RECORD.size * len(entries)
+    index = []
+    blobs = []
+    for key in sorted(entries):
+        blob = entries[key]
+        index.append(_RECORD.pack(key, offset, len(blob), 0))
+        blobs.append(blob)
+        offset += len(blob)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(entries), 0))
+        f.writelines(index)
+        f.writelines(blobs)
+    os.replace(temp_path, path)
+    return len(entries)
+
+
+class PrecomputedRecipes:
+    """事前生成したレシピの参照ファイル（読み取り専用のメモリマップ）
+
+    ファイルのページはOSのページキャッシュに載るので、全ワーカーで1つのコピーを共有する。
+    """
+
+    def __init__(self, path, serializer):
+        self.path = path
+        self.serializer = serializer
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, _ = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f'事前生成ファイルの形式が異なります: {path}')
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.count
+
+    def _find(self, key):
+        low, high = 0, self.count
+        data = self._map
+        while low < high:
+            middle = (low + high) // 2
+            position = _HEADER.size + middle * _RECORD.size
+            current = data[position:position + _KEY_SIZE]
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                _, offset, length, _ = _RECORD.unpack_from(data, position)
+                return data[offset:offset + length]
+        return None
+
+    def get(self, cache_key):
+        blob = self._find(lookup_key(cache_key))
+        if blob is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.serializer.loads(blob)
+
+    def stats(self):
+        return {'path': self.path, 'entries': self.count, 'hits': self.hits, 'misses': self.misses}
+
+
+def open_precomputed_from_env(serializer):
+    """PRECOMPUTED_RECIPES_PATH の参照ファイルを開く（ファイルがなければ None）"""
+    path = os.environ.get('PRECOMPUTED_RECIPES_PATH', os.path.join('instance', 'precomputed_recipes.bin'))
+    if not os.path.exists(path):
+        return None
+    try:
+        return PrecomputedRecipes(path, serializer)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"事前生成レシピの読み込みエラー: {e}")
+        return None
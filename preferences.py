@@ -0,0 +1,92 @@
+"""フィードバックから学習するユーザーの好み
+
+以前は「いいね」のたびに「 好み: happyの時の料理,」という文字列をセッションに足していき、
+最大500文字をそのまま毎回のプロンプトに入れていた。プロンプトが長くなるうえ、
+キャッシュキーに含まれるので、ほかのユーザーとキャッシュを共有できなかった。
+
+ここでは好みを固定長の整数の配列（気分11個＋食材30個の親和度、-100〜100）で持ち、
+フィードバックのたびに古い値を少し減衰させてから加減する。
+
+- レシピ集・類似キャッシュの候補の並べ替えにはこの配列を使う（ローカルで計算）
+- プロンプトとキャッシュキーには、好み・苦手がはっきりした食材を最大2つずつ並べた
+  短い文字列（signature）だけを入れる。しきい値で区切るので、同じような好みのユーザーは
+  同じ文字列になり、キャッシュを共有できる
+"""
+from catalog import INGREDIENT_INDEX, INGREDIENTS, MOOD_INDEX, MOODS
+
+VECTOR_SIZE = len(MOODS) + len(INGREDIENTS)
+_INGREDIENT_OFFSET = len(MOODS)
+
+MAX_AFFINITY = 100
+FEEDBACK_STEP = 30  # 1回のフィードバックで加減する量
+DECAY = 0.9  # フィードバックのたびに既存の値に掛ける係数（古い好みほど弱くなる）
+
+# signature に入れる食材（この値以上を好き、この値の負以下を苦手とみなす）
+SIGNATURE_THRESHOLD = 40
+SIGNATURE_ITEMS = 2
+
+
+class PreferenceVector:
+    """気分・食材ごとの親和度"""
+
+    __slots__ = ('values',)
+
+    def __init__(self, values=None):
+        if values is None or len(values) != VECTOR_SIZE:
+            values = [0] * VECTOR_SIZE
+        self.values = list(values)
+
+    @classmethod
+    def from_session(cls, data):
+        """セッションに保存した配列から復元（ない場合や形式が違う場合は空の好み）"""
+        if not isinstance(data, list) or not all(isinstance(value, int) for value in data):
+            return cls()
+        return cls(data)
+
+    def to_session(self):
+        return list(self.values)
+
+    def __bool__(self):
+        return any(self.values)
+
+    def update(self, mood, ingredients, liked):
+        """フィードバック1件を反映する"""
+        step = FEEDBACK_STEP if liked else -FEEDBACK_STEP
+        values = [int(value * DECAY) for value in self.values]
+        indexes = [MOOD_INDEX[mood]] if mood in MOOD_INDEX else []
+        indexes += [_INGREDIENT_OFFSET + INGREDIENT_INDEX[i] for i in set(ingredients) if i in INGREDIENT_INDEX]
+        for index in indexes:
+            values[index] = max(-MAX_AFFINITY, min(MAX_AFFINITY, values[index] + step))
+        self.values = values
+
+    def mood_affinity(self, mood):
+        index = MOOD_INDEX.get(mood)
+        return self.values[index] / MAX_AFFINITY if index is not None else 0.0
+
+    def ingredient_affinity(self, ingredient):
+        index = INGREDIENT_INDEX.get(ingredient)
+        return self.values[_INGREDIENT_OFFSET + index] / MAX_AFFINITY if index is not None else 0.0
+
+    def ingredient_affinities(self):
+        """食材の親和度（-1〜1）をカタログの順に並べたもの"""
+        return [value / MAX_AFFINITY for value in self.values[_INGREDIENT_OFFSET:]]
+
+    def recipe_bonus(self, ingredients):
+        """レシピの食材の親和度の平均（-1〜1、候補の並べ替えに使う）"""
+        if not ingredients:
+            return 0.0
+        return sum(self.ingredient_affinity(ingredient) for ingredient in ingredients) / len(ingredients)
+
+    def signature(self):
+        """プロンプトとキャッシュキーに入れる短い好みの文字列（はっきりした好みがなければ空）"""
+        scored = [(value, ingredient) for ingredient, value in zip(INGREDIENTS, self.values[_INGREDIENT_OFFSET:])]
+        likes = sorted((item for item in scored if item[0] >= SIGNATURE_THRESHOLD), key=lambda item: -item[0])
+        dislikes = sorted((item for item in scored if item[0] <= -SIGNATURE_THRESHOLD), key=lambda item: item[0])
+        parts = []
+        for label, items in (('好きな食材', likes), ('苦手な食材', dislikes)):
+            # 強さの順ではなくカタログの順に並べ、同じ組み合わせなら同じ文字列にする
+            chosen = {ingredient.id for _, ingredient in items[:SIGNATURE_ITEMS]}
+            names = [ingredient.name for ingredient in INGREDIENTS if ingredient.id in chosen]
+            if names:
+                parts.append(f"{label}: {'・'.join(names)}")
+        return ' / '.join(parts)
@@ -0,0 +1,202 @@
+"""Gemini向けのプロンプトテンプレート
+
+毎回変わらない指示部分（回答形式・注意事項など）を先頭の固定文字列にまとめ、
+リクエストごとに変わる部分は末尾の短いテンプレートに埋め込む。
+固定部分はインポート時に一度だけ作られるので、リクエストごとの処理は
+末尾の組み立てと連結1回だけになる。プロンプトの先頭が常に同じなので、
+上流側のプレフィックスキャッシュも効きやすい。
+"""
+import re
+
+# 1つのレシピを提案してもらう（app.py）
+RECIPE_PROMPT_PREFIX = """あなたは料理研究家で、親しみやすく実用的なレシピを提案する専門家です。
+最後に示す「今回の状況」を考慮して、実際に作れる美味しいレシピを1つ提案してください。
+
+**回答形式（必ずこの形式で回答してください）:**
+
+## レシピ名
+（魅力的で分かりやすい名前）
+
+## 調理情報
+- ⏰ 調理時間: XX分
+- 📊 難易度: ★☆☆ または ★★☆ または ★★★
+- 🍽️ 人数: X人分
+
+## 材料
+（具体的な分量も含めて）
+- 主な食材（3-5個）
+- 調味料・その他（3-5個）
+
+## 作り方
+1. 【下準備】具体的な準備内容
+2. 【工程1】詳細な手順
+3. 【工程2】詳細な手順
+4. 【工程3】詳細な手順
+5. 【完成】仕上げの手順
+
+## コツ・ポイント
+（失敗しないための具体的なアドバイス）
+
+## なぜこのレシピなのか
+（今の気分や状況にぴったりな理由）
+
+**重要な注意事項:**
+- 実際に作れるレシピにしてください
+- 分量は具体的に書いてください
+- 調理時間は現実的にしてください
+- 使用できる食材を中心に構成してください（すべて使う必要はありません）
+
+"""
+
+RECIPE_PROMPT_SITUATION = """**今回の状況:**
+- 気分: {mood}
+- 使用できる食材: {ingredients}
+- 追加の要望: {context}
+- 好み: {preferences}"""
+
+# 同じ気分の複数リクエストに1回でまとめて答えてもらう（app.py の /api/recipes/batch）
+BATCH_RECIPE_PROMPT_PREFIX = """あなたは料理研究家で、親しみやすく実用的なレシピを提案する専門家です。
+最後に示す複数のリクエストそれぞれについて、実際に作れる美味しいレシピを1つずつ提案してください。
+
+**回答形式（必ずこの形式で回答してください）:**
+各レシピの直前に「=== レシピ 番号 ===」の行だけを置き、リクエストと同じ番号・同じ順で回答してください。
+各レシピは次の形式で書いてください。
+
+## レシピ名
+（魅力的で分かりやすい名前）
+
+## 調理情報
+- ⏰ 調理時間: XX分
+- 📊 難易度: ★☆☆ または ★★☆ または ★★★
+- 🍽️ 人数: X人分
+
+## 材料
+（具体的な分量も含めて）
+
+## 作り方
+（【下準備】から【完成】まで3〜5ステップ）
+
+## コツ・ポイント
+（失敗しないための具体的なアドバイス）
+
+## なぜこのレシピなのか
+（今の気分や状況にぴったりな理由）
+
+**重要な注意事項:**
+- 実際に作れるレシピにしてください
+- 分量は具体的に書いてください
+- リクエストごとに別の料理にしてください
+- 使用できる食材を中心に構成してください（すべて使う必要はありません）
+
+"""
+
+BATCH_RECIPE_PROMPT_SITUATION = """**共通の状況:**
+- 気分: {mood}
+- 好み: {preferences}
+
+{requests}"""
+
+BATCH_RECIPE_REQUEST = """**リクエスト{number}:**
+- 使用できる食材: {ingredients}
+- 追加の要望: {context}"""
+
+BATCH_RECIPE_SEPARATOR = re.compile(r'^\s*=+\s*レシピ\s*(\d+)\s*=+\s*$', re.MULTILINE)
+BATCH_RECIPE_REQUEST_HEADING = re.compile(r'^\*\*リクエスト(\d+):\*\*$', re.MULTILINE)
+
+# 5つのレシピをまとめて提案してもらう（app_no_HF.py）
+MULTI_RECIPE_PROMPT_PREFIX = """
+あなたは経験豊富な日本の家庭料理の料理人です。
+最後に示す条件に基づいて、5つの料理レシピを提案してください。
+
+以下の形式で5つのレシピを提案してください：
+
+1. **料理名**
+   - 調理時間: XX分
+   - 難易度: ★☆☆（3段階）
+   - 材料: 使用する食材を列挙
+   - 作り方: 3〜5ステップで簡潔に
+   - ポイント: 美味しく作るコツ
+
+※注意:
+- 選択された食材はなるべくすべて使用してください。
+- 気分に合った味付け・調理法を選んでください。
+- 一般的な調味料（醤油・塩・胡椒など）は使用可能。
+- 初心者でも作れるレシピを心がけてください。
+
+"""
+
+MULTI_RECIPE_PROMPT_CONDITIONS = """【気分・好み】: {mood}
+【使用可能な食材】: {ingredients}
+"""
+
+# AI Chefとの対話（app.py）
+CHEF_PROMPT_PREFIX = """あなたは親しみやすいAI料理シェフです。ユーザーとフレンドリーに会話しながら、実用的な料理アドバイスを提供してください。
+
+以下の点に注意して回答してください:
+1. フレンドリーで親しみやすい口調
+2. 実際に作れる具体的なアドバイス
+3. 必要に応じてレシピや調理のコツを提供
+4. 食材の代替案や応用も提案
+5. 簡潔で分かりやすい説明
+
+"""
+
+CHEF_PROMPT_SITUATION = """現在の状況:
+- ユーザーの気分: {mood}
+- 利用可能な食材: {ingredients}
+- ユーザーからのメッセージ: "{message}"
+
+過去の会話履歴:
+{history}"""
+
+
+def render_recipe_prompt(mood_description, ingredient_names, context="", preferences=""):
+    """1レシピ提案用のプロンプト"""
+    return RECIPE_PROMPT_PREFIX + RECIPE_PROMPT_SITUATION.format(
+        mood=mood_description,
+        ingredients=', '.join(ingredient_names),
+        context=context,
+        preferences=preferences
+    )
+
+
+def render_batch_recipe_prompt(mood_description, requests, preferences=""):
+    """複数リクエストをまとめたプロンプト（requests は (食材名リスト, 追加の要望) のリスト）"""
+    return BATCH_RECIPE_PROMPT_PREFIX + BATCH_RECIPE_PROMPT_SITUATION.format(
+        mood=mood_description,
+        preferences=preferences,
+        requests='\n\n'.join(
+            BATCH_RECIPE_REQUEST.format(number=number, ingredients=', '.join(names), context=context)
+            for number, (names, context) in enumerate(requests, 1)
+        )
+    )
+
+
+def split_batch_recipes(text, count):
+    """まとめて生成した応答をリクエストごとに分ける（見つからない番号は None）"""
+    recipes = [None] * count
+    matches = list(BATCH_RECIPE_SEPARATOR.finditer(text))
+    for match, following in zip(matches, matches[1:] + [None]):
+        number = int(match.group(1))
+        body = text[match.end():following.start() if following else len(text)].strip()
+        if 1 <= number <= count and body and recipes[number - 1] is None:
+            recipes[number - 1] = body
+    return recipes
+
+
+def render_multi_recipe_prompt(mood_name, ingredient_names):
+    """5レシピ提案用のプロンプト"""
+    return MULTI_RECIPE_PROMPT_PREFIX + MULTI_RECIPE_PROMPT_CONDITIONS.format(
+        mood=mood_name,
+        ingredients=', '.join(ingredient_names)
+    )
+
+
+def render_chef_prompt(mood, ingredient_names, message, history_lines):
+    """AI Chefとの対話用のプロンプト"""
+    return CHEF_PROMPT_PREFIX + CHEF_PROMPT_SITUATION.format(
+        mood=mood,
+        ingredients=', '.join(ingredient_names),
+        message=message,
+        history='\n'.join(history_lines)
+    )
@@ -0,0 +1,353 @@
+"""AIの1日あたり使用回数（クォータ）の管理
+
+gunicornの全ワーカーで1つの上限を共有できるよう、カウンタを外部ストアに置く。
+生成の前に reserve() で1回分を確保し、成功したら commit()、失敗したら refund() する。
+確保は「使用済み + 確保中 < 上限」のときだけ原子的に行うので、同時リクエストでも
+上限を超えない。
+
+確保した枠には確保した時刻を記録し、lease_timeout 秒を過ぎても確定・返却されない枠
+（確保したワーカーが落ちた場合など）は確保中に数えない。commit() が遅れて届いた場合は
+使用済みとして数える（呼び出しは実際に行われているため）。
+
+バックエンド:
+- memory: プロセス内（単一ワーカー向け）
+- sqlite: WALモードのSQLite（同一ホストの全ワーカーで共有）
+- redis: Redisプロトコルのサーバー（複数ホストで共有、redisパッケージが必要）
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+DEFAULT_LEASE_TIMEOUT = 300.0  # 確定・返却されない確保を取り消すまでの秒数
+
+
+def get_daily_usage_key(now=None):
+    """今日の日付ベースのキーを生成"""
+    return (now or datetime.now()).strftime('%Y-%m-%d')
+
+
+class Reservation:
+    """reserve() で確保した1回分の使用枠"""
+
+    def __init__(self, store, day, token):
+        self.store = store
+        self.day = day
+        self.token = token
+        self.settled = False
+
+    def commit(self):
+        """確保した枠を使用済みにする"""
+        if not self.settled:
+            self.settled = True
+            self.store._commit(self.day, self.token)
+
+    def refund(self):
+        """確保した枠を返却する"""
+        if not self.settled:
+            self.settled = True
+            self.store._refund(self.day, self.token)
+
+
+class QuotaStore:
+    """クォータストアの共通処理"""
+
+    name = 'base'
+
+    def __init__(self, limit, retention_days=2, lease_timeout=DEFAULT_LEASE_TIMEOUT):
+        self.limit = limit
+        self.retention_days = retention_days
+        self.lease_timeout = lease_timeout
+        self._last_day = None
+        self.rejected = 0
+
+    def reserve(self):
+        """1回分の使用枠を確保する。上限に達していれば None"""
+        day = get_daily_usage_key()
+        if day != self._last_day:
+            # 日付が変わったら古い日のカウンタを捨てる
+            self._last_day = day
+            self._evict_before(get_daily_usage_key(datetime.now() - timedelta(days=self.retention_days - 1)))
+        token = uuid.uuid4().hex
+        if self._reserve(day, token, time.time()):
+            return Reservation(self, day, token)
+        self.rejected += 1
+        return None
+
+    def record(self):
+        """確保せずに1回分を使用済みにする（上限チェックなし）"""
+        day = get_daily_usage_key()
+        self._record(day)
+
+    def usage(self):
+        """今日の使用回数（確保中を含む）"""
+        used, reserved = self._counts(get_daily_usage_key())
+        return used + reserved
+
+    def remaining(self):
+        """今日の残り回数"""
+        return max(self.limit - self.usage(), 0)
+
+    def stats(self):
+        """/api/stats 用の統計情報"""
+        used, reserved = self._counts(get_daily_usage_key())
+        return {
+            'backend': self.name,
+            'limit': self.limit,
+            'used': used,
+            'reserved': reserved,
+            'remaining': max(self.limit - used - reserved, 0),
+            'rejected': self.rejected,
+        }
+
+    def _reserve(self, day, token, now):
+        raise NotImplementedError
+
+    def _commit(self, day, token):
+        raise NotImplementedError
+
+    def _refund(self, day, token):
+        raise NotImplementedError
+
+    def _record(self, day):
+        raise NotImplementedError
+
+    def _counts(self, day):
+        raise NotImplementedError
+
+    def _evict_before(self, day):
+        raise NotImplementedError
+
+
+class MemoryQuotaStore(QuotaStore):
+    """プロセス内のクォータストア"""
+
+    name = 'memory'
+
+    def __init__(self, limit, retention_days=2, lease_timeout=DEFAULT_LEASE_TIMEOUT):
+        super().__init__(limit, retention_days, lease_timeout)
+        self._used = {}
+        self._reservations = {}  # 日付 → {トークン: 確保した時刻}
+        self._lock = threading.Lock()
+
+    def _active(self, day, now):
+        """期限内の確保（期限切れのものはここで取り除く）"""
+        reservations = self._reservations.setdefault(day, {})
+        for token in [token for token, reserved_at in reservations.items() if reserved_at <= now - self.lease_timeout]:
+            del reservations[token]
+        return reservations
+
+    def _reserve(self, day, token, now):
+        with self._lock:
+            reservations = self._active(day, now)
+            if self._used.get(day, 0) + len(reservations) >= self.limit:
+                return False
+            reservations[token] = now
+            return True
+
+    def _commit(self, day, token):
+        with self._lock:
+            self._reservations.get(day, {}).pop(token, None)
+            self._used[day] = self._used.get(day, 0) + 1
+
+    def _refund(self, day, token):
+        with self._lock:
+            self._reservations.get(day, {}).pop(token, None)
+
+    def _record(self, day):
+        with self._lock:
+            self._used[day] = self._used.get(day, 0) + 1
+
+    def _counts(self, day):
+        with self._lock:
+            return self._used.get(day, 0), len(self._active(day, time.time()))
+
+    def _evict_before(self, day):
+        with self._lock:
+            for counters in (self._used, self._reservations):
+                for key in [key for key in counters if key < day]:
+                    del counters[key]
+
+
+class SqliteQuotaStore(QuotaStore):
+    """SQLite（WALモード）のクォータストア
+
+    使用済みの回数は日ごとの ai_quota.used、確保中の枠は ai_quota_reservations の行で持つ。
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, limit, retention_days=2, lease_timeout=DEFAULT_LEASE_TIMEOUT):
+        super().__init__(limit, retention_days, lease_timeout)
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS ai_quota ('
+            ' day TEXT PRIMARY KEY,'
+            ' used INTEGER NOT NULL DEFAULT 0)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS ai_quota_reservations ('
+            ' token TEXT PRIMARY KEY,'
+            ' day TEXT NOT NULL,'
+            ' reserved_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ai_quota_reservations_day ON ai_quota_reservations (day, reserved_at)')
+
+    def _connect(self):
+        # sqlite3の接続はスレッド間で共有できないためスレッドごとに持つ
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # isolation_level=None で自動トランザクションを無効にし、1文ごとに確定させる
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _reserve(self, day, token, now):
+        conn = self._connect()
+        # 期限切れの確保の削除・数え上げ・追加を1つの書き込みトランザクションで行う
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM ai_quota_reservations WHERE day = ? AND reserved_at <= ?',
+                         (day, now - self.lease_timeout))
+            row = conn.execute('SELECT used FROM ai_quota WHERE day = ?', (day,)).fetchone()
+            reserved = conn.execute('SELECT COUNT(*) FROM ai_quota_reservations WHERE day = ?', (day,)).fetchone()[0]
+            allowed = (row[0] if row else 0) + reserved < self.limit
+            if allowed:
+                conn.execute('INSERT INTO ai_quota_reservations (token, day, reserved_at) VALUES (?, ?, ?)',
+                             (token, day, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed
+
+    def _commit(self, day, token):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM ai_quota_reservations WHERE token = ?', (token,))
+            conn.execute('INSERT OR IGNORE INTO ai_quota (day) VALUES (?)', (day,))
+            conn.execute('UPDATE ai_quota SET used = used + 1 WHERE day = ?', (day,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _refund(self, day, token):
+        self._connect().execute('DELETE FROM ai_quota_reservations WHERE token = ?', (token,))
+
+    def _record(self, day):
+        conn = self._connect()
+        conn.execute('INSERT OR IGNORE INTO ai_quota (day) VALUES (?)', (day,))
+        conn.execute('UPDATE ai_quota SET used = used + 1 WHERE day = ?', (day,))
+
+    def _counts(self, day):
+        conn = self._connect()
+        row = conn.execute('SELECT used FROM ai_quota WHERE day = ?', (day,)).fetchone()
+        reserved = conn.execute(
+            'SELECT COUNT(*) FROM ai_quota_reservations WHERE day = ? AND reserved_at > ?',
+            (day, time.time() - self.lease_timeout)
+        ).fetchone()[0]
+        return (row[0] if row else 0), reserved
+
+    def _evict_before(self, day):
+        conn = self._connect()
+        conn.execute('DELETE FROM ai_quota WHERE day < ?', (day,))
+        conn.execute('DELETE FROM ai_quota_reservations WHERE day < ?', (day,))
+
+
+# 期限切れの確保を取り除き、使用済み + 確保中 が上限未満のときだけ確保する（Redis上で原子的に実行）
+# KEYS[1]: 使用済みの回数のハッシュ、KEYS[2]: 確保中の枠（スコアが確保した時刻のソート済みセット）
+# ARGV: 上限, キーの有効期限（秒）, 現在時刻, 期限切れとみなす時刻, トークン
+_REDIS_RESERVE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[4])
+local used = tonumber(redis.call('HGET', KEYS[1], 'used') or '0')
+local reserved = redis.call('ZCARD', KEYS[2])
+if used + reserved >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+
+class RedisQuotaStore(QuotaStore):
+    """Redisプロトコルのサーバーを使うクォータストア
+
+    日ごとのキーに有効期限を付けるので、古いキーはサーバー側で自動的に消える。
+    テストでは fakeredis（Luaの実行に lupa が必要）のクライアントや、Redis互換のローカルサーバーを client に渡せる。
+    """
+
+    name = 'redis'
+
+    def __init__(self, limit, url=None, client=None, prefix='recipe:ai_quota:', retention_days=2,
+                 lease_timeout=DEFAULT_LEASE_TIMEOUT):
+        super().__init__(limit, retention_days, lease_timeout)
+        if client is None:
+            import redis  # 任意依存（redisバックエンドを使う場合のみ必要）
+            client = redis.Redis.from_url(url or 'redis://localhost:6379/0')
+        self.client = client
+        self.prefix = prefix
+        self._reserve_script = client.register_script(_REDIS_RESERVE_SCRIPT)
+        self._ttl = retention_days * 86400
+
+    def _key(self, day):
+        return f'{self.prefix}{day}'
+
+    def _reservations_key(self, day):
+        return f'{self.prefix}{day}:reservations'
+
+    def _reserve(self, day, token, now):
+        return int(self._reserve_script(
+            keys=[self._key(day), self._reservations_key(day)],
+            args=[self.limit, self._ttl, now, now - self.lease_timeout, token]
+        )) == 1
+
+    def _commit(self, day, token):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zrem(self._reservations_key(day), token)
+        pipe.hincrby(self._key(day), 'used', 1)
+        pipe.expire(self._key(day), self._ttl)
+        pipe.execute()
+
+    def _refund(self, day, token):
+        self.client.zrem(self._reservations_key(day), token)
+
+    def _record(self, day):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hincrby(self._key(day), 'used', 1)
+        pipe.expire(self._key(day), self._ttl)
+        pipe.execute()
+
+    def _counts(self, day):
+        used = self.client.hget(self._key(day), 'used')
+        reserved = self.client.zcount(self._reservations_key(day), f'({time.time() - self.lease_timeout}', '+inf')
+        return int(used or 0), int(reserved)
+
+    def _evict_before(self, day):
+        # キーの有効期限で自動的に削除される
+        pass
+
+
+def create_quota_store_from_env(limit):
+    """環境変数の設定からクォータストアを作成"""
+    backend_name = os.environ.get('AI_QUOTA_BACKEND', 'sqlite').lower()
+    lease_timeout = float(os.environ.get('AI_QUOTA_LEASE_TIMEOUT', str(DEFAULT_LEASE_TIMEOUT)))
+
+    if backend_name == 'redis':
+        return RedisQuotaStore(limit, url=os.environ.get('AI_QUOTA_REDIS_URL', os.environ.get('REDIS_URL')),
+                               lease_timeout=lease_timeout)
+    if backend_name == 'sqlite':
+        path = os.environ.get('AI_QUOTA_PATH', os.path.join('instance', 'ai_quota.sqlite3'))
+        return SqliteQuotaStore(path, limit, lease_timeout=lease_timeout)
+    return MemoryQuotaStore(limit, lease_timeout=lease_timeout)
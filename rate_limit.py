@@ -0,0 +1,264 @@
+"""クライアントごとのレート制限（トークンバケット）
+
+1日のAI使用回数（quota.py）は全クライアントで1つの上限を共有しているため、
+force_ai: true の /api/recipes や /api/ai-chef を連打する1つのクライアントが
+その日の枠を使い切ってしまえた。ここではエンドポイント（ルール）ごとに
+セッション・IP・全体の3つの範囲でトークンバケットを持ち、どれかが空なら
+429 と Retry-After を返す。
+
+- バケットは「残りトークン・最終更新時刻」の2つの値だけを持ち、リクエストのたびに
+  経過時間の分を補充してから1つ使う。1回の判定はキーを指定した読み書き（O(1)）だけ
+- セッション → IP → 全体の順に見るので、1つのクライアントの連打は全体のバケットを減らさない
+- セッションのidがない（Cookieセッションなど）場合や、そのリクエストで作られたばかりのセッション
+  （Cookieを返さないクライアントは毎回別のidになる）の場合はIPと全体だけで判定する
+
+ルールは「名前.範囲=回数/秒数」で指定する（回数がバーストの上限、秒数で満タンまで補充）。
+
+    RATE_LIMITS="chef.session=5/60,chef.ip=20/60,recipes_ai.global=off"
+
+バックエンド:
+- memory: プロセス内（単一ワーカー向け）
+- sqlite: WALモードのSQLite（同一ホストの全ワーカーで共有）
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+SCOPES = ('session', 'ip', 'global')
+
+# capacity: バケットの容量（連続で許可する回数）、period: 空から満タンまでの秒数
+Limit = namedtuple('Limit', ['capacity', 'period'])
+
+# 判定結果（scope は拒否した範囲、retry_after は次に1回分たまるまでの秒数）
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'scope', 'retry_after'])
+
+ALLOWED = RateLimitResult(True, None, 0.0)
+
+# ルール名 → {範囲: Limit}
+DEFAULT_RULES = {
+    # キャッシュやルールベースで返ることが多いので緩め
+    'recipes': {'session': Limit(30, 60), 'ip': Limit(120, 60)},
+    # AI生成を強制するリクエスト（クォータを直接消費する）
+    'recipes_ai': {'session': Limit(5, 60), 'ip': Limit(20, 60), 'global': Limit(120, 60)},
+    'recipes_batch': {'session': Limit(3, 60), 'ip': Limit(10, 60), 'global': Limit(60, 60)},
+    'chef': {'session': Limit(10, 60), 'ip': Limit(30, 60), 'global': Limit(180, 60)},
+}
+
+
+class BucketStore:
+    """バケットの保存先の共通処理"""
+
+    name = 'base'
+
+    def take(self, key, capacity, rate, now):
+        """トークンを1つ使う（戻り値: (使えたか, 使った後の残りトークン)）"""
+        raise NotImplementedError
+
+    def purge(self, before):
+        """before より前から更新のないバケット（満タンに戻っているもの）を削除する"""
+        raise NotImplementedError
+
+
+class MemoryBucketStore(BucketStore):
+    """プロセス内のバケット（古いものから max_entries を超えた分を捨てる）"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+            return allowed, tokens
+
+    def purge(self, before):
+        with self._lock:
+            # 更新順に並んでいるので先頭から見ればよい
+            while self._buckets:
+                key, (_, updated) = next(iter(self._buckets.items()))
+                if updated >= before:
+                    break
+                del self._buckets[key]
+
+
+# 補充と消費を1文で行う（UPDATE の右辺は更新前の値を参照する）
+_SQLITE_TAKE = (
+    'INSERT INTO rate_buckets (key, tokens, updated, allowed) VALUES (:key, :capacity - 1, :now, 1)'
+    ' ON CONFLICT (key) DO UPDATE SET'
+    ' tokens = MIN(:capacity, tokens + MAX(:now - updated, 0) * :rate)'
+    '  - (MIN(:capacity, tokens + MAX(:now - updated, 0) * :rate) >= 1),'
+    ' allowed = (MIN(:capacity, tokens + MAX(:now - updated, 0) * :rate) >= 1),'
+    ' updated = MAX(:now, updated)'
+    ' RETURNING allowed, tokens'
+)
+
+
+class SqliteBucketStore(BucketStore):
+    """SQLite（WALモード）のバケット（全ワーカーで共有）"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS rate_buckets ('
+            ' key TEXT PRIMARY KEY,'
+            ' tokens REAL NOT NULL,'
+            ' updated REAL NOT NULL,'
+            ' allowed INTEGER NOT NULL) WITHOUT ROWID'
+        )
+
+    def _connect(self):
+        # sqlite3の接続はスレッド間で共有できないためスレッドごとに持つ
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, capacity, rate, now):
+        allowed, tokens = self._connect().execute(
+            _SQLITE_TAKE, {'key': key, 'capacity': capacity, 'rate': rate, 'now': now}
+        ).fetchone()
+        return bool(allowed), tokens
+
+    def purge(self, before):
+        self._connect().execute('DELETE FROM rate_buckets WHERE updated < ?', (before,))
+
+
+class RateLimiter:
+    """ルールごとにセッション・IP・全体のバケットで判定する"""
+
+    def __init__(self, store, rules=None, purge_interval=300.0):
+        self.store = store
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self.purge_interval = purge_interval
+        self._idle_after = max((limit.period for limits in self.rules.values() for limit in limits.values()), default=0)
+        self._next_purge = 0.0
+        self.rejected = Counter()
+        self.errors = 0
+
+    def check(self, rule, session_id=None, ip=None):
+        """1回分を使えるか判定する（未定義のルールや、保存先のエラー時は許可する）"""
+        limits = self.rules.get(rule)
+        if not limits:
+            return ALLOWED
+        now = time.time()
+        self._maybe_purge(now)
+        try:
+            for scope, identity in (('session', session_id), ('ip', ip), ('global', '*')):
+                limit = limits.get(scope)
+                if limit is None or identity is None:
+                    continue
+                rate = limit.capacity / limit.period
+                allowed, tokens = self.store.take(f'{rule}:{scope}:{identity}', limit.capacity, rate, now)
+                if not allowed:
+                    self.rejected[(rule, scope)] += 1
+                    return RateLimitResult(False, scope, (1 - tokens) / rate)
+        except sqlite3.Error as e:
+            # 制限できないよりリクエストを止めるほうが影響が大きいので、保存先の障害時は許可する
+            self.errors += 1
+            print(f"レート制限の判定エラー: {e}")
+        return ALLOWED
+
+    def _maybe_purge(self, now):
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_interval
+        # 削除は件数に比例するので、リクエストを待たせないよう別スレッドで行う
+        threading.Thread(target=self._purge, args=(now,), name='rate-limit-purge', daemon=True).start()
+
+    def _purge(self, now):
+        # 最後の更新から最長の補充時間が過ぎたバケットは満タンなので、消しても結果は変わらない
+        try:
+            self.store.purge(now - self._idle_after)
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"レート制限のバケット削除エラー: {e}")
+
+    def stats(self):
+        return {
+            'backend': self.store.name,
+            'rules': {
+                rule: {scope: f'{limit.capacity}/{limit.period:g}s' for scope, limit in limits.items()}
+                for rule, limits in self.rules.items()
+            },
+            'rejected': {f'{rule}.{scope}': count for (rule, scope), count in self.rejected.items()},
+            'errors': self.errors,
+        }
+
+
+def retry_after_header(seconds):
+    """Retry-After ヘッダーの値（切り上げた整数秒）"""
+    return str(max(1, math.ceil(seconds)))
+
+
+def parse_rules(spec, base=None):
+    """「名前.範囲=回数/秒数」のカンマ区切りで base（既定は DEFAULT_RULES）を上書きする
+
+    値を off にするとその範囲の制限をなくす。
+    """
+    rules = {rule: dict(limits) for rule, limits in (base or DEFAULT_RULES).items()}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        rule, _, scope = name.strip().partition('.')
+        if scope not in SCOPES:
+            raise ValueError(f'範囲は {SCOPES} のいずれかで指定してください: {item}')
+        value = value.strip().lower()
+        if value == 'off':
+            rules.setdefault(rule, {}).pop(scope, None)
+            continue
+        capacity, _, period = value.partition('/')
+        limit = Limit(int(capacity), float(period or 1))
+        if limit.capacity < 1 or limit.period <= 0:
+            raise ValueError(f'回数は1以上、秒数は正の値で指定してください: {item}')
+        rules.setdefault(rule, {})[scope] = limit
+    return rules
+
+
+def create_rate_limiter_from_env():
+    """環境変数の設定からレート制限を作成（RATE_LIMIT_BACKEND: sqlite / memory / off）"""
+    backend_name = os.environ.get('RATE_LIMIT_BACKEND', 'sqlite').lower()
+    if backend_name == 'off':
+        return None
+    rules = parse_rules(os.environ.get('RATE_LIMITS', ''))
+    if backend_name == 'sqlite':
+        try:
+            store = SqliteBucketStore(os.environ.get('RATE_LIMIT_PATH', os.path.join('instance', 'rate_limit.sqlite3')))
+        except (OSError, sqlite3.Error) as e:
+            print(f"レート制限の初期化エラー（プロセス内で制限します）: {e}")
+            store = MemoryBucketStore()
+    else:
+        store = MemoryBucketStore()
+    return RateLimiter(store, rules)
+
+
+def client_ip(request, trusted_proxies=0):
+    """クライアントのIP（trusted_proxies 段の信頼できるプロキシの後ろなら X-Forwarded-For から取る）
+
+    X-Forwarded-For はクライアントが自由に書けるので、信頼できるプロキシが付け足した分だけを使う。
+    """
+    if trusted_proxies > 0:
+        forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+        if len(forwarded) >= trusted_proxies:
+            return forwarded[-trusted_proxies]
+    return request.remote_addr
@@ -0,0 +1,254 @@
+"""AI生成レシピのレスポンスキャッシュ
+
+同じ気分・食材・要望の組み合わせで何度もGeminiを呼ばないよう、
+正規化したキーで生成結果を保存する。バックエンドは以下から選択できる。
+
+- memory: プロセス内のLRU（TTL付き）
+- sqlite: gunicornの複数ワーカーで共有できるディスク上のストア
+- none: キャッシュしない
+
+serializer（dumps / loads を持つオブジェクト）を渡すと、値をバイト列にして保存する。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _normalize_text(text):
+    """前後の空白を除き、連続する空白を1つにまとめる"""
+    return ' '.join((text or '').split())
+
+
+def make_cache_key(mood, ingredients, context="", user_preferences=""):
+    """正規化した (気分, 食材, 要望, 好み) からキャッシュキーを生成"""
+    normalized = {
+        'mood': _normalize_text(mood).lower(),
+        'ingredients': sorted({_normalize_text(str(ing)).lower() for ing in (ingredients or []) if _normalize_text(str(ing))}),
+        'context': _normalize_text(context),
+        'preferences': _normalize_text(user_preferences),
+    }
+    raw = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class MemoryCacheBackend:
+    """プロセス内のLRUキャッシュ（TTL・最大件数付き）"""
+
+    name = 'memory'
+    shared = False  # 他のワーカーからは見えない
+
+    def __init__(self, max_entries=512, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteCacheBackend:
+    """SQLiteを使ったワーカー間共有キャッシュ（TTL・最大件数付き）"""
+
+    name = 'sqlite'
+    shared = True  # 同じファイルを開く全ワーカーで共有する
+
+    def __init__(self, path, max_entries=5000, ttl=86400):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self.evictions = 0
+
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS recipe_cache ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL,'
+            ' accessed_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_recipe_cache_accessed ON recipe_cache (accessed_at)')
+        conn.commit()
+
+    def _connect(self):
+        # sqlite3の接続はスレッド間で共有できないためスレッドごとに持つ
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            'SELECT value, expires_at FROM recipe_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at < now:
+            conn.execute('DELETE FROM recipe_cache WHERE key = ?', (key,))
+            conn.commit()
+            return None
+        conn.execute('UPDATE recipe_cache SET accessed_at = ? WHERE key = ?', (now, key))
+        conn.commit()
+        return value
+
+    def set(self, key, value):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO recipe_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+            (key, value, now + self.ttl, now)
+        )
+        # 期限切れを削除し、上限を超えた分は最終アクセスが古い順に削除
+        conn.execute('DELETE FROM recipe_cache WHERE expires_at < ?', (now,))
+        overflow = len(self) - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                'DELETE FROM recipe_cache WHERE key IN '
+                '(SELECT key FROM recipe_cache ORDER BY accessed_at ASC LIMIT ?)',
+                (overflow,)
+            )
+            self.evictions += overflow
+        conn.commit()
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute('DELETE FROM recipe_cache')
+        conn.commit()
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM recipe_cache').fetchone()[0]
+
+
+class RecipeCache:
+    """バックエンドをラップしてヒット/ミス数を数えるキャッシュ"""
+
+    def __init__(self, backend=None, serializer=None):
+        self.backend = backend
+        self.serializer = serializer
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    @property
+    def shared(self):
+        """他のワーカーが書いた値を読めるか"""
+        return self.backend is not None and self.backend.shared
+
+    def get(self, key):
+        value = self.peek(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def peek(self, key):
+        """ヒット/ミス数を数えずに読む（他のワーカーの結果を待つポーリング用）"""
+        if self.backend is None:
+            return None
+        try:
+            value = self.backend.get(key)
+            if value is not None and self.serializer is not None:
+                value = self.serializer.loads(value)
+        except Exception as e:
+            print(f"キャッシュ読み込みエラー: {e}")
+            value = None
+            with self._lock:
+                self.errors += 1
+        return value
+
+    def set(self, key, value):
+        if self.backend is None or value is None:
+            return
+        try:
+            if self.serializer is not None:
+                value = self.serializer.dumps(value)
+            self.backend.set(key, value)
+            with self._lock:
+                self.sets += 1
+        except Exception as e:
+            print(f"キャッシュ書き込みエラー: {e}")
+            with self._lock:
+                self.errors += 1
+
+    def stats(self):
+        """/api/stats 用の統計情報"""
+        lookups = self.hits + self.misses
+        try:
+            size = len(self.backend) if self.backend is not None else 0
+        except Exception:
+            size = None
+        return {
+            'backend': self.backend.name if self.backend is not None else 'none',
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'sets': self.sets,
+            'errors': self.errors,
+            'evictions': getattr(self.backend, 'evictions', 0),
+            'size': size,
+        }
+
+
+def create_cache_from_env(serializer=None):
+    """環境変数の設定からキャッシュを作成"""
+    backend_name = os.environ.get('RECIPE_CACHE_BACKEND', 'memory').lower()
+    max_entries = int(os.environ.get('RECIPE_CACHE_MAX_ENTRIES', '512'))
+    ttl = int(os.environ.get('RECIPE_CACHE_TTL', '86400'))
+
+    if backend_name == 'sqlite':
+        path = os.environ.get('RECIPE_CACHE_PATH', os.path.join('instance', 'recipe_cache.sqlite3'))
+        backend = SqliteCacheBackend(path, max_entries=max_entries, ttl=ttl)
+    elif backend_name == 'memory':
+        backend = MemoryCacheBackend(max_entries=max_entries, ttl=ttl)
+    else:
+        backend = None
+
+    return RecipeCache(backend, serializer)
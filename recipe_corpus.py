@@ -0,0 +1,341 @@
+"""ローカルのレシピ集と食材の転置インデックス
+
+AIを使わない（使えない）リクエストにも、選んだ食材と気分に合ったレシピを返すためのもの。
+同梱のデータセット（recipe_corpus.json）と、過去にAIが生成したレシピ（SQLite）を読み込み、
+レシピ番号のビット集合（int）で次の索引を作る。
+
+- 食材id → その食材を使うレシピ
+- 気分id → その気分に合うレシピ
+- 食材数 → その数の食材を使うレシピ
+
+スコアは「レシピの食材のうち手元にある割合」から足りない食材の数に応じた減点を引き、
+気分が合えば加点したもの。一致した食材数・レシピの食材数・気分の一致だけで決まるので、
+選んだ食材のビット集合を足し合わせて「一致数ごとのレシピ集合」を作り、
+(一致数, 食材数, 気分) の組ごとにビット集合の AND を取れば最高スコアのレシピが分かる。
+レシピを1件ずつ見ないため、数千件でも1回の検索は数十マイクロ秒で済む。
+
+ユーザーの好み（preferences.PreferenceVector）を渡した場合は、最高スコアに近い候補だけを
+取り出し、レシピの食材の親和度を加点して並べ替える。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from catalog import ingredient_names, mood_name
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recipe_corpus.json')
+
+# スコアの重み
+MISSING_PENALTY = 0.1  # 手元にない食材1つあたりの減点
+MOOD_BONUS = 0.3  # 気分が合う場合の加点
+PREFERENCE_WEIGHT = 0.2  # 好みによる加点の最大値
+PREFERENCE_MAX_CANDIDATES = 64  # 好みで並べ替える候補数の上限
+
+CorpusRecipe = namedtuple('CorpusRecipe', ['key', 'name', 'moods', 'ingredients', 'text', 'source'])
+CorpusMatch = namedtuple('CorpusMatch', ['recipe', 'score', 'matched', 'missing'])
+
+
+def render_corpus_recipe(entry):
+    """同梱データの1件を画面表示用のMarkdownにする"""
+    steps = '\n'.join(f"{i}. {step}" for i, step in enumerate(entry['steps'], 1))
+    moods = '・'.join(mood_name(mood) for mood in entry['moods'])
+    return f"""## {entry['name']}
+
+## 調理情報
+- ⏰ 調理時間: {entry['time']}
+- 📊 難易度: {entry['difficulty']}
+- 🍽️ 人数: {entry.get('servings', '2人分')}
+
+## 材料
+- {', '.join(ingredient_names(entry['ingredients']))}
+- {', '.join(entry['seasonings'])}
+
+## 作り方
+{steps}
+
+## コツ・ポイント
+{entry['tips']}
+
+## なぜこのレシピなのか
+「{moods}」な日にぴったりの定番レシピです。
+
+---
+*このレシピはレシピ集から選ばれました*"""
+
+
+def extract_recipe_name(text):
+    """AIが生成したレシピの本文からレシピ名を取り出す"""
+    lines = [line.strip() for line in text.splitlines()]
+    for i, line in enumerate(lines):
+        if line.startswith('## '):
+            name = line[3:].strip()
+            if name != 'レシピ名':
+                return name
+            # 「## レシピ名」の見出しの次の行に名前がある形式
+            return next((following for following in lines[i + 1:] if following), name)
+    return lines[0] if lines else ''
+
+
+class SqliteCorpusStore:
+    """AIが生成したレシピをSQLiteに保存する（全ワーカーで共有）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS corpus_recipes ('
+            ' key TEXT PRIMARY KEY,'
+            ' name TEXT NOT NULL,'
+            ' moods TEXT NOT NULL,'
+            ' ingredients TEXT NOT NULL,'
+            ' text TEXT NOT NULL,'
+            ' created_at REAL NOT NULL)'
+        )
+
+    def _connect(self):
+        # sqlite3の接続はスレッド間で共有できないためスレッドごとに持つ
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def load(self, since=0.0, limit=5000):
+        """since より後に保存されたレシピを古い順に返す（新しいものから limit 件）"""
+        rows = self._connect().execute(
+            'SELECT key, name, moods, ingredients, text, created_at FROM corpus_recipes'
+            ' WHERE created_at > ? ORDER BY created_at DESC LIMIT ?',
+            (since, limit)
+        ).fetchall()
+        return [
+            (CorpusRecipe(key, name, tuple(json.loads(moods)), tuple(json.loads(ingredients)), text, 'ai'), created_at)
+            for key, name, moods, ingredients, text, created_at in reversed(rows)
+        ]
+
+    def save(self, recipe):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO corpus_recipes (key, name, moods, ingredients, text, created_at)'
+            ' VALUES (?, ?, ?, ?, ?, ?)',
+            (recipe.key, recipe.name, json.dumps(recipe.moods), json.dumps(recipe.ingredients), recipe.text, time.time())
+        )
+
+
+class RecipeCorpus:
+    """レシピ集と食材・気分の索引
+
+    レシピは追加のみ（番号は追加順）で、索引はビットを立てるだけで更新できる。
+    同じキーのレシピが再度追加された場合は本文だけを差し替える。
+    """
+
+    def __init__(self, store=None, max_learned=5000, refresh_interval=30.0):
+        self.store = store
+        self.max_learned = max_learned
+        self.refresh_interval = refresh_interval
+        self._recipes = []
+        self._keys = {}
+        self._ingredient_bits = {}
+        self._mood_bits = {}
+        self._size_bits = {}
+        self._learned = 0
+        self._lock = threading.Lock()
+        self._loaded_until = 0.0
+        self._next_refresh = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def __len__(self):
+        return len(self._recipes)
+
+    def _add(self, recipe):
+        rid = self._keys.get(recipe.key)
+        if rid is not None:
+            self._recipes[rid] = self._recipes[rid]._replace(name=recipe.name, text=recipe.text)
+            return
+        if recipe.source == 'ai':
+            if self._learned >= self.max_learned:
+                return
+            self._learned += 1
+        rid = len(self._recipes)
+        bit = 1 << rid
+        self._recipes.append(recipe)
+        self._keys[recipe.key] = rid
+        for ingredient in recipe.ingredients:
+            self._ingredient_bits[ingredient] = self._ingredient_bits.get(ingredient, 0) | bit
+        for mood in recipe.moods:
+            self._mood_bits[mood] = self._mood_bits.get(mood, 0) | bit
+        size = len(recipe.ingredients)
+        self._size_bits[size] = self._size_bits.get(size, 0) | bit
+
+    def load_dataset(self, path=DEFAULT_DATA_PATH):
+        """同梱のレシピデータを読み込む"""
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)
+        with self._lock:
+            for entry in entries:
+                self._add(CorpusRecipe(
+                    f"dataset:{entry['id']}",
+                    entry['name'],
+                    tuple(entry['moods']),
+                    tuple(dict.fromkeys(entry['ingredients'])),
+                    render_corpus_recipe(entry),
+                    'dataset',
+                ))
+        return len(entries)
+
+    def refresh(self):
+        """ストアから未読み込みのAI生成レシピを取り込む（他のワーカーが保存した分も含む）"""
+        if self.store is None:
+            return 0
+        try:
+            rows = self.store.load(self._loaded_until, self.max_learned)
+        except Exception as e:
+            self.errors += 1
+            print(f"レシピ集の読み込みエラー: {e}")
+            return 0
+        with self._lock:
+            for recipe, created_at in rows:
+                self._add(recipe)
+                self._loaded_until = max(self._loaded_until, created_at)
+        return len(rows)
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if self.store is None or now < self._next_refresh:
+            return
+        self._next_refresh = now + self.refresh_interval
+        self.refresh()
+
+    def learn(self, key, mood, ingredients, text):
+        """AIが生成したレシピをレシピ集に加える"""
+        recipe = CorpusRecipe(
+            key,
+            extract_recipe_name(text),
+            (mood,),
+            tuple(dict.fromkeys(ingredients)),
+            text + '\n\n---\n*このレシピは以前AI Chefが作成したレシピです*',
+            'ai',
+        )
+        with self._lock:
+            self._add(recipe)
+        if self.store is not None:
+            try:
+                self.store.save(recipe)
+            except Exception as e:
+                self.errors += 1
+                print(f"レシピ集の保存エラー: {e}")
+
+    def lookup(self, mood, ingredients, preferences=None):
+        """食材と気分に最も合うレシピを返す（1つも食材が一致しなければ None）"""
+        self._maybe_refresh()
+        recipes = self._recipes
+
+        # 選んだ食材のビット集合をビットごとの足し算（桁ごとの集合）で数える
+        planes = []
+        candidates = 0
+        for ingredient in set(ingredients):
+            carry = self._ingredient_bits.get(ingredient, 0)
+            candidates |= carry
+            for j, plane in enumerate(planes):
+                if not carry:
+                    break
+                planes[j], carry = plane ^ carry, plane & carry
+            if carry:
+                planes.append(carry)
+
+        mood_bits = self._mood_bits.get(mood, 0)
+        size_bits = self._size_bits
+        best = None
+        best_rank = None
+        groups = [] if preferences else None
+        for count in range(1, (1 << len(planes))):
+            # 一致数がちょうど count のレシピ
+            matched = candidates
+            for j, plane in enumerate(planes):
+                matched &= plane if count >> j & 1 else ~plane
+            if not matched:
+                continue
+            for size, sized in size_bits.items():
+                group = matched & sized
+                if not group:
+                    continue
+                base = count / size - MISSING_PENALTY * (size - count)
+                for score, members in ((base + MOOD_BONUS, group & mood_bits), (base, group & ~mood_bits)):
+                    if not members:
+                        continue
+                    if groups is not None:
+                        groups.append((score, count, size, members))
+                    # 同点なら一致した食材が多いもの、さらに同じなら先に登録されたもの
+                    rid = (members & -members).bit_length() - 1
+                    rank = (score, count, -rid)
+                    if best_rank is None or rank > best_rank:
+                        best_rank = rank
+                        best = CorpusMatch(recipes[rid], score, count, size - count)
+
+        if best is not None and groups is not None:
+            best = self._rerank(groups, best_rank[0], preferences)
+
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return best
+
+    def _rerank(self, groups, best_score, preferences):
+        """好みの加点で逆転しうる候補（最高スコアとの差が PREFERENCE_WEIGHT 以内）から選び直す"""
+        recipes = self._recipes
+        best = None
+        best_rank = None
+        examined = 0
+        for score, count, size, members in sorted(groups, key=lambda group: -group[0]):
+            if score < best_score - PREFERENCE_WEIGHT or examined >= PREFERENCE_MAX_CANDIDATES:
+                break
+            while members and examined < PREFERENCE_MAX_CANDIDATES:
+                low = members & -members
+                members ^= low
+                rid = low.bit_length() - 1
+                examined += 1
+                recipe = recipes[rid]
+                rank = (score + PREFERENCE_WEIGHT * preferences.recipe_bonus(recipe.ingredients), count, -rid)
+                if best_rank is None or rank > best_rank:
+                    best_rank = rank
+                    best = CorpusMatch(recipe, score, count, size - count)
+        return best
+
+    def stats(self):
+        return {
+            'recipes': len(self._recipes),
+            'learned': self._learned,
+            'ingredients_indexed': len(self._ingredient_bits),
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+        }
+
+
+def create_corpus_from_env():
+    """環境変数の設定からレシピ集を作成（RECIPE_CORPUS_ENABLED=false なら None）"""
+    if os.environ.get('RECIPE_CORPUS_ENABLED', 'true').lower() != 'true':
+        return None
+    store = None
+    if os.environ.get('RECIPE_CORPUS_LEARN', 'true').lower() == 'true':
+        store = SqliteCorpusStore(os.environ.get('RECIPE_CORPUS_PATH', os.path.join('instance', 'recipe_corpus.sqlite3')))
+    corpus = RecipeCorpus(
+        store=store,
+        max_learned=int(os.environ.get('RECIPE_CORPUS_MAX_LEARNED', '5000')),
+        refresh_interval=float(os.environ.get('RECIPE_CORPUS_REFRESH_INTERVAL', '30')),
+    )
+    try:
+        corpus.load_dataset(os.environ.get('RECIPE_CORPUS_DATA', DEFAULT_DATA_PATH))
+    except (OSError, ValueError) as e:
+        print(f"レシピ集データの読み込みエラー: {e}")
+    corpus.refresh()
+    return corpus
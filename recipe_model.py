@@ -0,0 +1,235 @@
+"""構造化したレシピと、キャッシュ用のコンパクトな直列化
+
+Geminiの応答はMarkdownの文字列なので、レシピ名（画像生成）、材料や手順（画面表示）、
+フィードバックの recipe_data などで使うたびに文字列を読み直すことになる。
+ここでは応答を生成直後に一度だけ Recipe に変換し、以降はそれを使い回す。
+
+キャッシュにはMarkdownではなく Recipe の各項目を並べた配列を保存する
+（msgpackがあればmsgpack、なければ区切りを詰めたJSON）。表示用のMarkdownは
+to_markdown() でいつでも同じ形式に組み立て直せる。形式どおりに読めなかった応答は
+文字列のまま保存する。
+
+to_markdown() は本文を落とさないが、書式は揃える（元の文字列と完全には一致しない）。
+
+- レシピ名の下の文章は description、調理情報のうち時間・難易度・人数以外の行は other_info、
+  知らない見出しの節は notes（見出し, 本文）に入れ、それぞれ元の節の位置の近くに書き戻す
+  （notes は「なぜこのレシピなのか」の後ろにまとめる）
+- 空行・区切り線（---）・見出しの ** は消え、箇条書きの記号と手順の番号は付け直す
+- 最初の見出しより前の前置き（「はい、レシピです」など）と、材料・作り方の「（2人分）」の
+  ような括弧だけの補足行は保存しない
+"""
+import json
+import re
+from dataclasses import asdict, dataclass
+
+try:
+    import msgpack  # 任意依存（あればキャッシュの直列化に使う）
+except ImportError:
+    msgpack = None
+
+# 直列化したデータの先頭1バイト（形式の判別用）
+_MSGPACK = b'm'
+_JSON = b'j'
+
+# 配列の先頭要素（Recipe か、読めなかった応答の文字列か）
+_KIND_RECIPE = 1
+_KIND_TEXT = 0
+
+# Recipe の行の項目数（種類＋Recipe の全項目）
+_RECIPE_ROW_LENGTH = 12
+
+_HEADING = re.compile(r'^#{2,3}\s*(.+?)\s*$')
+_LIST_ITEM = re.compile(r'^(?:[-*・]|\d+[.)．])\s*')
+_INFO_FIELDS = {
+    'time': re.compile(r'調理時間\s*[:：]\s*(.+)'),
+    'difficulty': re.compile(r'難易度\s*[:：]\s*(.+)'),
+    'servings': re.compile(r'人数\s*[:：]\s*(.+)'),
+}
+
+# 見出しの名前 → Recipe の項目
+_SECTIONS = {
+    '調理情報': 'info',
+    '材料': 'ingredients',
+    '作り方': 'steps',
+    'コツ・ポイント': 'tips',
+    'コツ': 'tips',
+    'ポイント': 'tips',
+    'なぜこのレシピなのか': 'reason',
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Recipe:
+    """1つのレシピ"""
+
+    name: str
+    time: str = ''
+    difficulty: str = ''
+    servings: str = ''
+    ingredients: tuple = ()
+    steps: tuple = ()
+    tips: str = ''
+    reason: str = ''
+    description: str = ''
+    other_info: tuple = ()
+    notes: tuple = ()  # (見出し, 本文) の組
+
+    def to_dict(self):
+        """JSONレスポンス用の辞書"""
+        data = asdict(self)
+        data['ingredients'] = list(self.ingredients)
+        data['steps'] = list(self.steps)
+        data['other_info'] = list(self.other_info)
+        data['notes'] = [{'heading': heading, 'text': text} for heading, text in self.notes]
+        return data
+
+    def to_markdown(self):
+        """プロンプトで指定した回答形式と同じMarkdownにする"""
+        lines = [f'## {self.name}']
+        if self.description:
+            lines += ['', self.description]
+        lines += ['', '## 調理情報']
+        lines.append(f'- ⏰ 調理時間: {self.time}')
+        lines.append(f'- 📊 難易度: {self.difficulty}')
+        lines.append(f'- 🍽️ 人数: {self.servings}')
+        lines += list(self.other_info)
+        lines += ['', '## 材料']
+        lines += [f'- {ingredient}' for ingredient in self.ingredients]
+        lines += ['', '## 作り方']
+        lines += [f'{i}. {step}' for i, step in enumerate(self.steps, 1)]
+        if self.tips:
+            lines += ['', '## コツ・ポイント', self.tips]
+        if self.reason:
+            lines += ['', '## なぜこのレシピなのか', self.reason]
+        for heading, text in self.notes:
+            lines += ['', f'## {heading}'] + ([text] if text else [])
+        return '\n'.join(lines)
+
+
+def _section_name(heading):
+    heading = heading.strip('*').strip()
+    for title, field in _SECTIONS.items():
+        if heading.startswith(title):
+            return field
+    return None
+
+
+def parse_recipe(text):
+    """AIが回答形式どおりに書いたMarkdownを Recipe にする（名前・材料・手順が読めなければ None）"""
+    if not text:
+        return None
+    name = ''
+    section = None
+    info = {}
+    lists = {'ingredients': [], 'steps': []}
+    paragraphs = {'tips': [], 'reason': [], 'description': []}
+    other_info = []
+    notes = []
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line or line == '---':
+            continue
+        heading = _HEADING.match(line)
+        if heading:
+            title = heading.group(1)
+            field = _section_name(title)
+            if field is None and not name:
+                # 最初の見出しがレシピ名（「## レシピ名」の形式なら次の行が名前）
+                section = 'name' if title.strip('*') == 'レシピ名' else None
+                name = '' if section == 'name' else title.strip('*').strip()
+                if section is None:
+                    section = 'description'
+            elif field is None:
+                # 回答形式にない見出しの節はそのまま残す
+                notes.append((title.strip('*').strip(), []))
+                section = 'note'
+            else:
+                section = field
+            continue
+
+        if section == 'name':
+            name = line.strip('*（）() ').strip()
+            section = 'description'
+        elif section == 'info':
+            for key, pattern in _INFO_FIELDS.items():
+                match = pattern.search(line)
+                if match:
+                    info[key] = match.group(1).strip()
+                    break
+            else:
+                other_info.append(line)
+        elif section in lists:
+            if line[0] in '（(' and line[-1] in '）)':
+                continue  # 「（2人分）」のような補足
+            lists[section].append(_LIST_ITEM.sub('', line, count=1))
+        elif section in paragraphs:
+            paragraphs[section].append(line)
+        elif section == 'note':
+            notes[-1][1].append(line)
+
+    if not name or not lists['ingredients'] or not lists['steps']:
+        return None
+    return Recipe(
+        name=name,
+        time=info.get('time', ''),
+        difficulty=info.get('difficulty', ''),
+        servings=info.get('servings', ''),
+        ingredients=tuple(lists['ingredients']),
+        steps=tuple(lists['steps']),
+        tips='\n'.join(paragraphs['tips']),
+        reason='\n'.join(paragraphs['reason']),
+        description='\n'.join(paragraphs['description']),
+        other_info=tuple(other_info),
+        notes=tuple((heading, '\n'.join(body)) for heading, body in notes),
+    )
+
+
+def recipe_or_text(text):
+    """応答を読めれば Recipe、読めなければ元の文字列を返す（キャッシュに入れる値）"""
+    return parse_recipe(text) or text
+
+
+def recipe_markdown(value):
+    """キャッシュの値（Recipe か文字列）を表示用のMarkdownにする"""
+    return value.to_markdown() if isinstance(value, Recipe) else value
+
+
+def recipe_dict(value):
+    """キャッシュの値（Recipe か文字列）をJSONレスポンス用の辞書にする（読めなければ None）"""
+    if not isinstance(value, Recipe):
+        value = parse_recipe(value)
+    return value.to_dict() if value is not None else None
+
+
+class RecipeSerializer:
+    """キャッシュに保存する値（Recipe か文字列）とバイト列を相互に変換する"""
+
+    def dumps(self, value):
+        if isinstance(value, Recipe):
+            row = [_KIND_RECIPE, value.name, value.time, value.difficulty, value.servings,
+                   list(value.ingredients), list(value.steps), value.tips, value.reason,
+                   value.description, list(value.other_info), [list(note) for note in value.notes]]
+        else:
+            row = [_KIND_TEXT, value]
+        if msgpack is not None:
+            return _MSGPACK + msgpack.packb(row, use_bin_type=True)
+        return _JSON + json.dumps(row, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        data = bytes(data)
+        if data[:1] == _MSGPACK:
+            if msgpack is None:
+                raise ValueError('msgpackで保存された値ですが、msgpackがインストールされていません')
+            row = msgpack.unpackb(data[1:], raw=False)
+        elif data[:1] == _JSON:
+            row = json.loads(data[1:].decode('utf-8'))
+        else:
+            raise ValueError(f'直列化の形式が不明です: {data[:1]!r}')
+        if row[0] == _KIND_TEXT and len(row) == 2:
+            return row[1]
+        if row[0] != _KIND_RECIPE or len(row) != _RECIPE_ROW_LENGTH:
+            raise ValueError(f'レシピの行の形式が違います（種類 {row[0]}、{len(row)} 項目）')
+        name, time, difficulty, servings, ingredients, steps, tips, reason, description, other_info, notes = row[1:]
+        return Recipe(name, time, difficulty, servings, tuple(ingredients), tuple(steps), tips, reason,
+                      description, tuple(other_info), tuple(tuple(note) for note in notes))
@@ -0,0 +1,192 @@
+"""Gemini呼び出しの耐障害性（サーキットブレーカー・リトライ・ヘッジ）
+
+Geminiが不調なとき、これまでは全リクエストが締め切りいっぱいまで待ってから
+ルールベースに切り替えていた。LLMClient に次の3つを組み込めるようにする。
+
+- CircuitBreaker: 連続して失敗したら一定時間は上流を呼ばずにすぐ失敗させる
+  （closed → open → half_open で少数だけ試し、成功すれば closed に戻る）
+- RetryPolicy: 失敗した呼び出しを、ばらつきを持たせた待ち時間のあと締め切りの範囲内で再試行する
+- HedgePolicy: 応答が直近のp95を超えても返らなければ、同じプロンプトをもう1本送り、
+  先に返った方を使う（上流の呼び出し回数が増えるので既定では無効）
+
+状態はワーカーごとに持つ（各ワーカーが自分の呼び出し結果から判断する）。
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+
+
+class CircuitBreaker:
+    """連続失敗で上流の呼び出しを止めるサーキットブレーカー
+
+    failure_threshold: open にするまでの連続失敗回数
+    reset_timeout: open から half_open に移るまでの秒数
+    half_open_max_calls: half_open で同時に試す呼び出しの数
+
+    結果を記録するときは、その呼び出しを allow() で許可された時刻（time.monotonic()）を渡す。
+    open になる前に始まった呼び出しの結果は、遅れて返ってきても状態を変えない。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, half_open_max_calls=1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        # 最後に失敗で open になった時刻（half_open の周期の更新では変わらない）
+        self._tripped_at = float('-inf')
+        self._probes = 0
+        self.opened = 0
+        self.short_circuited = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state != self.CLOSED and time.monotonic() - self._opened_at >= self.reset_timeout:
+            # half_open の試行が結果を返さないまま（切断など）でも、次の周期でまた試せるようにする
+            self._state = self.HALF_OPEN
+            self._opened_at = time.monotonic()
+            self._probes = 0
+        return self._state
+
+    def allow(self):
+        """呼び出してよいか（False なら上流を呼ばずに失敗させる）"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+            self.short_circuited += 1
+            return False
+
+    def _is_stale(self, state, started_at):
+        # open / half_open に移った後の結果だけが、いまの状態についての情報になる
+        return state != self.CLOSED and started_at < self._tripped_at
+
+    def record_success(self, started_at):
+        with self._lock:
+            state = self._current_state()
+            if self._is_stale(state, started_at):
+                return
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self, started_at):
+        with self._lock:
+            state = self._current_state()
+            if self._is_stale(state, started_at):
+                return
+            self._failures += 1
+            if state == self.HALF_OPEN or (state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = self._tripped_at = time.monotonic()
+                self.opened += 1
+
+    def stats(self):
+        with self._lock:
+            state = self._current_state()
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'opened': self.opened,
+                'short_circuited': self.short_circuited,
+            }
+
+
+class RetryPolicy:
+    """失敗した呼び出しの再試行（指数バックオフ＋フルジッター）
+
+    max_attempts: 最初の呼び出しを含む最大試行回数
+    min_attempt_time: 締め切りまでの残りがこれより短ければ再試行しない
+    """
+
+    def __init__(self, max_attempts=2, base_delay=0.2, max_delay=2.0, min_attempt_time=1.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_attempt_time = min_attempt_time
+
+    def delay(self, attempt, remaining):
+        """attempt 回目の失敗のあとに待つ秒数（再試行しない場合は None）"""
+        if attempt >= self.max_attempts:
+            return None
+        # 同時に失敗した呼び出しが一斉に再試行しないよう、待ち時間を 0〜上限 でばらつかせる
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if remaining - delay < self.min_attempt_time:
+            return None
+        return delay
+
+
+class HedgePolicy:
+    """直近の成功した呼び出しの所要時間から、追加のリクエストを送るまでの時間を決める
+
+    percentile: この割合の呼び出しが返るまでの時間を待ってから追加で送る（0.95 なら p95）
+    min_samples: これより記録が少ない間は追加で送らない
+    min_delay: 追加で送るまでの最短の秒数
+    """
+
+    def __init__(self, percentile=0.95, min_samples=20, min_delay=0.5, window=200):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def delay(self):
+        """追加のリクエストを送るまでの秒数（記録が足りなければ None）"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        index = min(int(len(latencies) * self.percentile), len(latencies) - 1)
+        return max(latencies[index], self.min_delay)
+
+    def stats(self):
+        delay = self.delay()
+        return {
+            'percentile': self.percentile,
+            'samples': len(self._latencies),
+            'delay_seconds': round(delay, 3) if delay is not None else None,
+        }
+
+
+def create_resilience_from_env():
+    """環境変数の設定から LLMClient に渡す breaker / retry / hedge を作成"""
+    breaker = None
+    if os.environ.get('LLM_CIRCUIT_BREAKER', 'on').lower() == 'on':
+        breaker = CircuitBreaker(
+            failure_threshold=int(os.environ.get('LLM_CIRCUIT_FAILURES', '5')),
+            reset_timeout=float(os.environ.get('LLM_CIRCUIT_RESET_TIMEOUT', '30')),
+        )
+    retry = None
+    max_attempts = int(os.environ.get('LLM_RETRY_ATTEMPTS', '2'))
+    if max_attempts > 1:
+        retry = RetryPolicy(
+            max_attempts=max_attempts,
+            base_delay=float(os.environ.get('LLM_RETRY_BASE_DELAY', '0.2')),
+            max_delay=float(os.environ.get('LLM_RETRY_MAX_DELAY', '2')),
+        )
+    hedge = None
+    if os.environ.get('LLM_HEDGE', 'off').lower() == 'on':
+        hedge = HedgePolicy(
+            percentile=float(os.environ.get('LLM_HEDGE_PERCENTILE', '0.95')),
+            min_delay=float(os.environ.get('LLM_HEDGE_MIN_DELAY', '0.5')),
+        )
+    return {'breaker': breaker, 'retry': retry, 'hedge': hedge}
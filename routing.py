@@ -0,0 +1,175 @@
+"""AI生成とルールベースの振り分け
+
+以前は AI_GENERATION_RATE の固定確率で振り分けていたため、利用の多い日は午前中で
+1日のAI使用回数を使い切り、少ない日は夜になっても枠が余っていた。
+ここでは次の値から、キャッシュにないリクエストをAIで生成する確率をその都度決める。
+
+- クォータの消化ペース: 「残り回数の割合 ÷ 今日の残り時間の割合」。予定より使いすぎていれば
+  確率を下げ、余っていれば上げる（クォータは全ワーカー共有なのでワーカー数に依存しない）
+- 直近のGemini呼び出しのエラー率と平均レイテンシ（LLMClient の observer から受け取る）
+- LLMClient の同時実行数の空きと、サーキットブレーカーの状態
+
+キャッシュ（事前生成・完全一致・類似）で返せるリクエストはここに来る前に返るので、
+キャッシュの効きがよい時間帯ほど、同じ枠でAIに回せるリクエストの割合が増える。
+"""
+import os
+import random
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def day_remaining_fraction(now=None):
+    """今日の残り時間の割合（0〜1）"""
+    now = now or datetime.now()
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - now).total_seconds() / SECONDS_PER_DAY
+
+
+class AdaptiveRouter:
+    """AIで生成するかどうかを決める
+
+    quota_stats: ai_quota.stats() を返す関数
+    llm_capacity: (実行中の数, 同時実行数の上限) を返す関数
+    circuit_open: 上流の呼び出しを止めているかを返す関数（省略可）
+    cache_counts: キャッシュの (ヒット数, ミス数) の累計を返す関数（統計表示用、省略可）
+    base_rate: 消化ペースが予定どおりのときのAI生成の確率（AI_GENERATION_RATE）
+    max_rate: 確率の上限
+    """
+
+    def __init__(self, quota_stats, llm_capacity, circuit_open=None, cache_counts=None, base_rate=0.7,
+                 max_rate=1.0, window=300.0, min_samples=5, error_threshold=0.5, slow_latency=10.0,
+                 probe_rate=0.05, refresh_interval=1.0, enabled=True):
+        self.quota_stats = quota_stats
+        self.llm_capacity = llm_capacity
+        self.circuit_open = circuit_open
+        self.cache_counts = cache_counts
+        self.base_rate = base_rate
+        self.max_rate = max_rate
+        self.window = window
+        self.min_samples = min_samples
+        self.error_threshold = error_threshold
+        self.slow_latency = slow_latency
+        self.probe_rate = probe_rate
+        self.refresh_interval = refresh_interval
+        self.enabled = enabled
+        self._calls = deque(maxlen=500)  # (時刻, 成功したか, 秒数)
+        self._lock = threading.Lock()
+        self._signals = None
+        self._signals_at = 0.0
+        self._last_cache_counts = (0, 0)
+        self.decisions = Counter()
+
+    def observe(self, outcome, seconds):
+        """Gemini呼び出しの結果を記録（混雑や障害中で呼ばなかった分は数えない）"""
+        if outcome in ('overloaded', 'circuit_open'):
+            return
+        with self._lock:
+            self._calls.append((time.monotonic(), outcome == 'ok', seconds))
+
+    def _upstream(self):
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            while self._calls and self._calls[0][0] < cutoff:
+                self._calls.popleft()
+            calls = list(self._calls)
+        if not calls:
+            return 0, 0.0, 0.0
+        errors = sum(1 for _, ok, _ in calls if not ok)
+        latency = sum(seconds for _, ok, seconds in calls if ok) / max(len(calls) - errors, 1)
+        return len(calls), errors / len(calls), latency
+
+    def signals(self):
+        """判定に使う値（クォータの参照を減らすため refresh_interval 秒ごとに計算）"""
+        now = time.monotonic()
+        if self._signals is not None and now - self._signals_at < self.refresh_interval:
+            return self._signals
+        quota = self.quota_stats()
+        samples, error_rate, latency = self._upstream()
+        remaining_fraction = quota['remaining'] / quota['limit'] if quota['limit'] else 0.0
+        time_fraction = day_remaining_fraction()
+        self._signals = {
+            'quota_remaining': quota['remaining'],
+            'quota_remaining_fraction': round(remaining_fraction, 4),
+            'day_remaining_fraction': round(time_fraction, 4),
+            'quota_pace': round(remaining_fraction / max(time_fraction, 1e-3), 4),
+            'upstream_samples': samples,
+            'upstream_error_rate': round(error_rate, 4),
+            'upstream_latency': round(latency, 3),
+        }
+        if self.cache_counts is not None:
+            self._signals['cache_hit_rate'] = self._cache_hit_rate()
+        self._signals_at = now
+        return self._signals
+
+    def _cache_hit_rate(self):
+        # 前回の計算以降に増えた分のヒット率（累計だと直近の変化が見えない）
+        hits, misses = self.cache_counts()
+        last_hits, last_misses = self._last_cache_counts
+        self._last_cache_counts = (hits, misses)
+        lookups = (hits - last_hits) + (misses - last_misses)
+        return round((hits - last_hits) / lookups, 4) if lookups > 0 else None
+
+    def probability(self):
+        """AIで生成する確率と、その理由"""
+        if not self.enabled:
+            return self.base_rate, 'fixed_rate'
+        signals = self.signals()
+        if signals['quota_remaining'] <= 0:
+            return 0.0, 'quota_exhausted'
+        if self.circuit_open is not None and self.circuit_open():
+            return 0.0, 'circuit_open'
+        in_flight, max_concurrency = self.llm_capacity()
+        if in_flight >= max_concurrency:
+            return 0.0, 'saturated'
+        if signals['upstream_samples'] >= self.min_samples and signals['upstream_error_rate'] >= self.error_threshold:
+            # 回復を検知できるよう、ごく一部だけ試す
+            return self.probe_rate, 'upstream_errors'
+
+        rate = self.base_rate * signals['quota_pace']
+        reason = 'quota_ahead' if signals['quota_pace'] > 1 else 'quota_pacing'
+        if signals['upstream_latency'] > self.slow_latency:
+            # 遅いときは待たせる人数を減らす（遅いほど下げ、最低でも2割は残す）
+            rate *= max(self.slow_latency / signals['upstream_latency'], 0.2)
+            reason = 'upstream_slow'
+        return min(rate, self.max_rate), reason
+
+    def decide(self):
+        """AIで生成するか判定し、(AIを使うか, 理由) を返す"""
+        probability, reason = self.probability()
+        use_ai = random.random() < probability
+        with self._lock:
+            self.decisions[(('ai' if use_ai else 'rule_based'), reason)] += 1
+        return use_ai, reason
+
+    def stats(self):
+        """/api/stats 用の統計情報"""
+        probability, reason = self.probability()
+        with self._lock:
+            decisions = {f'{route}:{reason}': count for (route, reason), count in self.decisions.items()}
+        return {
+            'mode': 'adaptive' if self.enabled else 'fixed',
+            'ai_probability': round(probability, 4),
+            'reason': reason,
+            'signals': self.signals() if self.enabled else None,
+            'decisions': decisions,
+        }
+
+
+def create_router_from_env(quota_stats, llm_capacity, circuit_open=None, cache_counts=None, base_rate=0.7,
+                           llm_timeout=20.0):
+    """環境変数の設定から振り分けを作成（AI_ROUTING_MODE=fixed なら base_rate の固定確率）"""
+    return AdaptiveRouter(
+        quota_stats,
+        llm_capacity,
+        circuit_open=circuit_open,
+        cache_counts=cache_counts,
+        base_rate=base_rate,
+        max_rate=float(os.environ.get('AI_ROUTING_MAX_RATE', '1.0')),
+        window=float(os.environ.get('AI_ROUTING_WINDOW', '300')),
+        slow_latency=float(os.environ.get('AI_ROUTING_SLOW_LATENCY', str(llm_timeout / 2))),
+        enabled=os.environ.get('AI_ROUTING_MODE', 'adaptive').lower() != 'fixed',
+    )
@@ -0,0 +1,256 @@
+"""サーバーサイドのセッションストア
+
+Flask標準の署名付きCookieセッションでは、レシピ履歴やAI Chefとの会話が
+毎回Cookieに載り、数回の会話で4KBの上限を超えてしまう。
+ここではセッションの中身をSQLiteに保存し、Cookieにはランダムなセッションidだけを置く。
+
+- 読み込みはプロセス内のLRU（短いTTL付き）を先に見るので、同じワーカーへの
+  連続したリクエストではストアを読まない
+- 書き込みはセッションが変更された場合だけ
+- 保存前に履歴を件数上限で切り詰め、古い会話やフィードバックを圧縮する
+"""
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# 履歴ごとの保持件数の上限
+SESSION_HISTORY_LIMITS = {
+    'recipe_history': 20,
+    'ai_conversation': 10,
+    'feedback_history': 20,
+}
+
+# 会話履歴のうち全文を残す件数（プロンプトに全文で入れるのは直近の往復で、それより前は全文のうちに要約する）
+FULL_CONVERSATION_TURNS = 3
+COMPACT_TEXT_LENGTH = 200
+
+# フィードバックの recipe_data で残すキー
+FEEDBACK_RECIPE_KEYS = ('mood', 'generation_method', 'recipe_name', 'ingredients')
+
+
+def _serialize(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def _truncate(text, length=COMPACT_TEXT_LENGTH):
+    if isinstance(text, str) and len(text) > length:
+        return text[:length] + '…'
+    return text
+
+
+def compact_session(data):
+    """保存前に履歴を上限件数に切り詰め、古いエントリを縮める"""
+    for key, limit in SESSION_HISTORY_LIMITS.items():
+        history = data.get(key)
+        if isinstance(history, list) and len(history) > limit:
+            data[key] = history[-limit:]
+
+    conversation = data.get('ai_conversation')
+    if isinstance(conversation, list):
+        for turn in conversation[:-FULL_CONVERSATION_TURNS]:
+            if isinstance(turn, dict):
+                turn['ai'] = _truncate(turn.get('ai'))
+
+    for feedback in data.get('feedback_history') or []:
+        if isinstance(feedback, dict) and isinstance(feedback.get('recipe_data'), dict):
+            recipe_data = feedback['recipe_data']
+            feedback['recipe_data'] = {k: recipe_data[k] for k in FEEDBACK_RECIPE_KEYS if k in recipe_data}
+            feedback['text'] = _truncate(feedback.get('text'))
+    return data
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """中身をサーバー側に保存するセッション"""
+
+    def __init__(self, initial=None, sid=None, new=False, serialized=None):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        # 読み込み時の内容（リスト内の追記など、変更検知で拾えない更新の判定に使う）
+        self.serialized = serialized
+
+
+class SqliteSessionStore:
+    """SQLiteにセッションを保存するストア"""
+
+    def __init__(self, path, cleanup_interval=500):
+        self.path = path
+        self.cleanup_interval = cleanup_interval
+        self._writes = 0
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            ' sid TEXT PRIMARY KEY,'
+            ' data TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL)'
+        )
+
+    def _connect(self):
+        # sqlite3の接続はスレッド間で共有できないためスレッドごとに持つ
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        """シリアライズ済みのセッション内容を返す（なければ None）"""
+        row = self._connect().execute(
+            'SELECT data, expires_at FROM sessions WHERE sid = ?', (sid,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def set(self, sid, serialized, ttl):
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+            (sid, serialized, time.time() + ttl)
+        )
+        # 期限切れのセッションはたまにまとめて削除
+        self._writes += 1
+        if self._writes % self.cleanup_interval == 0:
+            conn.execute('DELETE FROM sessions WHERE expires_at < ?', (time.time(),))
+
+    def delete(self, sid):
+        self._connect().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+
+class CachedSessionStore:
+    """ストアの前にプロセス内LRUを置く
+
+    別のワーカーが更新したセッションを古いまま使い続けないよう、LRUの内容は
+    memory_ttl 秒だけ有効にする。
+    """
+
+    def __init__(self, store, max_entries=1024, memory_ttl=2.0):
+        self.store = store
+        self.max_entries = max_entries
+        self.memory_ttl = memory_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_reads = 0
+
+    def get(self, sid):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(sid)
+                self.memory_hits += 1
+                return entry[0]
+        self.store_reads += 1
+        serialized = self.store.get(sid)
+        if serialized is not None:
+            self._remember(sid, serialized)
+        return serialized
+
+    def set(self, sid, serialized, ttl):
+        self.store.set(sid, serialized, ttl)
+        self._remember(sid, serialized)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+        self.store.delete(sid)
+
+    def _remember(self, sid, serialized):
+        # 呼び出し側での変更が混ざらないよう、シリアライズした形で持つ
+        with self._lock:
+            self._entries[sid] = (serialized, time.monotonic() + self.memory_ttl)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            'memory_entries': len(self._entries),
+            'memory_hits': self.memory_hits,
+            'store_reads': self.store_reads,
+        }
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Cookieにセッションidだけを置くセッションインターフェース"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def _ttl(self, app):
+        return int(app.permanent_session_lifetime.total_seconds())
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            serialized = self.store.get(sid)
+            if serialized is not None:
+                return ServerSideSession(json.loads(serialized), sid=sid, serialized=serialized)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        self.persist(app, session)
+
+        # Cookieはidが新しいときだけ送る（中身が変わってもCookieは変わらない）
+        if session.new or (session.permanent and app.config['SESSION_REFRESH_EACH_REQUEST']):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+    def persist(self, app, session):
+        """内容が変わっていればストアに書き込む（レスポンス送信後の更新にも使う）"""
+        serialized = _serialize(compact_session(dict(session)))
+        if serialized != session.serialized:
+            self.store.set(session.sid, serialized, self._ttl(app))
+            session.serialized = serialized
+        session.modified = False
+
+
+def init_session_store(app):
+    """環境変数の設定に応じてサーバーサイドセッションを有効にする（SESSION_BACKEND: sqlite / cookie）"""
+    backend = os.environ.get('SESSION_BACKEND', 'sqlite').lower()
+    if backend != 'sqlite':
+        return None
+    path = os.environ.get('SESSION_STORE_PATH', os.path.join('instance', 'sessions.sqlite3'))
+    store = CachedSessionStore(
+        SqliteSessionStore(path),
+        max_entries=int(os.environ.get('SESSION_MEMORY_ENTRIES', '1024')),
+        memory_ttl=float(os.environ.get('SESSION_MEMORY_TTL', '2')),
+    )
+    app.session_interface = ServerSideSessionInterface(store)
+    return store
@@ -0,0 +1,258 @@
+"""似た条件のAIレシピを再利用する類似キャッシュ
+
+完全一致のキャッシュでは「お米・卵・玉ねぎ」と「お米・卵・玉ねぎ・レモン」は別物になり、
+保存済みのレシピで十分な場合でもAIを呼んでしまう。ここでは各リクエストを
+
+- 気分の one-hot（11次元）
+- 食材の multi-hot（カタログの30次元）
+- 追加の要望・好みの文字bigramをハッシュした値（CONTEXT_DIM 次元）
+
+をつないで正規化したベクトルにし、保存済みの全ベクトルとの内積（コサイン類似度）を
+NumPyの1回の行列積で計算して、しきい値以上で最も近いレシピを返す。気分が違うものは使わない。
+
+ベクトルは固定容量のメモリマップファイル（.npy）に置くので、全ワーカーが同じページを共有し、
+プロセスごとにコピーを持たない。レシピ本文と書き込みの排他はSQLiteで管理する。
+容量を超えたら古い行から上書きする。上書き中の行を読み手が古いレシピと組み合わせないよう、
+各行に世代番号を付け、ベクトル側とSQLite側の世代が一致した場合だけ使う。serializer を渡すとレシピはバイト列にして保存する。
+ユーザーの好みを渡した場合は、しきい値を超えた行のうち食材の親和度が高いものを優先する。
+"""
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+from catalog import INGREDIENT_INDEX, INGREDIENTS, MOOD_INDEX, MOODS
+
+CONTEXT_DIM = 64
+
+# 各部分の重み（要望が違うレシピは、食材が同じでもしきい値を下回るようにする）
+MOOD_WEIGHT = 1.0
+CONTEXT_WEIGHT = 2.0
+
+# しきい値を超えた行に加える、好みによる加点の最大値
+PREFERENCE_WEIGHT = 0.05
+
+VECTOR_DIM = len(MOODS) + len(INGREDIENTS) + CONTEXT_DIM
+_INGREDIENT_OFFSET = len(MOODS)
+_CONTEXT_OFFSET = len(MOODS) + len(INGREDIENTS)
+
+_SEPARATORS = re.compile(r'[\s、。,.!?！？・/]+')
+
+
+def context_terms(text):
+    """要望・好みの文字列を語の集合にする（日本語は分かち書きせず文字bigramを使う）"""
+    terms = set()
+    for chunk in _SEPARATORS.split(text.lower()):
+        if len(chunk) == 1:
+            terms.add(chunk)
+        terms.update(chunk[i:i + 2] for i in range(len(chunk) - 1))
+    return terms
+
+
+def encode_request(np, mood, ingredients, context="", user_preferences=""):
+    """リクエストを正規化済みのベクトルにする（気分がカタログにない場合は None）"""
+    if mood not in MOOD_INDEX:
+        return None
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    vector[MOOD_INDEX[mood]] = MOOD_WEIGHT
+    for ingredient in ingredients:
+        index = INGREDIENT_INDEX.get(ingredient)
+        if index is not None:
+            vector[_INGREDIENT_OFFSET + index] = 1.0
+
+    terms = context_terms(f"{context} {user_preferences}")
+    if terms:
+        context_vector = vector[_CONTEXT_OFFSET:]
+        for term in terms:
+            # hash() はプロセスごとに値が変わるので、全ワーカーで同じになる crc32 を使う
+            context_vector[zlib.crc32(term.encode('utf-8')) % CONTEXT_DIM] += 1.0
+        context_vector *= CONTEXT_WEIGHT / np.linalg.norm(context_vector)
+
+    return vector / np.linalg.norm(vector)
+
+
+class SimilarityCache:
+    """メモリマップしたベクトル行列とSQLiteのレシピ本文による類似キャッシュ"""
+
+    def __init__(self, directory, capacity=4096, threshold=0.88, serializer=None):
+        import numpy as np  # 任意依存（類似キャッシュを使う場合のみ必要）
+
+        self.np = np
+        self.directory = directory
+        self.capacity = capacity
+        self.threshold = threshold
+        self.serializer = serializer
+        self._local = threading.local()
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = os.path.join(directory, 'similarity.sqlite3')
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS similarity_recipes ('
+                ' slot INTEGER PRIMARY KEY,'
+                ' cache_key TEXT NOT NULL,'
+                ' generation INTEGER NOT NULL,'
+                ' recipe TEXT NOT NULL)'
+            )
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(similarity_recipes)')}
+            if 'generation' not in columns:
+                raise ValueError(f'類似キャッシュのテーブル形式が異なります: {sorted(columns)}')
+            # ファイルの作成は最初の1プロセスだけが行い、以降は開くだけ
+            self.vectors = self._open_array('vectors.npy', (capacity, VECTOR_DIM), np.float32)
+            self.moods = self._open_array('moods.npy', (capacity,), np.int16)
+            # 各行の世代番号（書き込み順の通し番号 + 1。0 は空きか書き込み中）
+            self.generations = self._open_array('generations.npy', (capacity,), np.int64)
+            # [0]: これまでに書き込んだ行数（容量を超えると先頭から上書き）
+            self.header = self._open_array('header.npy', (1,), np.int64)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if self.vectors.shape != (capacity, VECTOR_DIM):
+            raise ValueError(f'類似キャッシュのファイル形式が異なります: {self.vectors.shape}')
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+
+    def _open_array(self, name, shape, dtype):
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            return self.np.load(path, mmap_mode='r+')
+        array = self.np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+        array.flush()
+        return array
+
+    def _connect(self):
+        # sqlite3の接続はスレッド間で共有できないためスレッドごとに持つ
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return int(min(self.header[0], self.capacity))
+
+    def lookup(self, mood, ingredients, context="", user_preferences="", preferences=None):
+        """しきい値以上で最も近い保存済みレシピを (レシピ, 類似度) で返す（なければ None）
+
+        preferences（preferences.PreferenceVector）を渡すと、しきい値を超えた行を好みで並べ替える。
+        """
+        try:
+            query = encode_request(self.np, mood, ingredients, context, user_preferences)
+            count = len(self)
+            if query is None or count == 0:
+                self.misses += 1
+                return None
+            # 類似度を計算する前の世代を控えておき、レシピを読んだ後に変わっていないか確かめる
+            generations = self.generations[:count].copy()
+
+            # 全行との類似度を1回の行列積で計算し、気分が違う行は除外する
+            similarities = self.vectors[:count] @ query
+            similarities[self.moods[:count] != MOOD_INDEX[mood]] = -1.0
+            slot = int(similarities.argmax())
+            similarity = float(similarities[slot])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+            if preferences:
+                slot = self._rerank(similarities, count, preferences)
+                similarity = float(similarities[slot])
+
+            row = self._connect().execute(
+                'SELECT generation, recipe FROM similarity_recipes WHERE slot = ?', (slot,)
+            ).fetchone()
+            # 読んでいる間に行が上書きされた場合、ベクトルとレシピが別のリクエストのものになりうる
+            generation = int(generations[slot])
+            if (row is None or generation == 0 or row[0] != generation
+                    or int(self.generations[slot]) != generation):
+                self.misses += 1
+                return None
+            self.hits += 1
+            recipe = self.serializer.loads(row[1]) if self.serializer is not None else row[1]
+            return recipe, similarity
+        except Exception as e:
+            self.errors += 1
+            print(f"類似キャッシュ参照エラー: {e}")
+            return None
+
+    def _rerank(self, similarities, count, preferences):
+        candidates = self.np.flatnonzero(similarities >= self.threshold)
+        affinities = self.np.asarray(preferences.ingredient_affinities(), dtype=self.np.float32)
+        # 保存済みベクトルの食材部分（正規化済みの multi-hot）と親和度の内積を加点にする
+        bonus = self.vectors[candidates, _INGREDIENT_OFFSET:_CONTEXT_OFFSET] @ affinities
+        return int(candidates[(similarities[candidates] + PREFERENCE_WEIGHT * bonus).argmax()])
+
+    def add(self, cache_key, mood, ingredients, recipe, context="", user_preferences=""):
+        """生成したレシピを保存（他のワーカーからもすぐに参照できる）"""
+        try:
+            vector = encode_request(self.np, mood, ingredients, context, user_preferences)
+            if vector is None:
+                return
+            if self.serializer is not None:
+                recipe = self.serializer.dumps(recipe)
+            conn = self._connect()
+            # 行の割り当てと書き込みはSQLiteのロックで全プロセス間で直列化する
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                written = int(self.header[0])
+                slot = written % self.capacity
+                # 上書きする行は先に無効にしてから書き換える（読み手は世代 0 の行を使わない）
+                self.generations[slot] = 0
+                self.vectors[slot] = vector
+                self.moods[slot] = MOOD_INDEX[mood]
+                conn.execute(
+                    'INSERT OR REPLACE INTO similarity_recipes (slot, cache_key, generation, recipe)'
+                    ' VALUES (?, ?, ?, ?)',
+                    (slot, cache_key, written + 1, recipe)
+                )
+                # 行の中身を書き終えてから世代と件数を進める。コミット前に世代を見た読み手は
+                # SQLite側の古い行と世代が合わないので、その参照は使わずミスとして扱う
+                self.generations[slot] = written + 1
+                self.header[0] = written + 1
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            self.stores += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"類似キャッシュ保存エラー: {e}")
+
+    def stats(self):
+        return {
+            'entries': len(self),
+            'capacity': self.capacity,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'errors': self.errors,
+        }
+
+
+def create_similarity_cache_from_env(serializer=None):
+    """環境変数の設定から類似キャッシュを作成（AI_SIMILARITY_CACHE=off やNumPyがない場合は None）"""
+    if os.environ.get('AI_SIMILARITY_CACHE', 'on').lower() != 'on':
+        return None
+    try:
+        return SimilarityCache(
+            os.environ.get('AI_SIMILARITY_CACHE_DIR', os.path.join('instance', 'similarity_cache')),
+            capacity=int(os.environ.get('AI_SIMILARITY_CACHE_CAPACITY', '4096')),
+            threshold=float(os.environ.get('AI_SIMILARITY_THRESHOLD', '0.88')),
+            serializer=serializer,
+        )
+    except ImportError:
+        print("警告: NumPyがインストールされていないため、類似キャッシュは無効です。")
+        return None
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"類似キャッシュの初期化エラー: {e}")
+        return None
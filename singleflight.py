@@ -0,0 +1,247 @@
+"""同一リクエストの重複生成をまとめる（single-flight）
+
+同じキーのAI生成が同時に複数来た場合、最初の1件（リーダー）だけが上流を呼び、
+残りはその結果を待って共有する。
+
+- プロセス内: スレッド間でまとめる（既定）
+- プロセス間: SQLiteのリース（一定時間で失効する排他ロック）で他のワーカーの
+  生成中を検知し、共有キャッシュ（RECIPE_CACHE_BACKEND=sqlite）に結果が
+  書かれるのを待つ（キャッシュが共有でなければプロセス内にする）
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class _Call:
+    """実行中の1件の呼び出し"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SqliteLease:
+    """SQLiteを使ったワーカー間のリース"""
+
+    def __init__(self, path, lookup, ttl=30.0, poll_interval=0.1):
+        self.path = path
+        self.lookup = lookup
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.owner = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._local = threading.local()
+        self.remote_shared = 0
+        self.remote_waits = 0
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS singleflight_lease ('
+            ' key TEXT PRIMARY KEY,'
+            ' owner TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL)'
+        )
+
+    def _connect(self):
+        # sqlite3の接続はスレッド間で共有できないためスレッドごとに持つ
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _acquire(self, key):
+        conn = self._connect()
+        now = time.time()
+        conn.execute('DELETE FROM singleflight_lease WHERE key = ? AND expires_at < ?', (key, now))
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO singleflight_lease (key, owner, expires_at) VALUES (?, ?, ?)',
+            (key, self.owner, now + self.ttl)
+        )
+        return cursor.rowcount == 1
+
+    def _release(self, key):
+        self._connect().execute('DELETE FROM singleflight_lease WHERE key = ? AND owner = ?', (key, self.owner))
+
+    def _held(self, key):
+        row = self._connect().execute(
+            'SELECT 1 FROM singleflight_lease WHERE key = ? AND expires_at >= ?', (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def run(self, key, fn):
+        """リースを取れたら fn を実行し、取れなければ他ワーカーの結果を待つ
+
+        (結果, 他ワーカーの結果を共有したか) のタプルを返す。
+        """
+        if self._acquire(key):
+            try:
+                return fn(), False
+            finally:
+                self._release(key)
+
+        # 他のワーカーが生成中なので、共有キャッシュに結果が入るのを待つ
+        self.remote_waits += 1
+        deadline = time.monotonic() + self.ttl
+        while time.monotonic() < deadline:
+            result = self.lookup(key)
+            if result is not None:
+                self.remote_shared += 1
+                return result, True
+            if not self._held(key):
+                break
+            time.sleep(self.poll_interval)
+
+        result = self.lookup(key)
+        if result is not None:
+            self.remote_shared += 1
+            return result, True
+        # 相手が失敗した・時間切れの場合は自分で生成する
+        return fn(), False
+
+
+class SingleFlight:
+    """同じキーの同時呼び出しを1回の実行にまとめる"""
+
+    def __init__(self, lease=None, wait_timeout=None):
+        self.lease = lease
+        self.wait_timeout = wait_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        """fn() の結果を返す。(結果, 他の呼び出しの結果を共有したか) のタプル"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            if not call.done.wait(self.wait_timeout):
+                raise TimeoutError('同じリクエストの生成結果を待つ間にタイムアウトしました')
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            shared = False
+            if self.lease is not None:
+                call.result, shared = self.lease.run(key, fn)
+            else:
+                call.result = fn()
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def do_many(self, keys, fn):
+        """複数のキーを1回の fn でまとめて実行する（まとめ生成用）
+
+        fn(自分が実行するキーのリスト) は {キー: 結果} を返す（結果がないキーは失敗扱い）。
+        同じキーを他の呼び出しが実行中ならその結果を待って共有し、fn には含めない。
+        ワーカー間のリースを取れなかったキーは do と同じく他ワーカーの結果を待ち、
+        得られなければ fn([キー]) で単独で実行する。
+        戻り値は {キー: (結果, 他の呼び出しの結果を共有したか)}。
+        """
+        own, waiting = {}, {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                call = self._calls.get(key)
+                if call is None:
+                    call = _Call()
+                    self._calls[key] = call
+                    self.leaders += 1
+                    own[key] = call
+                else:
+                    self.shared += 1
+                    waiting[key] = call
+
+        results = {}
+        try:
+            packed = list(own)
+            if self.lease is not None:
+                packed = [key for key in own if self.lease._acquire(key)]
+            try:
+                generated = fn(packed) if packed else {}
+            finally:
+                for key in packed if self.lease is not None else ():
+                    self.lease._release(key)
+            for key in packed:
+                own[key].result = generated.get(key)
+                results[key] = (own[key].result, False)
+            for key in own:
+                if key not in results:
+                    own[key].result, shared = self.lease.run(key, lambda key=key: fn([key]).get(key))
+                    results[key] = (own[key].result, shared)
+        except Exception as e:
+            for key, call in own.items():
+                if key not in results:
+                    call.error = e
+            raise
+        finally:
+            with self._lock:
+                for key in own:
+                    del self._calls[key]
+            for call in own.values():
+                call.done.set()
+
+        for key, call in waiting.items():
+            # 待ちきれない・相手が失敗した場合は結果なし（呼び出し側でフォールバックする）
+            if call.done.wait(self.wait_timeout) and call.error is None:
+                results[key] = (call.result, True)
+            else:
+                results[key] = (None, False)
+        return results
+
+    def stats(self):
+        """/api/stats 用の統計情報"""
+        remote_shared = self.lease.remote_shared if self.lease is not None else 0
+        return {
+            'mode': 'process' if self.lease is not None else 'thread',
+            'in_flight': len(self._calls),
+            'leaders': self.leaders,
+            'shared_in_process': self.shared,
+            'shared_across_workers': remote_shared,
+            'calls_saved': self.shared + remote_shared,
+        }
+
+
+def create_singleflight_from_env(cache):
+    """環境変数の設定から single-flight を作成（cache は結果を書き込む RecipeCache）
+
+    process モードは他のワーカーの結果を cache から読むので、cache がワーカー間で共有されている
+    （RECIPE_CACHE_BACKEND=sqlite）必要がある。共有されていなければ、待っても結果が見えないまま
+    リースの期限まで止まるだけなので、thread モードにする。
+    """
+    mode = os.environ.get('AI_SINGLEFLIGHT_MODE', 'thread').lower()
+    if mode == 'off':
+        return None
+    if mode == 'process' and not cache.shared:
+        print("AI_SINGLEFLIGHT_MODE=process には共有キャッシュ（RECIPE_CACHE_BACKEND=sqlite）が必要です。"
+              "プロセス内（thread）でまとめます")
+        mode = 'thread'
+    lease = None
+    if mode == 'process':
+        path = os.environ.get('AI_SINGLEFLIGHT_LEASE_PATH', os.path.join('instance', 'singleflight.sqlite3'))
+        ttl = float(os.environ.get('AI_SINGLEFLIGHT_LEASE_TTL', '30'))
+        # 待機中のポーリングはキャッシュのヒット率（メトリクス・AI振り分け）に数えない
+        lease = SqliteLease(path, cache.peek, ttl=ttl)
+    return SingleFlight(lease=lease)
@@ -0,0 +1,138 @@
+"""静的ファイルをメモリから配信するアセット登録
+
+アイコンやマニフェスト、トップページは起動後に変わらないので、リクエストのたびに
+ファイルの存在確認や読み込み・テンプレートの描画をしない。登録時に一度だけ読み込み、
+
+- 内容のハッシュから強いETag（圧縮形式ごとに別の値）
+- gzip版（brotliがあればbrotli版も）。圧縮しても小さくならない画像などは作らない
+- ハッシュ入りのファイル名（/assets/icon-256x256.<ハッシュ>.png）
+
+を用意しておく。If-None-Match が一致すれば本文なしの304を返す。ハッシュ入りのURLは内容が
+変われば別のURLになるので1年間・immutable でキャッシュさせ、従来のURLは短い期間のあと
+ETagで再検証させる。
+"""
+import gzip
+import hashlib
+import os
+from collections import namedtuple
+
+from flask import Response, request
+
+try:
+    import brotli  # 任意依存（あればbrotli版も用意する）
+except ImportError:
+    brotli = None
+
+ASSET_URL_PREFIX = '/assets/'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# 圧縮版を用意する形式
+COMPRESSIBLE_MIMETYPES = ('text/', 'application/json', 'application/manifest+json', 'application/javascript',
+                          'image/svg+xml')
+
+Asset = namedtuple('Asset', ['name', 'mimetype', 'digest', 'fingerprinted_name', 'bodies', 'cache_control'])
+
+
+def _fingerprinted_name(name, digest):
+    base, ext = os.path.splitext(name)
+    return f'{base}.{digest[:10]}{ext}'
+
+
+def _encodings(body, mimetype):
+    """{Content-Encoding（'' は無圧縮）: 本文} を作る"""
+    bodies = {'': body}
+    if not mimetype.startswith(COMPRESSIBLE_MIMETYPES):
+        return bodies
+    # mtime=0 にして、同じ内容なら全ワーカーで同じバイト列（同じETag）になるようにする
+    compressed = gzip.compress(body, compresslevel=9, mtime=0)
+    if len(compressed) < len(body):
+        bodies['gzip'] = compressed
+    if brotli is not None:
+        compressed = brotli.compress(body, quality=11)
+        if len(compressed) < len(body):
+            bodies['br'] = compressed
+    return bodies
+
+
+class AssetRegistry:
+    """起動時に登録した静的ファイルをメモリから返す"""
+
+    def __init__(self, cache_control='public, max-age=3600'):
+        self.cache_control = cache_control
+        self._assets = {}
+        self._fingerprinted = {}
+        self.not_modified = 0
+        self.served = 0
+
+    def add_bytes(self, name, body, mimetype, cache_control=None):
+        """内容を登録（同じ名前なら置き換える）"""
+        digest = hashlib.sha256(body).hexdigest()
+        previous = self._assets.get(name)
+        if previous is not None:
+            self._fingerprinted.pop(previous.fingerprinted_name, None)
+        asset = Asset(name, mimetype, digest, _fingerprinted_name(name, digest), _encodings(body, mimetype),
+                      cache_control or self.cache_control)
+        self._assets[name] = asset
+        self._fingerprinted[asset.fingerprinted_name] = asset
+        return asset
+
+    def add_file(self, name, path, mimetype, cache_control=None):
+        """ファイルを読み込んで登録（読めなければ None）"""
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+        except OSError as e:
+            print(f"静的ファイルの読み込みエラー: {e}")
+            return None
+        return self.add_bytes(name, body, mimetype, cache_control)
+
+    def get(self, name):
+        return self._assets.get(name)
+
+    def url(self, name):
+        """ハッシュ入りのURL（未登録なら従来のURL）"""
+        asset = self._assets.get(name)
+        if asset is None:
+            return f'/{name}'
+        return ASSET_URL_PREFIX + asset.fingerprinted_name
+
+    def response(self, name):
+        """従来のURL向けのレスポンス（未登録なら None）"""
+        asset = self._assets.get(name)
+        return self._respond(asset, asset.cache_control) if asset is not None else None
+
+    def fingerprinted_response(self, fingerprinted_name):
+        """ハッシュ入りのURL向けのレスポンス（未登録なら None）"""
+        asset = self._fingerprinted.get(fingerprinted_name)
+        return self._respond(asset, IMMUTABLE_CACHE_CONTROL) if asset is not None else None
+
+    def _respond(self, asset, cache_control):
+        encoding = ''
+        for candidate in ('br', 'gzip'):
+            if candidate in asset.bodies and request.accept_encodings.quality(candidate) > 0:
+                encoding = candidate
+                break
+        etag = f'{asset.digest[:32]}-{encoding}' if encoding else asset.digest[:32]
+
+        if request.if_none_match.contains(etag):
+            self.not_modified += 1
+            response = Response(status=304)
+        else:
+            self.served += 1
+            response = Response(asset.bodies[encoding], mimetype=asset.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        if len(asset.bodies) > 1:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    def stats(self):
+        return {
+            'assets': len(self._assets),
+            'bytes': sum(len(asset.bodies['']) for asset in self._assets.values()),
+            'compressed_variants': sum(len(asset.bodies) - 1 for asset in self._assets.values()),
+            'served': self.served,
+            'not_modified': self.not_modified,
+        }
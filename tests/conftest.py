@@ -0,0 +1,31 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# リポジトリ直下のモジュール（quota.py など）を読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py が instance/ に作るファイルの置き場所（環境変数名: 一時ディレクトリ内の名前）
+APP_STATE_PATHS = {
+    'AI_QUOTA_PATH': 'ai_quota.sqlite3',
+    'RATE_LIMIT_PATH': 'rate_limit.sqlite3',
+    'RECIPE_CACHE_PATH': 'recipe_cache.sqlite3',
+    'RECIPE_CORPUS_PATH': 'recipe_corpus.sqlite3',
+    'SESSION_STORE_PATH': 'sessions.sqlite3',
+    'AI_SIMILARITY_CACHE_DIR': 'similarity_cache',
+    'AI_SINGLEFLIGHT_LEASE_PATH': 'singleflight.sqlite3',
+    'EVENT_LOG_DIR': 'events',
+    'JOB_QUEUE_PATH': 'jobs.sqlite3',
+    'PRECOMPUTED_RECIPES_PATH': 'precomputed_recipes.bin',
+}
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """リポジトリの instance/ を使わずに app.py を読み込む（テスト全体で1回）"""
+    directory = tmp_path_factory.mktemp('instance')
+    for name, filename in APP_STATE_PATHS.items():
+        os.environ.setdefault(name, str(directory / filename))
+    return importlib.import_module('app')
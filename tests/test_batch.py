@@ -0,0 +1,62 @@
+import pytest
+
+from benchmarks.fake_model import FakeGenerativeModel
+
+
+@pytest.fixture
+def fake_model(app_module, monkeypatch):
+    model = FakeGenerativeModel(latency=0, jitter=0, tokens_per_second=0)
+    monkeypatch.setattr(app_module, 'model', model)
+    monkeypatch.setattr(app_module.llm_client, 'model', model)
+    monkeypatch.setattr(app_module, 'AI_MODE_ENABLED', True)
+    return model
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def post_batch(client, requests, **extra):
+    return client.post('/api/recipes/batch', json={'requests': requests, **extra})
+
+
+def test_rejects_empty_or_oversized_batch(app_module, client, monkeypatch):
+    assert post_batch(client, []).status_code == 400
+    monkeypatch.setattr(app_module, 'BATCH_MAX_ITEMS', 2)
+    response = post_batch(client, [{'mood': 'happy'}] * 3)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_invalid_item_fails_alone(client):
+    response = post_batch(client, [{'mood': 'happy', 'ingredients': 'rice'}, {'mood': 'happy', 'ingredients': ['rice']}])
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['results'][0]['success'] is False
+    assert body['results'][1]['success'] is True
+    assert body['summary']['failed'] == 1
+
+
+def test_duplicates_share_one_packed_prompt(client, fake_model):
+    requests = [
+        {'mood': 'comfort', 'ingredients': ['udon', 'egg']},
+        {'mood': 'comfort', 'ingredients': ['soba', 'tofu']},
+        {'mood': 'comfort', 'ingredients': ['udon', 'egg']},
+        {'mood': 'comfort', 'ingredients': ['bread', 'cheese']},
+    ]
+    body = post_batch(client, requests, force_ai=True).get_json()
+    summary = body['summary']
+    assert (summary['total'], summary['unique'], summary['prompts']) == (4, 3, 1)
+    assert summary['ai_generated'] == 4
+    # 3件を1つのプロンプトにまとめて、上流は1回だけ呼ぶ
+    assert fake_model.calls == 1
+    results = body['results']
+    assert results[2]['duplicate_of'] == 0
+    assert results[2]['recipes'] == results[0]['recipes']
+    assert sum(result['ai_usage_consumed'] for result in results) == 3
+
+    # 同じバッチをもう一度送るとキャッシュから返す
+    body = post_batch(client, requests, force_ai=True).get_json()
+    assert body['summary']['cached'] == 4
+    assert fake_model.calls == 1
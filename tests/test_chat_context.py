@@ -0,0 +1,66 @@
+from benchmarks.fake_model import SAMPLE_RECIPE
+from chat_context import ChatContextManager, estimate_tokens, summarize_turn
+
+
+def turn(index, ai='短い回答です。続きの文。'):
+    return {'user': f'質問{index}', 'ai': ai, 'timestamp': f'2024-01-01T00:00:{index:02d}'}
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('親子丼') == 3
+    # 英数字は4文字で1トークン
+    assert estimate_tokens('abcd efgh i') == 3
+    assert estimate_tokens('卵 egg') == 2
+
+
+def test_summarize_turn_uses_recipe_name_or_first_sentence():
+    assert summarize_turn({'user': '夕飯は？', 'ai': SAMPLE_RECIPE}) == \
+        'ユーザー「夕飯は？」→ AI Chef: 「ふわとろ卵の親子丼」のレシピを提案'
+    assert summarize_turn({'user': 'コツは？', 'ai': '**弱火**で煮ます。卵は2回に分けます。'}) == \
+        'ユーザー「コツは？」→ AI Chef: 弱火で煮ます。'
+    assert summarize_turn({'user': '？', 'ai': ''}).endswith('（回答なし）')
+
+
+def test_summary_only_adds_turns_that_left_the_recent_window():
+    manager = ChatContextManager(recent_turns=1, summary_max_items=2)
+    history = [turn(1), turn(2)]
+    summary = manager.update_summary(history)
+    assert len(summary['items']) == 1 and summary['until'] == history[0]['timestamp']
+    # 新しい往復がなければ同じ要約を返す
+    assert manager.update_summary(history, summary) is summary
+
+    history += [turn(3), turn(4)]
+    summary = manager.update_summary(history, summary)
+    assert [item.split('」')[0] for item in summary['items']] == ['ユーザー「質問2', 'ユーザー「質問3']
+    assert manager.turns_summarized == 3
+
+
+def test_build_keeps_latest_turn_verbatim():
+    manager = ChatContextManager(token_budget=600, recent_turns=1)
+    history = [turn(1), turn(2, ai=SAMPLE_RECIPE)]
+    context = manager.build(history)
+    assert context.history_lines[0].startswith('これまでの会話の要約:\n- ユーザー「質問1」')
+    assert context.history_lines[1] == f'ユーザー: 質問2\nAI Chef: {SAMPLE_RECIPE}'
+    assert context.tokens <= 600
+
+
+def test_build_drops_oldest_summary_items_over_budget():
+    history = [turn(index) for index in range(1, 7)]
+    context = ChatContextManager(token_budget=60, recent_turns=1).build(history)
+    assert context.tokens <= 60
+    assert context.history_lines[0] == 'これまでの会話の要約:\n- ユーザー「質問5」→ AI Chef: 短い回答です。'
+    # 要約はセッションには全件残し、プロンプトに入れる分だけ減らす
+    assert len(context.summary['items']) == 5
+
+
+def test_build_truncates_latest_answer_over_budget():
+    history = [turn(index) for index in range(1, 6)] + [turn(6, ai='長い回答。' * 200)]
+    manager = ChatContextManager(token_budget=120, recent_turns=1)
+    context = manager.build(history)
+    assert context.tokens <= 120
+    assert len(context.history_lines) == 1
+    assert context.history_lines[0].startswith('ユーザー: 質問6\nAI Chef: 長い回答。')
+    assert context.history_lines[0].endswith('…（以下省略）')
+    assert manager.stats()['truncated'] == 1
+    assert manager.stats()['tokens_saved'] == context.original_tokens - context.tokens > 0
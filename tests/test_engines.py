@@ -0,0 +1,101 @@
+import pytest
+
+import engines
+from engines import AUTO, EngineResult, EngineRegistry, RecipeEngine, RecipeRequest, RuleBasedEngine
+from preferences import PreferenceVector
+
+REQUEST = RecipeRequest('happy', ['egg'], '', PreferenceVector())
+
+
+class StubEngine(RecipeEngine):
+    def __init__(self, name, cost, latency, uses_ai=False, available=True, result='レシピ', from_cache=False):
+        super().__init__(cost, latency)
+        self.name = name
+        self.uses_ai = uses_ai
+        self._available = available
+        self.result = result
+        self.from_cache = from_cache
+
+    def available(self):
+        return self._available
+
+    def generate(self, recipe_request):
+        return EngineResult(self.result, self.from_cache, None) if self.result else None
+
+
+def names(engines):
+    return [engine.name for engine in engines]
+
+
+@pytest.fixture
+def registry():
+    return EngineRegistry([
+        StubEngine('single_ai', cost=1, latency=3.0, uses_ai=True),
+        StubEngine('multi_ai', cost=1, latency=8.0, uses_ai=True),
+        StubEngine('corpus', cost=0, latency=0.005),
+        StubEngine('rule_based', cost=0, latency=0.001),
+    ])
+
+
+def test_auto_plan_without_ai_uses_local_engines(registry):
+    assert names(registry.plan(AUTO, use_ai=False)) == ['corpus', 'rule_based']
+
+
+def test_auto_plan_picks_one_ai_engine_within_latency_target(registry):
+    assert names(registry.plan(AUTO, use_ai=True)) == ['single_ai', 'corpus', 'rule_based']
+    assert names(registry.plan(AUTO, use_ai=True, latency_target=1.0)) == ['corpus', 'rule_based']
+    registry.get('single_ai')._available = False
+    assert names(registry.plan(AUTO, use_ai=True)) == ['multi_ai', 'corpus', 'rule_based']
+
+
+def test_cheaper_engine_comes_first(registry):
+    registry.get('multi_ai').cost = 0.5
+    assert names(registry.candidates(True)) == ['multi_ai', 'single_ai']
+
+
+def test_named_engine_goes_first_unless_unavailable(registry):
+    assert names(registry.plan('multi_ai')) == ['multi_ai', 'corpus', 'rule_based']
+    assert names(registry.plan('rule_based')) == ['rule_based', 'corpus']
+    registry.get('multi_ai')._available = False
+    assert names(registry.plan('multi_ai')) == ['corpus', 'rule_based']
+
+
+def test_fallbacks_ignore_target_when_nothing_meets_it(registry):
+    assert names(registry.fallbacks(latency_target=0.002)) == ['rule_based']
+    # 目標を満たすものがなければ速い順
+    assert names(registry.fallbacks(latency_target=0.0001)) == ['rule_based', 'corpus']
+
+
+def test_run_updates_latency_except_for_cached_results(monkeypatch):
+    clock = iter([0.0, 1.0, 10.0, 20.0, 30.0, 30.5])
+    monkeypatch.setattr(engines.time, 'perf_counter', lambda: next(clock))
+    engine = StubEngine('single_ai', cost=1, latency=3.0)
+    engine.run(REQUEST)
+    assert engine.latency == pytest.approx(3.0 + 0.2 * (1.0 - 3.0))
+    engine.from_cache = True
+    engine.run(REQUEST)
+    assert engine.latency == pytest.approx(2.6)
+    engine.result = None
+    assert engine.run(REQUEST) is None
+    assert engine.stats()['calls'] == 3 and engine.stats()['misses'] == 1
+
+
+def test_rule_based_engine_always_answers():
+    engine = RuleBasedEngine(lambda mood, ingredients: f'{mood}:{",".join(ingredients)}')
+    assert engine.run(REQUEST) == EngineResult('happy:egg', False, None)
+
+
+def test_recipes_endpoint_uses_requested_engine(app_module):
+    client = app_module.app.test_client()
+    response = client.post('/api/recipes', json={'mood': 'happy', 'ingredients': ['egg'], 'engine': 'rule_based'})
+    body = response.get_json()
+    assert body['engine'] == 'rule_based' and body['generation_method'] == 'rule_based'
+    response = client.post('/api/recipes', json={'mood': 'happy', 'ingredients': ['egg'], 'engine': 'fast'})
+    assert response.status_code == 400
+
+
+def test_multi_recipe_app_requires_selection(app_module):
+    app = app_module.create_app({'RECIPE_ENGINE': 'multi_ai', 'RECIPE_REQUIRE_SELECTION': True})
+    response = app.test_client().post('/api/recipes', json={'mood': 'happy', 'ingredients': []})
+    assert response.status_code == 400
+    assert app.config['RECIPE_ENGINE'] == 'multi_ai'
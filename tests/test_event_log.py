@@ -0,0 +1,77 @@
+import os
+import time
+
+import pytest
+
+from event_log import EventLog, aggregate_like_rates, read_events
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def segment_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.jsonl'))
+
+
+def test_invalid_fsync_policy(tmp_path):
+    with pytest.raises(ValueError):
+        EventLog(str(tmp_path), fsync='always')
+
+
+def test_events_are_written_in_batches(tmp_path):
+    log = EventLog(str(tmp_path), batch_size=3, flush_interval=60, fsync='off')
+    log.emit('recipe', mood='happy', method='ai')
+    log.emit('recipe', mood='tired', method='rule_based')
+    assert log.written == 0
+    # batch_size に達するとバックグラウンドのスレッドが書き出す
+    log.emit('feedback', mood='happy', feedback='like')
+    wait_until(lambda: log.written == 3)
+    events = list(read_events(str(tmp_path)))
+    assert [event['type'] for event in events] == ['recipe', 'recipe', 'feedback']
+    assert events[0]['mood'] == 'happy' and events[0]['ts'] > 0
+    assert log.stats()['batches'] == 1
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    log = EventLog(str(tmp_path), batch_size=100, flush_interval=60, max_pending=2, fsync='off')
+    for _ in range(5):
+        log.emit('recipe')
+    assert (log.emitted, log.dropped) == (2, 3)
+    log.flush()
+    assert len(list(read_events(str(tmp_path)))) == 2
+
+
+def test_large_segment_rotates_to_a_new_file(tmp_path):
+    log = EventLog(str(tmp_path), batch_size=1, flush_interval=60, segment_bytes=10, fsync='batch')
+    for index in range(3):
+        log._pending.append({'type': 'recipe', 'index': index})
+        log.flush()
+    assert len(segment_files(tmp_path)) == 3
+    assert [event['index'] for event in read_events(str(tmp_path))] == [0, 1, 2]
+
+
+def test_read_events_skips_partial_line(tmp_path):
+    (tmp_path / 'events-20240101-000000-1-0000.jsonl').write_text(
+        '{"type":"recipe"}\n{"type":"feed', encoding='utf-8')
+    (tmp_path / 'other.txt').write_text('{"type":"recipe"}\n', encoding='utf-8')
+    assert list(read_events(str(tmp_path))) == [{'type': 'recipe'}]
+
+
+def test_aggregate_like_rates():
+    events = [
+        {'type': 'recipe', 'method': 'ai'},
+        {'type': 'feedback', 'feedback': 'like', 'mood': 'happy', 'generation_method': 'ai',
+         'ingredients': ['egg', 'egg', 'rice']},
+        {'type': 'feedback', 'feedback': 'dislike', 'mood': 'happy', 'ingredients': ['egg']},
+        {'type': 'feedback', 'feedback': 'comment', 'mood': 'happy'},
+    ]
+    report = aggregate_like_rates(events)
+    assert report['recipes'] == {'ai': 1}
+    assert report['by_mood'] == {'happy': {'likes': 1, 'dislikes': 1, 'like_rate': 0.5}}
+    assert report['by_ingredient']['egg'] == {'likes': 1, 'dislikes': 1, 'like_rate': 0.5}
+    assert list(report['by_ingredient']) == ['egg', 'rice']
+    assert report['by_generation_method'] == {'ai': {'likes': 1, 'dislikes': 0, 'like_rate': 1.0}}
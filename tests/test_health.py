@@ -0,0 +1,34 @@
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def test_liveness_keeps_original_payload(client):
+    response = client.get('/health')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert set(body) == {'status', 'timestamp'}
+    assert body['status'] == 'healthy'
+    datetime.fromisoformat(body['timestamp'])
+
+
+def test_readiness_waits_for_model(app_module, client, monkeypatch):
+    class LoadingModel:
+        ready = False
+        error = None
+
+        def warm_up(self):
+            pass
+
+    monkeypatch.setattr(app_module, 'model', LoadingModel())
+    monkeypatch.setattr(app_module, 'AI_MODE_ENABLED', True)
+    response = client.get('/health/ready')
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+    # 準備中でも生存確認は200のまま
+    assert client.get('/health').status_code == 200
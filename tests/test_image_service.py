@@ -0,0 +1,69 @@
+import json
+
+from image_service import SAMPLE_IMAGE_URLS, ImageLibrary, create_image_library_from_env
+from static_assets import AssetRegistry
+
+
+def make_assets():
+    assets = AssetRegistry()
+    assets.add_bytes('icon.png', b'icon', 'image/png')
+    return assets
+
+
+def write_library(directory, records):
+    for record in records:
+        for filename in record['files'].values():
+            (directory / filename).write_bytes(filename.encode())
+    path = directory / 'library.json'
+    path.write_text(json.dumps(records, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+LIBRARY = [
+    {'name': 'oyakodon', 'title': '親子丼', 'keywords': ['親子丼', '丼'], 'ingredients': ['rice', 'egg', 'chicken'],
+     'moods': ['comfort'], 'files': {'256': 'oyakodon-256.jpg', '512': 'oyakodon-512.jpg'}},
+    {'name': 'salad', 'title': 'サラダ', 'keywords': ['サラダ'], 'ingredients': ['tomato', 'cucumber'],
+     'moods': ['light'], 'files': {'256': 'salad-256.jpg'}},
+]
+
+
+def test_missing_library_uses_sample_images(tmp_path):
+    library = ImageLibrary.load(str(tmp_path / 'missing.json'), make_assets(), 'icon.png', fallback_urls=SAMPLE_IMAGE_URLS)
+    match = library.lookup('親子丼', ['egg', 'rice'], 'happy')
+    assert match.entry is None and match.url in SAMPLE_IMAGE_URLS
+    # 同じ料理には同じ画像（食材の順番は区別しない）
+    assert library.lookup('親子丼', ['rice', 'egg'], 'happy').url == match.url
+    urls = {library.lookup(f'料理{i}', ['egg']).url for i in range(50)}
+    assert len(urls) > 1
+    assert library.stats()['fallbacks'] == 52
+
+
+def test_missing_library_without_samples_uses_placeholder(tmp_path):
+    assets = make_assets()
+    library = ImageLibrary.load(str(tmp_path / 'missing.json'), assets, 'icon.png')
+    assert library.lookup('親子丼', ['egg']).url == assets.url('icon.png')
+
+
+def test_library_match_and_placeholder(tmp_path):
+    assets = make_assets()
+    library = ImageLibrary.load(write_library(tmp_path, LIBRARY), assets, 'icon.png', fallback_urls=SAMPLE_IMAGE_URLS)
+    match = library.lookup('ふわとろ親子丼', ['egg'], 'comfort')
+    assert match.entry.name == 'oyakodon'
+    assert match.url == assets.url('images/oyakodon-512.jpg')
+    assert match.srcset.endswith('512w') and '256w' in match.srcset
+    assert library.lookup('サラダ', ['tomato']).entry.name == 'salad'
+    # 一覧があって合う画像がない場合は、サンプル画像ではなくプレースホルダー
+    assert library.lookup('カレー', ['beef']).url == assets.url('icon.png')
+
+
+def test_env_default_is_same_origin_placeholder(tmp_path, monkeypatch):
+    monkeypatch.delenv('IMAGE_FALLBACK', raising=False)
+    monkeypatch.setenv('IMAGE_LIBRARY_PATH', str(tmp_path / 'missing.json'))
+    assets = make_assets()
+    library = create_image_library_from_env(assets, str(tmp_path), placeholder='icon.png')
+    assert library.lookup('親子丼', ['egg']).url == assets.url('icon.png')
+
+    # サンプル画像は明示したときだけ使う
+    monkeypatch.setenv('IMAGE_FALLBACK', 'sample')
+    library = create_image_library_from_env(assets, str(tmp_path), placeholder='icon.png')
+    assert library.lookup('親子丼', ['egg']).url in SAMPLE_IMAGE_URLS
@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+import job_queue
+from job_queue import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobQueue, JobWorkerPool
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_queue.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.sqlite3'), abandon_after=30, lease_timeout=120, result_ttl=3600)
+
+
+def test_chat_lane_runs_before_bulk(queue, clock):
+    bulk, _ = queue.enqueue('recipe', {'n': 1}, lane='bulk')
+    clock.now += 1
+    chat, _ = queue.enqueue('recipe', {'n': 2}, lane='chat')
+    assert queue.get(bulk)['position'] == 1
+    assert queue.claim() == (chat, 'recipe', {'n': 2})
+    assert queue.claim()[0] == bulk
+    assert queue.claim() is None
+    with pytest.raises(ValueError):
+        queue.enqueue('recipe', {}, lane='urgent')
+
+
+def test_dedup_reuses_live_or_recent_jobs(queue, clock):
+    first, reused = queue.enqueue('recipe', {}, dedup_key='k')
+    assert not reused
+    assert queue.enqueue('recipe', {}, dedup_key='k') == (first, True)
+    # 種類が違えば別のジョブ
+    assert not queue.enqueue('chef', {}, dedup_key='k')[1]
+
+    job_id, _, _ = queue.claim()
+    assert job_id == first
+    queue.finish(first, result={'recipes': 'ok'})
+    clock.now += 3599
+    assert queue.enqueue('recipe', {}, dedup_key='k') == (first, True)
+    # 保持期間を過ぎた結果は使わない
+    clock.now += 2
+    assert queue.enqueue('recipe', {}, dedup_key='k')[0] != first
+    assert queue.stats()['deduplicated'] == 2
+
+
+def test_failed_job_is_not_reused(queue, clock):
+    first, _ = queue.enqueue('recipe', {}, dedup_key='k')
+    queue.claim()
+    queue.finish(first, error='失敗')
+    assert queue.get(first)['status'] == FAILED
+    assert queue.enqueue('recipe', {}, dedup_key='k')[0] != first
+
+
+def test_unpolled_job_is_abandoned(queue, clock):
+    stale, _ = queue.enqueue('recipe', {})
+    polled, _ = queue.enqueue('recipe', {})
+    clock.now += 20
+    queue.get(polled)
+    clock.now += 11
+    assert queue.claim()[0] == polled
+    assert queue.get(stale)['status'] == CANCELLED
+    assert queue.stats()['abandoned'] == 1
+
+
+def test_expired_lease_is_requeued(queue, clock):
+    job_id, _ = queue.enqueue('recipe', {})
+    assert queue.claim()[0] == job_id
+    clock.now += 60
+    queue.get(job_id)
+    assert queue.claim() is None
+    # 実行したプロセスが落ちてリースが切れたら、別のワーカーがやり直す
+    clock.now += 61
+    queue.get(job_id)
+    assert queue.claim()[0] == job_id
+    assert queue.get(job_id)['status'] == RUNNING
+
+
+def test_cancelled_job_keeps_cancelled_status(queue, clock):
+    job_id, _ = queue.enqueue('recipe', {})
+    queue.claim()
+    assert queue.cancel(job_id)
+    queue.finish(job_id, result={'recipes': 'late'})
+    job = queue.get(job_id)
+    assert job['status'] == CANCELLED and 'result' not in job
+    assert not queue.cancel(job_id)
+
+
+def test_purge_removes_old_finished_jobs(queue, clock):
+    done, _ = queue.enqueue('recipe', {})
+    queue.claim()
+    queue.finish(done, result={})
+    waiting, _ = queue.enqueue('recipe', {})
+    clock.now += 3601
+    queue.get(waiting)
+    assert queue.purge() == 1
+    assert queue.get(done) is None
+    assert queue.get(waiting)['status'] == QUEUED
+
+
+def test_worker_pool_runs_handlers(queue):
+    def fail(payload):
+        raise RuntimeError('生成に失敗しました')
+
+    pool = JobWorkerPool(queue, {'recipe': lambda payload: {'echo': payload['n']}, 'broken': fail},
+                         workers=1, poll_interval=0.05)
+    jobs = [queue.enqueue('recipe', {'n': 1})[0], queue.enqueue('broken', {})[0], queue.enqueue('unknown', {})[0]]
+    pool.start()
+    deadline = time.monotonic() + 2
+    while pool.completed + pool.failed < 3:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    results = [queue.get(job_id) for job_id in jobs]
+    assert results[0]['status'] == DONE and results[0]['result'] == {'echo': 1}
+    assert results[1]['status'] == FAILED and results[1]['error'] == '生成に失敗しました'
+    assert results[2]['status'] == FAILED
+    assert pool.stats() == {'workers': 1, 'completed': 1, 'failed': 2}
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from benchmarks.fake_model import FakeGenerativeModel, SAMPLE_RECIPE
+from llm_client import LLMClient, LLMOverloadedError, LLMTimeoutError, LLMUnavailableError
+
+
+def fake_model(latency, **kwargs):
+    return FakeGenerativeModel(latency=latency, jitter=0, tokens_per_second=0, **kwargs)
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_generate_returns_text():
+    client = LLMClient(fake_model(0))
+    assert client.generate('prompt') == SAMPLE_RECIPE.strip()
+    assert (client.calls, client.in_flight) == (1, 0)
+
+
+def test_missing_model_is_unavailable():
+    with pytest.raises(LLMUnavailableError):
+        LLMClient(None).generate('prompt')
+
+
+def test_deadline_returns_before_upstream_finishes():
+    client = LLMClient(fake_model(0.5), max_concurrency=1)
+    started = time.monotonic()
+    with pytest.raises(LLMTimeoutError):
+        client.generate('prompt', timeout=0.05)
+    assert time.monotonic() - started < 0.3
+    assert client.timeouts == 1
+    # 上流の呼び出しは続いているので、完了するまで実行枠は返らない
+    assert client.in_flight == 1
+    with pytest.raises(LLMOverloadedError):
+        client.generate('prompt')
+    wait_until(lambda: client.in_flight == 0)
+    assert client.generate('prompt', timeout=2.0)
+
+
+def test_stream_deadline():
+    client = LLMClient(fake_model(0.5))
+    with pytest.raises(LLMTimeoutError):
+        list(client.stream('prompt', timeout=0.05))
+    assert client.timeouts == 1
+
+
+def test_saturated_client_rejects_without_waiting():
+    client = LLMClient(fake_model(0.3), max_concurrency=2, acquire_timeout=0.01)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.generate('prompt'))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: client.in_flight == 2)
+
+    started = time.monotonic()
+    with pytest.raises(LLMOverloadedError):
+        client.generate('prompt')
+    assert time.monotonic() - started < 0.2
+    assert client.rejected == 1
+
+    for thread in threads:
+        thread.join()
+    assert len(results) == 2
+    assert client.in_flight == 0
+    assert client.stats()['rejected'] == 1
+
+
+def test_observer_records_outcomes():
+    events = []
+    client = LLMClient(fake_model(0.2), observer=lambda kind, outcome, *rest: events.append((kind, outcome)))
+    client.generate('prompt')
+    with pytest.raises(LLMTimeoutError):
+        client.generate('prompt', timeout=0.05)
+    assert events == [('generate', 'ok'), ('generate', 'timeout')]
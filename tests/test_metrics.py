@@ -0,0 +1,56 @@
+import os
+
+import metrics
+from metrics import ARCHIVE_NAME, MetricsRegistry, mark_process_dead
+
+
+def worker_registry(directory):
+    registry = MetricsRegistry(multiproc_dir=str(directory))
+    requests = registry.counter('requests_total', 'リクエスト数', ('route',))
+    latency = registry.histogram('latency_seconds', 'レイテンシ', buckets=(0.1, 1.0))
+    return registry, requests, latency
+
+
+def sample(text, line):
+    return [row for row in text.splitlines() if row.startswith(line + ' ')]
+
+
+def test_reused_pid_does_not_overwrite_previous_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics.os, 'getpid', lambda: 4242)
+    first, requests, _ = worker_registry(tmp_path)
+    requests.inc('/api')
+    first.flush()
+    # 同じPIDで起動した別のワーカー
+    second, requests, _ = worker_registry(tmp_path)
+    requests.inc('/api', amount=2)
+    second.flush()
+    assert len(os.listdir(tmp_path)) == 2
+    assert sample(second.render(), 'requests_total{route="/api"}') == ['requests_total{route="/api"} 3']
+
+
+def test_dead_workers_are_merged_into_archive(tmp_path, monkeypatch):
+    for pid in (101, 102):
+        monkeypatch.setattr(metrics.os, 'getpid', lambda pid=pid: pid)
+        registry, requests, latency = worker_registry(tmp_path)
+        requests.inc('/api')
+        latency.observe(0.5)
+        registry.flush()
+
+    mark_process_dead(str(tmp_path), 101)
+    mark_process_dead(str(tmp_path), 102)
+    names = sorted(name for name in os.listdir(tmp_path) if name.endswith('.json'))
+    assert names == [ARCHIVE_NAME]
+
+    monkeypatch.setattr(metrics.os, 'getpid', lambda: 103)
+    registry, requests, _ = worker_registry(tmp_path)
+    requests.inc('/api')
+    text = registry.render()
+    # 終了したワーカーの値も残るので、カウンタは巻き戻らない
+    assert sample(text, 'requests_total{route="/api"}') == ['requests_total{route="/api"} 3']
+    assert sample(text, 'latency_seconds_bucket{le="1"}') == ['latency_seconds_bucket{le="1"} 2']
+    assert sample(text, 'latency_seconds_count') == ['latency_seconds_count 2']
+
+
+def test_mark_process_dead_ignores_unknown_pid(tmp_path):
+    mark_process_dead(str(tmp_path), 999)
+    assert not os.path.exists(tmp_path / ARCHIVE_NAME)
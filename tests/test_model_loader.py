@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import model_loader
+from model_loader import LazyGenerativeModel
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeSDK:
+    """import_sdk の代わりに返す google.generativeai"""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.imports = 0
+        self.api_key = None
+
+    def load(self):
+        self.imports += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ImportError('No module named google.generativeai')
+        return SimpleNamespace(configure=self.configure, GenerativeModel=self.model)
+
+    def configure(self, api_key):
+        self.api_key = api_key
+
+    def model(self, name):
+        return SimpleNamespace(name=name, generate_content=lambda prompt, **kwargs: SimpleNamespace(text=prompt))
+
+
+@pytest.fixture
+def sdk(monkeypatch):
+    sdk = FakeSDK(delay=0.2)
+    monkeypatch.setattr(model_loader, 'import_sdk', sdk.load)
+    return sdk
+
+
+def test_sdk_is_loaded_once_on_first_use(sdk):
+    model = LazyGenerativeModel('key', 'gemini-test')
+    assert not model.ready and sdk.imports == 0
+    threads = [threading.Thread(target=model.load) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sdk.imports == 1 and sdk.api_key == 'key'
+    assert model.generate_content('こんにちは').text == 'こんにちは'
+    assert model.stats()['model'] == 'gemini-test' and model.stats()['loaded']
+    assert model.stats()['load_seconds'] >= 0.2
+
+
+def test_warm_up_loads_in_background(sdk):
+    model = LazyGenerativeModel('key')
+    model.warm_up()
+    # 読み込み中に呼んでも待たずに返る（/health/ready が503を返せるように）
+    started = time.perf_counter()
+    model.warm_up()
+    assert time.perf_counter() - started < 0.1
+    assert not model.ready
+    model._warm_up_thread.join()
+    assert model.ready and sdk.imports == 1
+
+
+def test_failed_load_is_reported_and_retried(monkeypatch):
+    sdk = FakeSDK(fail=True)
+    monkeypatch.setattr(model_loader, 'import_sdk', sdk.load)
+    model = LazyGenerativeModel('key')
+    with pytest.raises(ImportError):
+        model.generate_content('prompt')
+    assert model.error.startswith('ImportError')
+    sdk.fail = False
+    assert model.generate_content('prompt').text == 'prompt'
+    assert model.error is None
+
+
+def test_app_import_does_not_load_sdk(tmp_path):
+    env = dict(os.environ, GEMINI_API_KEY='x', PYTHONPATH=REPO_ROOT)
+    code = "import sys, app; print('google.generativeai' in sys.modules, app.model.ready)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env=env, capture_output=True, text=True,
+                            timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == 'False False'
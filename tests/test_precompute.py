@@ -0,0 +1,79 @@
+import json
+import sqlite3
+
+import pytest
+
+import precompute
+from precompute import (PrecomputedRecipes, mine_session_history, read_combinations, run_precompute,
+                        write_lookup_file)
+from recipe_cache import make_cache_key
+from recipe_model import RecipeSerializer
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(precompute.time, 'sleep', lambda seconds: None)
+
+
+def test_read_combinations_text_and_json(tmp_path):
+    text = tmp_path / 'combos.txt'
+    text.write_text('# コメント\nhappy: rice, egg\n\ntired: udon\n', encoding='utf-8')
+    assert read_combinations(str(text)) == [('happy', ['rice', 'egg']), ('tired', ['udon'])]
+    data = tmp_path / 'combos.json'
+    data.write_text(json.dumps([{'mood': 'spicy', 'ingredients': ['tofu']}]), encoding='utf-8')
+    assert read_combinations(str(data)) == [('spicy', ['tofu'])]
+
+
+def test_mine_session_history_counts_sorted_combinations(tmp_path):
+    path = tmp_path / 'sessions.sqlite3'
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)')
+    histories = [
+        [{'mood': 'happy', 'ingredients': ['rice', 'egg']}, {'mood': 'tired', 'ingredients': ['udon']}],
+        [{'mood': 'happy', 'ingredients': ['egg', 'rice']}],
+    ]
+    for index, history in enumerate(histories):
+        conn.execute('INSERT INTO sessions VALUES (?, ?, 0)', (str(index), json.dumps({'recipe_history': history})))
+    conn.execute("INSERT INTO sessions VALUES ('broken', 'not json', 0)")
+    conn.commit()
+    conn.close()
+    assert mine_session_history(str(path), top=1) == [('happy', ['egg', 'rice'])]
+
+
+def test_run_precompute_resumes_from_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.jsonl')
+    calls = []
+
+    def generate(mood, ingredients):
+        calls.append((mood, ingredients))
+        return None if ingredients == ['natto'] else f'{mood}:{",".join(ingredients)}'
+
+    combinations = [('happy', ['rice']), ('happy', ['rice']), ('tired', ['natto']), ('spicy', ['tofu'])]
+    assert run_precompute(combinations, generate, checkpoint, rate=0, limit=2, log=lambda message: None) == (1, 1)
+    # 書き込み途中で止まった最終行は読み飛ばす
+    with open(checkpoint, 'a', encoding='utf-8') as f:
+        f.write('{"key": "broken"')
+    assert run_precompute(combinations, generate, checkpoint, rate=0, log=lambda message: None) == (1, 1)
+    assert calls == [('happy', ['rice']), ('tired', ['natto']), ('tired', ['natto']), ('spicy', ['tofu'])]
+    keys = set(precompute.load_checkpoint(checkpoint))
+    assert keys == {make_cache_key('happy', ['rice']), make_cache_key('spicy', ['tofu'])}
+
+
+def test_lookup_file_round_trip(tmp_path):
+    path = str(tmp_path / 'precomputed.bin')
+    serializer = RecipeSerializer()
+    records = [(make_cache_key('happy', [f'item{i}']), f'レシピ{i}') for i in range(50)]
+    assert write_lookup_file(path, records, serializer) == 50
+    recipes = PrecomputedRecipes(path, serializer)
+    assert len(recipes) == 50
+    for cache_key, text in records:
+        assert recipes.get(cache_key) == text
+    assert recipes.get(make_cache_key('happy', ['missing'])) is None
+    assert (recipes.hits, recipes.misses) == (50, 1)
+
+
+def test_lookup_file_with_wrong_magic_is_rejected(tmp_path):
+    path = tmp_path / 'precomputed.bin'
+    path.write_bytes(b'NOTRECIP' + bytes(8))
+    with pytest.raises(ValueError):
+        PrecomputedRecipes(str(path), RecipeSerializer())
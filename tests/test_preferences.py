@@ -0,0 +1,70 @@
+import pytest
+
+from catalog import INGREDIENTS
+from preferences import FEEDBACK_STEP, MAX_AFFINITY, VECTOR_SIZE, PreferenceVector
+
+
+def test_update_decays_then_adds_step():
+    preference = PreferenceVector()
+    assert not preference
+    preference.update('happy', ['egg', 'egg', 'unknown'], liked=True)
+    assert preference.mood_affinity('happy') == FEEDBACK_STEP / MAX_AFFINITY
+    assert preference.ingredient_affinity('egg') == FEEDBACK_STEP / MAX_AFFINITY
+    preference.update('tired', ['rice'], liked=False)
+    # 古い値は減衰する（30 → 27）
+    assert preference.ingredient_affinity('egg') == pytest.approx(0.27)
+    assert preference.ingredient_affinity('rice') == pytest.approx(-0.3)
+    assert preference.mood_affinity('unknown') == 0.0
+
+
+def test_affinity_is_clamped():
+    preference = PreferenceVector()
+    for _ in range(20):
+        preference.update('happy', ['tofu'], liked=True)
+    assert preference.ingredient_affinity('tofu') == 1.0
+    assert max(preference.values) == MAX_AFFINITY
+
+
+def test_session_round_trip_rejects_other_shapes():
+    preference = PreferenceVector()
+    preference.update('happy', ['egg'], liked=True)
+    assert PreferenceVector.from_session(preference.to_session()).values == preference.values
+    assert not PreferenceVector.from_session('好み: happyの時の料理')
+    assert not PreferenceVector.from_session([1.5] * VECTOR_SIZE)
+    assert not PreferenceVector.from_session([1] * (VECTOR_SIZE - 1))
+
+
+def test_recipe_bonus_and_affinity_order():
+    preference = PreferenceVector()
+    preference.update('happy', ['tofu'], liked=True)
+    assert preference.recipe_bonus(['tofu', 'egg']) == pytest.approx(0.15)
+    assert preference.recipe_bonus([]) == 0.0
+    affinities = preference.ingredient_affinities()
+    assert len(affinities) == len(INGREDIENTS)
+    assert affinities[[ingredient.id for ingredient in INGREDIENTS].index('tofu')] == 0.3
+
+
+def with_affinities(**affinities):
+    preference = PreferenceVector()
+    offset = VECTOR_SIZE - len(INGREDIENTS)
+    ids = [ingredient.id for ingredient in INGREDIENTS]
+    for ingredient, value in affinities.items():
+        preference.values[offset + ids.index(ingredient)] = value
+    return preference
+
+
+def test_signature_uses_catalog_order_and_threshold():
+    assert PreferenceVector().signature() == ''
+    preference = with_affinities(tofu=50, egg=90, salmon=70, rice=39, natto=-40, milk=-39)
+    # 強い順に2つ選び（卵・鮭）、カタログの順に並べる
+    assert preference.signature() == '好きな食材: 鮭・卵 / 苦手な食材: 納豆'
+
+
+def test_similar_users_share_signature():
+    first, second = PreferenceVector(), PreferenceVector()
+    for _ in range(2):
+        first.update('happy', ['egg', 'rice'], liked=True)
+    for _ in range(3):
+        second.update('tired', ['rice', 'egg'], liked=True)
+    assert first.values != second.values
+    assert first.signature() == second.signature()
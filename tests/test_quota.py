@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+import uuid
+
+import pytest
+
+from quota import MemoryQuotaStore, RedisQuotaStore, SqliteQuotaStore, get_daily_usage_key
+
+
+def redis_client():
+    """Luaを実行できるRedisのクライアント
+
+    REDIS_TEST_URL があればそのサーバー、なければ fakeredis（Luaの実行に lupa が必要）を使う。
+    どちらも使えなければテストを飛ばす。
+    """
+    url = os.environ.get('REDIS_TEST_URL')
+    if url:
+        redis = pytest.importorskip('redis')
+        client = redis.Redis.from_url(url)
+        try:
+            client.ping()
+        except redis.RedisError as e:
+            pytest.skip(f'Redisに接続できません: {e}')
+        return client
+    fakeredis = pytest.importorskip('fakeredis', reason='pip install "fakeredis[lua]" で実行できます')
+    pytest.importorskip('lupa', reason='pip install "fakeredis[lua]" で実行できます')
+    return fakeredis.FakeRedis()
+
+
+def make_redis_store(limit, lease_timeout=300.0):
+    # 実サーバーでも他のテストとキーが重ならないよう、テストごとに接頭辞を変える
+    return RedisQuotaStore(limit, client=redis_client(), prefix=f'test:{uuid.uuid4().hex}:',
+                           lease_timeout=lease_timeout)
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+def make_store(request, tmp_path):
+    def make(limit, lease_timeout=300.0):
+        if request.param == 'memory':
+            return MemoryQuotaStore(limit, lease_timeout=lease_timeout)
+        if request.param == 'sqlite':
+            return SqliteQuotaStore(str(tmp_path / 'quota.sqlite3'), limit, lease_timeout=lease_timeout)
+        return make_redis_store(limit, lease_timeout)
+    return make
+
+
+def test_reserve_stops_at_limit(make_store):
+    store = make_store(2)
+    first, second = store.reserve(), store.reserve()
+    assert first is not None and second is not None
+    assert store.reserve() is None
+    assert store.stats()['reserved'] == 2
+    assert store.stats()['rejected'] == 1
+
+
+def test_commit_and_refund(make_store):
+    store = make_store(2)
+    committed, refunded = store.reserve(), store.reserve()
+    committed.commit()
+    refunded.refund()
+    stats = store.stats()
+    assert (stats['used'], stats['reserved'], stats['remaining']) == (1, 0, 1)
+    # 確定・返却は1回だけ効く
+    committed.commit()
+    refunded.refund()
+    committed.refund()
+    assert store.usage() == 1
+
+
+def test_concurrent_reservations_never_exceed_limit(make_store):
+    store = make_store(5)
+    granted = []
+
+    def worker():
+        for _ in range(10):
+            reservation = store.reserve()
+            if reservation is not None:
+                granted.append(reservation)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(granted) == 5
+    for reservation in granted:
+        reservation.commit()
+    assert store.usage() == 5
+    assert store.remaining() == 0
+
+
+def test_expired_reservation_is_reclaimed(make_store):
+    store = make_store(1, lease_timeout=0.05)
+    abandoned = store.reserve()
+    assert abandoned is not None
+    assert store.reserve() is None
+    time.sleep(0.1)
+    # 確定も返却もされないまま期限を過ぎた枠は確保中に数えない
+    assert store.stats()['reserved'] == 0
+    replacement = store.reserve()
+    assert replacement is not None
+    replacement.commit()
+    # 遅れて届いた確定は、呼び出しが行われたものとして使用済みに数える
+    abandoned.commit()
+    assert store.stats()['used'] == 2
+
+
+def test_record_counts_without_reservation(make_store):
+    store = make_store(1)
+    store.record()
+    assert store.usage() == 1
+    assert store.reserve() is None
+
+
+def test_redis_reserve_script_keeps_leases_in_sorted_set():
+    store = make_redis_store(2, lease_timeout=0.05)
+    day = get_daily_usage_key()
+    reservation = store.reserve()
+    client, reservations_key = store.client, store._reservations_key(day)
+    # Luaのスクリプトが確保を有効期限付きのソート済みセットに入れる
+    assert client.zcard(reservations_key) == 1
+    assert 0 < client.ttl(reservations_key) <= store._ttl
+    time.sleep(0.1)
+    # 次の確保で期限切れの確保がスクリプト内で取り除かれる
+    assert store.reserve() is not None
+    assert client.zcard(reservations_key) == 1
+    reservation.refund()
+    assert client.zcard(reservations_key) == 1
@@ -0,0 +1,106 @@
+import pytest
+
+import rate_limit
+from rate_limit import Limit, MemoryBucketStore, RateLimiter, SqliteBucketStore, parse_rules, retry_after_header
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBucketStore()
+    return SqliteBucketStore(str(tmp_path / 'rate_limit.sqlite3'))
+
+
+def limiter(store, **limits):
+    # バケットの削除用スレッドは起動しない
+    limiter = RateLimiter(store, {'chef': limits}, purge_interval=float('inf'))
+    limiter._next_purge = float('inf')
+    return limiter
+
+
+def test_burst_then_refill(store, clock):
+    chef = limiter(store, session=Limit(2, 10))
+    assert chef.check('chef', 's1').allowed
+    assert chef.check('chef', 's1').allowed
+    rejected = chef.check('chef', 's1')
+    assert (rejected.allowed, rejected.scope) == (False, 'session')
+    assert rejected.retry_after == pytest.approx(5.0)
+
+    # 1回分（10秒で2回 → 5秒）たまるまでは拒否し続ける
+    clock.now += 4.9
+    assert not chef.check('chef', 's1').allowed
+    clock.now += 0.1
+    assert chef.check('chef', 's1').allowed
+    assert not chef.check('chef', 's1').allowed
+
+    # 長く空けても容量までしかたまらない
+    clock.now += 60
+    assert [chef.check('chef', 's1').allowed for _ in range(3)] == [True, True, False]
+
+
+def test_sessions_have_separate_buckets(store, clock):
+    chef = limiter(store, session=Limit(1, 60))
+    assert chef.check('chef', 's1').allowed
+    assert not chef.check('chef', 's1').allowed
+    assert chef.check('chef', 's2').allowed
+
+
+def test_scope_order_keeps_one_client_from_draining_shared_buckets(store, clock):
+    chef = limiter(store, session=Limit(1, 60), ip=Limit(3, 60), **{'global': Limit(4, 60)})
+    assert chef.check('chef', 's1', '10.0.0.1').allowed
+    for _ in range(5):
+        assert chef.check('chef', 's1', '10.0.0.1').scope == 'session'
+    # セッションで拒否した分はIP・全体のバケットを減らさない
+    assert chef.check('chef', 's2', '10.0.0.1').allowed
+    assert chef.check('chef', 's3', '10.0.0.1').allowed
+    assert chef.check('chef', 's4', '10.0.0.1').scope == 'ip'
+    assert chef.check('chef', 's5', '10.0.0.2').allowed
+    assert chef.check('chef', 's6', '10.0.0.3').scope == 'global'
+    assert chef.stats()['rejected'] == {'chef.session': 5, 'chef.ip': 1, 'chef.global': 1}
+
+
+def test_missing_session_uses_ip_and_global_only(store, clock):
+    chef = limiter(store, session=Limit(1, 60), ip=Limit(2, 60))
+    assert chef.check('chef', None, '10.0.0.1').allowed
+    assert chef.check('chef', None, '10.0.0.1').allowed
+    assert chef.check('chef', None, '10.0.0.1').scope == 'ip'
+
+
+def test_unknown_rule_is_allowed(store, clock):
+    assert limiter(store, session=Limit(1, 60)).check('other', 's1').allowed
+
+
+def test_parse_rules_overrides_defaults():
+    rules = parse_rules('chef.session=2/30, recipes_ai.global=off, custom.ip=7')
+    assert rules['chef']['session'] == Limit(2, 30.0)
+    assert rules['chef']['ip'] == rate_limit.DEFAULT_RULES['chef']['ip']
+    assert 'global' not in rules['recipes_ai']
+    assert rules['custom'] == {'ip': Limit(7, 1.0)}
+    # 既定のルールは書き換えない
+    assert 'global' in rate_limit.DEFAULT_RULES['recipes_ai']
+
+
+@pytest.mark.parametrize('spec', ['chef.user=1/60', 'chef.session=0/60', 'chef.session=1/0'])
+def test_parse_rules_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_rules(spec)
+
+
+def test_retry_after_header_rounds_up():
+    assert retry_after_header(0.2) == '1'
+    assert retry_after_header(4.01) == '5'
@@ -0,0 +1,122 @@
+import random
+
+import pytest
+
+from catalog import INGREDIENTS, MOODS
+from preferences import PreferenceVector
+from recipe_corpus import MISSING_PENALTY, MOOD_BONUS, RecipeCorpus, SqliteCorpusStore, extract_recipe_name
+
+
+def learned(*recipes):
+    """(キー, 気分, 食材) の組からAI生成レシピだけのレシピ集を作る"""
+    corpus = RecipeCorpus()
+    for key, mood, ingredients in recipes:
+        corpus.learn(key, mood, ingredients, f'## {key}')
+    return corpus
+
+
+def test_dataset_lookup_returns_best_match():
+    corpus = RecipeCorpus()
+    assert corpus.load_dataset() == len(corpus) > 0
+    match = corpus.lookup('happy', ['chicken', 'egg', 'onion', 'rice'])
+    assert match.recipe.key == 'dataset:oyakodon'
+    assert (match.matched, match.missing) == (4, 0)
+
+
+def test_no_shared_ingredient_is_a_miss():
+    corpus = learned(('tofu', 'spicy', ['tofu', 'ground_meat']))
+    assert corpus.lookup('spicy', ['salmon']) is None
+    assert corpus.stats()['misses'] == 1
+
+
+def test_fewer_missing_ingredients_rank_higher():
+    corpus = learned(
+        ('large', 'happy', ['egg', 'rice', 'pork', 'cabbage', 'onion']),
+        ('small', 'happy', ['egg', 'rice', 'spinach']),
+    )
+    match = corpus.lookup('happy', ['egg', 'rice'])
+    assert match.recipe.key == 'small'
+    assert match.score == pytest.approx(2 / 3 - 0.1 + 0.3)
+
+
+def test_mood_breaks_ties_then_insertion_order():
+    corpus = learned(
+        ('first', 'tired', ['egg', 'rice']),
+        ('second', 'happy', ['egg', 'rice']),
+        ('third', 'happy', ['egg', 'rice']),
+    )
+    assert corpus.lookup('happy', ['egg', 'rice']).recipe.key == 'second'
+    assert corpus.lookup('sweet', ['egg', 'rice']).recipe.key == 'first'
+
+
+def test_preferences_rerank_close_candidates():
+    corpus = learned(
+        ('pork', 'happy', ['egg', 'pork']),
+        ('tofu', 'happy', ['egg', 'tofu']),
+    )
+    preference = PreferenceVector()
+    preference.update('happy', ['tofu'], liked=True)
+    assert corpus.lookup('happy', ['egg']).recipe.key == 'pork'
+    assert corpus.lookup('happy', ['egg'], preference).recipe.key == 'tofu'
+
+
+def test_learning_same_key_replaces_text(tmp_path):
+    store = SqliteCorpusStore(str(tmp_path / 'corpus.sqlite3'))
+    corpus = RecipeCorpus(store)
+    corpus.learn('k', 'happy', ['egg'], '## 一回目')
+    corpus.learn('k', 'happy', ['egg'], '## 二回目')
+    assert len(corpus) == 1
+    assert corpus.lookup('happy', ['egg']).recipe.name == '二回目'
+
+    # 他のワーカーが保存した分は refresh で読み込まれる
+    other = RecipeCorpus(store)
+    assert other.refresh() >= 1
+    assert other.lookup('happy', ['egg']).recipe.name == '二回目'
+
+
+def brute_force(corpus, mood, ingredients):
+    """全レシピを1件ずつ採点した場合の (スコア, 一致数, -番号) の最大値"""
+    best = None
+    for rid, recipe in enumerate(corpus._recipes):
+        matched = len(set(ingredients) & set(recipe.ingredients))
+        if not matched:
+            continue
+        size = len(recipe.ingredients)
+        score = matched / size - MISSING_PENALTY * (size - matched) + (MOOD_BONUS if mood in recipe.moods else 0)
+        rank = (score, matched, -rid)
+        best = rank if best is None or rank > best else best
+    return best
+
+
+def test_bitset_index_matches_brute_force():
+    corpus = RecipeCorpus()
+    corpus.load_dataset()
+    rng = random.Random(0)
+    ingredient_ids = [ingredient.id for ingredient in INGREDIENTS]
+    for _ in range(200):
+        mood = rng.choice(MOODS).id
+        ingredients = rng.sample(ingredient_ids, rng.randint(1, 8))
+        expected = brute_force(corpus, mood, ingredients)
+        match = corpus.lookup(mood, ingredients)
+        if expected is None:
+            assert match is None
+        else:
+            assert match.score == pytest.approx(expected[0])
+            assert match.recipe is corpus._recipes[-expected[2]]
+
+
+def test_learned_recipes_are_capped():
+    corpus = RecipeCorpus(max_learned=2)
+    dataset_size = corpus.load_dataset()
+    for key in ('a', 'b', 'c'):
+        corpus.learn(key, 'happy', ['egg'], f'## {key}')
+    assert len(corpus) == dataset_size + 2
+    # 上限に達していても、登録済みのキーは本文を差し替えられる
+    corpus.learn('a', 'happy', ['egg'], '## 差し替え')
+    assert corpus._recipes[corpus._keys['a']].name == '差し替え'
+
+
+def test_extract_recipe_name():
+    assert extract_recipe_name('## 親子丼\n\n## 材料') == '親子丼'
+    assert extract_recipe_name('## レシピ名\n\n親子丼\n## 材料') == '親子丼'
+    assert extract_recipe_name('親子丼のレシピ') == '親子丼のレシピ'
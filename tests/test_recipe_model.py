@@ -0,0 +1,107 @@
+import pytest
+
+import recipe_model
+from recipe_model import RecipeSerializer, parse_recipe, recipe_dict
+
+RESPONSE = """はい、今日の気分に合うレシピです！
+
+## **ふわとろ親子丼**
+疲れた日でも15分で作れる丼です。
+
+## 調理情報
+- ⏰ 調理時間: 15分
+- 📊 難易度: ★☆☆
+- 🍽️ 人数: 2人分
+- 🔥 カロリー: 約650kcal
+
+## 材料（2人分）
+（2人分）
+- 鶏もも肉 200g
+* 卵 3個
+- 玉ねぎ 1/2個
+
+## 作り方
+1. 鶏肉を一口大に切る
+2) 玉ねぎと一緒に煮る
+3. 卵でとじる
+
+## コツ・ポイント
+卵は2回に分けて入れます。
+白身が少し残るくらいで火を止めます。
+
+---
+
+## アレンジ
+- 三つ葉をのせる
+- 七味をかける
+
+## なぜこのレシピなのか
+甘辛い味で元気が出ます。
+"""
+
+
+def test_parse_reads_every_section():
+    recipe = parse_recipe(RESPONSE)
+    assert recipe.name == 'ふわとろ親子丼'
+    assert recipe.description == '疲れた日でも15分で作れる丼です。'
+    assert (recipe.time, recipe.difficulty, recipe.servings) == ('15分', '★☆☆', '2人分')
+    assert recipe.other_info == ('- 🔥 カロリー: 約650kcal',)
+    assert recipe.ingredients == ('鶏もも肉 200g', '卵 3個', '玉ねぎ 1/2個')
+    assert recipe.steps == ('鶏肉を一口大に切る', '玉ねぎと一緒に煮る', '卵でとじる')
+    assert recipe.tips == '卵は2回に分けて入れます。\n白身が少し残るくらいで火を止めます。'
+    assert recipe.notes == (('アレンジ', '- 三つ葉をのせる\n- 七味をかける'),)
+    assert recipe.reason == '甘辛い味で元気が出ます。'
+
+
+def test_markdown_keeps_all_recipe_text():
+    markdown = parse_recipe(RESPONSE).to_markdown()
+    kept = [
+        '疲れた日でも15分で作れる丼です。', '🔥 カロリー: 約650kcal', '白身が少し残るくらいで火を止めます。',
+        '## アレンジ', '- 三つ葉をのせる', '- 七味をかける', '甘辛い味で元気が出ます。',
+    ]
+    assert all(text in markdown for text in kept)
+    # 書式は揃える: 前置き・区切り線・括弧だけの補足行は残らず、番号は付け直す
+    lost = ['はい、今日の気分に合うレシピです！', '---', '（2人分）\n', '**', '2)']
+    assert not any(text in markdown for text in lost)
+    assert '2. 玉ねぎと一緒に煮る' in markdown
+
+
+def test_markdown_round_trips_the_parsed_recipe():
+    recipe = parse_recipe(RESPONSE)
+    markdown = recipe.to_markdown()
+    assert parse_recipe(markdown) == recipe
+    assert parse_recipe(markdown).to_markdown() == markdown
+
+
+def test_recipe_name_on_following_line():
+    recipe = parse_recipe('## レシピ名\n肉じゃが\n\n## 材料\n- 牛肉\n\n## 作り方\n1. 煮る')
+    assert recipe.name == '肉じゃが'
+    assert recipe.description == ''
+
+
+def test_unparseable_text_is_kept_as_text():
+    assert parse_recipe('今日は外食にしましょう') is None
+    assert recipe_dict('今日は外食にしましょう') is None
+
+
+@pytest.mark.parametrize('use_msgpack', [False, True])
+def test_serializer_round_trip(monkeypatch, use_msgpack):
+    if use_msgpack and recipe_model.msgpack is None:
+        pytest.skip('msgpack がインストールされていません')
+    if not use_msgpack:
+        monkeypatch.setattr(recipe_model, 'msgpack', None)
+    serializer = RecipeSerializer()
+    recipe = parse_recipe(RESPONSE)
+    assert serializer.loads(serializer.dumps(recipe)) == recipe
+    assert serializer.loads(serializer.dumps('読めなかった応答')) == '読めなかった応答'
+
+
+@pytest.mark.parametrize('data', [
+    # description 以降の項目がない行
+    'j[1,"親子丼","15分","","",["卵"],["煮る"],"",""]'.encode('utf-8'),
+    b'j[2,"text"]',
+    b'x[0,"text"]',
+])
+def test_serializer_rejects_unknown_rows(data):
+    with pytest.raises(ValueError):
+        RecipeSerializer().loads(data)
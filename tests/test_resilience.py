@@ -0,0 +1,167 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+import resilience
+from llm_client import LLMCircuitOpenError, LLMClient
+from resilience import CircuitBreaker, HedgePolicy, RetryPolicy
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, 'monotonic', clock)
+    return clock
+
+
+def open_breaker(breaker, now):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure(now)
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure(clock.now)
+    breaker.record_failure(clock.now)
+    breaker.record_success(clock.now)  # 成功で連続失敗の数は戻る
+    breaker.record_failure(clock.now)
+    breaker.record_failure(clock.now)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure(clock.now)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.stats()['short_circuited'] == 1
+
+
+def test_half_open_allows_limited_probes_then_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, half_open_max_calls=1)
+    open_breaker(breaker, clock.now)
+    clock.now += 29.9
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 0.1
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success(clock.now)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    open_breaker(breaker, clock.now)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure(clock.now)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.stats()['opened'] == 2
+
+
+def test_unanswered_probe_is_retried_next_period(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    open_breaker(breaker, clock.now)
+    clock.now += 30
+    assert breaker.allow()
+    assert not breaker.allow()
+    clock.now += 30
+    assert breaker.allow()
+
+
+def test_stale_results_do_not_change_open_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    started_before_open = clock.now
+    clock.now += 1
+    open_breaker(breaker, clock.now)
+    # open になる前に始まった呼び出しが遅れて成功しても閉じない
+    breaker.record_success(started_before_open)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 30
+    assert breaker.allow()
+    probe_started = clock.now
+    # half_open でも、試行より前に始まった呼び出しの結果は使わない
+    breaker.record_success(started_before_open)
+    breaker.record_failure(started_before_open)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.stats()['opened'] == 1
+    breaker.record_success(probe_started)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retry_policy_respects_attempts_and_deadline():
+    retry = RetryPolicy(max_attempts=3, base_delay=0.2, max_delay=2.0, min_attempt_time=1.0)
+    assert 0 <= retry.delay(1, remaining=10) <= 0.2
+    assert 0 <= retry.delay(2, remaining=10) <= 0.4
+    assert retry.delay(3, remaining=10) is None
+    assert retry.delay(1, remaining=0.5) is None
+
+
+def test_hedge_policy_waits_for_samples():
+    hedge = HedgePolicy(percentile=0.5, min_samples=4, min_delay=0.1)
+    for seconds in (1.0, 2.0, 3.0):
+        hedge.record(seconds)
+    assert hedge.delay() is None
+    hedge.record(4.0)
+    assert hedge.delay() == 3.0
+
+
+class SlowModel:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        time.sleep(self.seconds)
+        return SimpleNamespace(text='ok')
+
+
+def hedging_client(model, breaker):
+    hedge = HedgePolicy(min_samples=1, min_delay=0.01)
+    hedge.record(0.01)
+    return LLMClient(model, max_concurrency=4, timeout=2.0, breaker=breaker, hedge=hedge)
+
+
+def test_hedges_while_breaker_closed():
+    model = SlowModel(0.1)
+    client = hedging_client(model, CircuitBreaker())
+    assert client.generate('prompt') == 'ok'
+    assert client.hedged == 1
+    time.sleep(0.15)
+    assert model.calls == 2
+
+
+def test_half_open_probe_is_not_hedged():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05, half_open_max_calls=1)
+    model = SlowModel(0.1)
+    client = hedging_client(model, breaker)
+    open_breaker(breaker, time.monotonic())
+    with pytest.raises(LLMCircuitOpenError):
+        client.generate('prompt')
+    time.sleep(0.06)
+    assert client.generate('prompt') == 'ok'
+    assert client.hedged == 0
+    assert model.calls == 1
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_slow_success_started_before_open_keeps_breaker_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    client = LLMClient(SlowModel(0.1), max_concurrency=2, timeout=2.0, breaker=breaker)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        slow = pool.submit(client.generate, 'prompt')
+        time.sleep(0.02)
+        # 遅い呼び出しが返る前に、別の呼び出しの失敗でブレーカーが開く
+        open_breaker(breaker, time.monotonic())
+        assert slow.result() == 'ok'
+    assert breaker.state == CircuitBreaker.OPEN
@@ -0,0 +1,115 @@
+from datetime import datetime
+
+import pytest
+
+import routing
+from routing import AdaptiveRouter, day_remaining_fraction
+
+
+class Upstream:
+    """ルーターに渡すクォータ・実行枠・ブレーカーの状態"""
+
+    def __init__(self):
+        self.remaining = 50
+        self.limit = 100
+        self.in_flight = 0
+        self.max_concurrency = 4
+        self.open = False
+
+    def router(self, **kwargs):
+        kwargs.setdefault('refresh_interval', 0)
+        return AdaptiveRouter(
+            lambda: {'remaining': self.remaining, 'limit': self.limit},
+            lambda: (self.in_flight, self.max_concurrency),
+            circuit_open=lambda: self.open,
+            **kwargs,
+        )
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    # 1日のちょうど半分が過ぎた時点
+    monkeypatch.setattr(routing, 'day_remaining_fraction', lambda now=None: 0.5)
+    return Upstream()
+
+
+def test_day_remaining_fraction():
+    assert day_remaining_fraction(datetime(2024, 1, 1, 0, 0)) == 1.0
+    assert day_remaining_fraction(datetime(2024, 1, 1, 18, 0)) == 0.25
+
+
+def test_quota_pace_scales_base_rate(upstream):
+    router = upstream.router(base_rate=0.6)
+    # 半日で半分残っていれば予定どおり
+    assert router.probability() == (pytest.approx(0.6), 'quota_pacing')
+    upstream.remaining = 20
+    assert router.probability() == (pytest.approx(0.24), 'quota_pacing')
+    upstream.remaining = 80
+    assert router.probability() == (pytest.approx(0.96), 'quota_ahead')
+    # 上限（max_rate）を超えない
+    upstream.remaining = 90
+    assert router.probability() == (1.0, 'quota_ahead')
+
+
+def test_hard_stops(upstream):
+    router = upstream.router()
+    upstream.in_flight = 4
+    assert router.probability() == (0.0, 'saturated')
+    upstream.open = True
+    assert router.probability() == (0.0, 'circuit_open')
+    upstream.remaining = 0
+    assert router.probability() == (0.0, 'quota_exhausted')
+
+
+def test_upstream_errors_leave_only_probes(upstream):
+    router = upstream.router(min_samples=4, error_threshold=0.5, probe_rate=0.05)
+    for outcome in ('error', 'timeout', 'ok'):
+        router.observe(outcome, 1.0)
+    # 混雑・ブレーカーで呼ばなかった分は数えない
+    router.observe('overloaded', 0.0)
+    router.observe('circuit_open', 0.0)
+    assert router.probability()[1] == 'quota_pacing'
+    router.observe('error', 1.0)
+    assert router.probability() == (0.05, 'upstream_errors')
+
+
+def test_slow_upstream_lowers_rate(upstream):
+    router = upstream.router(base_rate=0.5, slow_latency=10.0)
+    router.observe('ok', 20.0)
+    assert router.probability() == (pytest.approx(0.25), 'upstream_slow')
+    router.observe('ok', 200.0)
+    # 遅くても最低2割は残す
+    assert router.probability() == (pytest.approx(0.1), 'upstream_slow')
+
+
+def test_old_calls_leave_window(upstream, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(routing.time, 'monotonic', lambda: now[0])
+    router = upstream.router(window=60, min_samples=1)
+    router.observe('error', 1.0)
+    assert router.probability()[1] == 'upstream_errors'
+    now[0] += 61
+    assert router.probability()[1] == 'quota_pacing'
+
+
+def test_signals_are_cached_for_refresh_interval(upstream, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(routing.time, 'monotonic', lambda: now[0])
+    router = upstream.router(refresh_interval=1.0)
+    assert router.signals()['quota_remaining'] == 50
+    upstream.remaining = 10
+    assert router.signals()['quota_remaining'] == 50
+    now[0] += 1
+    assert router.signals()['quota_remaining'] == 10
+
+
+def test_fixed_mode_and_decision_counts(upstream, monkeypatch):
+    router = upstream.router(base_rate=0.3, enabled=False)
+    assert router.probability() == (0.3, 'fixed_rate')
+    monkeypatch.setattr(routing.random, 'random', lambda: 0.29)
+    assert router.decide() == (True, 'fixed_rate')
+    monkeypatch.setattr(routing.random, 'random', lambda: 0.3)
+    assert router.decide() == (False, 'fixed_rate')
+    stats = router.stats()
+    assert stats['mode'] == 'fixed'
+    assert stats['decisions'] == {'ai:fixed_rate': 1, 'rule_based:fixed_rate': 1}
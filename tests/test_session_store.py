@@ -0,0 +1,120 @@
+import pytest
+from flask import Flask, session
+
+import session_store
+from session_store import (CachedSessionStore, ServerSideSessionInterface, SqliteSessionStore,
+                           compact_session)
+
+
+class CountingStore:
+    def __init__(self, store):
+        self.store = store
+        self.reads = 0
+        self.writes = 0
+
+    def get(self, sid):
+        self.reads += 1
+        return self.store.get(sid)
+
+    def set(self, sid, serialized, ttl):
+        self.writes += 1
+        self.store.set(sid, serialized, ttl)
+
+    def delete(self, sid):
+        self.store.delete(sid)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CountingStore(SqliteSessionStore(str(tmp_path / 'sessions.sqlite3')))
+
+
+@pytest.fixture
+def client(store):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.session_interface = ServerSideSessionInterface(store)
+
+    @app.route('/add/<item>')
+    def add(item):
+        session.setdefault('recipe_history', []).append(item)
+        session.modified = True
+        return 'ok'
+
+    @app.route('/read')
+    def read():
+        return ','.join(session.get('recipe_history', []))
+
+    @app.route('/clear')
+    def clear():
+        session.clear()
+        return 'ok'
+
+    return app.test_client()
+
+
+def test_cookie_holds_only_session_id(client, store):
+    response = client.get('/add/カレー')
+    cookie = response.headers['Set-Cookie']
+    assert 'カレー' not in cookie
+    sid = client.get_cookie('session').value
+    assert len(sid) >= 32
+    assert 'カレー' in store.store.get(sid)
+    assert client.get('/read').text == 'カレー'
+
+
+def test_unchanged_session_is_not_rewritten(client, store):
+    client.get('/add/カレー')
+    writes = store.writes
+    response = client.get('/read')
+    assert store.writes == writes
+    # idは変わらないのでCookieも送り直さない
+    assert 'Set-Cookie' not in response.headers
+
+
+def test_cleared_session_is_deleted(client, store):
+    client.get('/add/カレー')
+    sid = client.get_cookie('session').value
+    client.get('/clear')
+    assert store.store.get(sid) is None
+    assert client.get('/read').text == ''
+
+
+def test_expired_session_is_not_loaded(store, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, 'time', lambda: now[0])
+    store.set('sid', '{"a":1}', ttl=10)
+    assert store.get('sid') == '{"a":1}'
+    now[0] += 11
+    assert store.get('sid') is None
+
+
+def test_memory_layer_expires_after_ttl(store, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, 'monotonic', lambda: now[0])
+    cached = CachedSessionStore(store, max_entries=1, memory_ttl=2.0)
+    cached.set('a', '{"n":1}', ttl=60)
+    assert cached.get('a') == '{"n":1}'
+    assert store.reads == 0
+    # 別のワーカーが更新した内容は memory_ttl 後に読み直す
+    store.set('a', '{"n":2}', ttl=60)
+    now[0] += 2.1
+    assert cached.get('a') == '{"n":2}'
+    assert store.reads == 1
+    # 上限を超えたら古いものから追い出す
+    cached.set('b', '{}', ttl=60)
+    cached.get('a')
+    assert store.reads == 2
+    assert cached.stats()['memory_entries'] == 1
+
+
+def test_compact_session_limits_histories():
+    data = {
+        'recipe_history': list(range(25)),
+        'feedback_history': [{'recipe_data': {'mood': 'happy', 'instructions': ['x'] * 10}, 'text': 'a' * 500}],
+    }
+    compact_session(data)
+    assert data['recipe_history'] == list(range(5, 25))
+    feedback = data['feedback_history'][0]
+    assert feedback['recipe_data'] == {'mood': 'happy'}
+    assert len(feedback['text']) == session_store.COMPACT_TEXT_LENGTH + 1
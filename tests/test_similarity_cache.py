@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+from similarity_cache import SimilarityCache, encode_request
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SimilarityCache(str(tmp_path / 'similarity'), capacity=2, threshold=0.9)
+
+
+def test_lookup_returns_closest_recipe_for_same_mood(cache):
+    cache.add('k1', 'happy', ['rice', 'chicken'], 'チキンライス')
+    recipe, similarity = cache.lookup('happy', ['rice', 'chicken'])
+    assert recipe == 'チキンライス'
+    assert similarity == pytest.approx(1.0)
+    # 気分が違う行は使わない
+    assert cache.lookup('tired', ['rice', 'chicken']) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_different_request_stays_below_threshold(cache):
+    cache.add('k1', 'happy', ['rice', 'chicken'], 'チキンライス', context='辛くしない')
+    assert cache.lookup('happy', ['rice', 'chicken'], context='とても辛く') is None
+
+
+def test_wrapped_ring_overwrites_oldest_row(cache):
+    cache.add('k1', 'happy', ['rice'], 'A')
+    cache.add('k2', 'happy', ['pasta'], 'B')
+    cache.add('k3', 'happy', ['bread'], 'C')
+    assert len(cache) == 2
+    assert cache.lookup('happy', ['rice']) is None
+    assert cache.lookup('happy', ['bread'])[0] == 'C'
+    assert cache.lookup('happy', ['pasta'])[0] == 'B'
+
+
+def test_row_being_overwritten_is_not_paired_with_old_recipe(cache):
+    cache.add('k1', 'happy', ['rice'], 'A')
+    cache.add('k2', 'happy', ['pasta'], 'B')
+    # 別のワーカーが 0 行目を「パン」で上書きしている途中（ベクトルと世代は新しく、SQLiteは未コミット）
+    other = SimilarityCache(cache.directory, capacity=2, threshold=0.9)
+    conn = other._connect()
+    conn.execute('BEGIN IMMEDIATE')
+    other.generations[0] = 0
+    other.vectors[0] = encode_request(other.np, 'happy', ['bread'])
+    assert cache.lookup('happy', ['bread']) is None
+    other.generations[0] = 3
+    assert cache.lookup('happy', ['bread']) is None
+    # 書き込み中でも、ほかの行はそのまま使える
+    assert cache.lookup('happy', ['pasta'])[0] == 'B'
+    conn.execute('ROLLBACK')
+
+
+def test_old_table_layout_is_rejected(tmp_path):
+    directory = tmp_path / 'similarity'
+    directory.mkdir()
+    conn = sqlite3.connect(directory / 'similarity.sqlite3')
+    conn.execute('CREATE TABLE similarity_recipes (slot INTEGER PRIMARY KEY, cache_key TEXT, recipe TEXT)')
+    conn.close()
+    with pytest.raises(ValueError):
+        SimilarityCache(str(directory), capacity=2)
@@ -0,0 +1,91 @@
+import threading
+import time
+
+from recipe_cache import MemoryCacheBackend, RecipeCache, SqliteCacheBackend
+from singleflight import SingleFlight, SqliteLease, create_singleflight_from_env
+
+
+def test_do_many_shares_keys_already_in_flight():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_single():
+        started.set()
+        release.wait(2)
+        return 'a-single'
+
+    leader = threading.Thread(target=lambda: flight.do('a', slow_single))
+    leader.start()
+    started.wait(2)
+
+    def generate(keys):
+        calls.append(list(keys))
+        return {key: f'{key}-pack' for key in keys}
+
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(flight.do_many(['a', 'b', 'c', 'b'], generate)))
+    worker.start()
+    time.sleep(0.05)
+    release.set()
+    worker.join(2)
+    leader.join(2)
+
+    # 実行中の 'a' はプロンプトに含めず結果を共有し、重複した 'b' は1回だけ生成する
+    assert calls == [['b', 'c']]
+    assert result == {'a': ('a-single', True), 'b': ('b-pack', False), 'c': ('c-pack', False)}
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_concurrent_do_many_generates_each_key_once():
+    flight = SingleFlight()
+    generated = []
+    lock = threading.Lock()
+
+    def generate(keys):
+        with lock:
+            generated.extend(keys)
+        time.sleep(0.05)
+        return {key: key.upper() for key in keys}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do_many(['x', 'y'], generate))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(2)
+
+    assert sorted(generated) == ['x', 'y']
+    assert all({key: value[0] for key, value in result.items()} == {'x': 'X', 'y': 'Y'} for result in results)
+
+
+def test_do_many_missing_result_is_not_shared_as_success():
+    flight = SingleFlight()
+    result = flight.do_many(['ok', 'failed'], lambda keys: {'ok': 1})
+    assert result == {'ok': (1, False), 'failed': (None, False)}
+
+
+def test_process_mode_needs_a_shared_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv('AI_SINGLEFLIGHT_MODE', 'process')
+    monkeypatch.setenv('AI_SINGLEFLIGHT_LEASE_PATH', str(tmp_path / 'lease.sqlite3'))
+    # プロセス内のキャッシュでは他のワーカーの結果を待てないので、プロセス内でまとめる
+    assert create_singleflight_from_env(RecipeCache(MemoryCacheBackend())).lease is None
+    shared = RecipeCache(SqliteCacheBackend(str(tmp_path / 'cache.sqlite3')))
+    assert isinstance(create_singleflight_from_env(shared).lease, SqliteLease)
+
+
+def test_lease_wait_does_not_count_cache_misses(tmp_path):
+    cache = RecipeCache(SqliteCacheBackend(str(tmp_path / 'cache.sqlite3')))
+    waiter = SqliteLease(str(tmp_path / 'lease.sqlite3'), cache.peek, ttl=2.0, poll_interval=0.01)
+    holder = SqliteLease(str(tmp_path / 'lease.sqlite3'), cache.peek, ttl=2.0)
+    assert holder._acquire('key')
+
+    def finish():
+        time.sleep(0.1)
+        cache.set('key', 'recipe')
+        holder._release('key')
+
+    threading.Thread(target=finish).start()
+    assert waiter.run('key', lambda: 'own') == ('recipe', True)
+    assert (cache.hits, cache.misses) == (0, 0)
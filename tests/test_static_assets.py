@@ -0,0 +1,88 @@
+import gzip
+
+import pytest
+from flask import Flask, abort
+
+from static_assets import IMMUTABLE_CACHE_CONTROL, AssetRegistry
+
+MANIFEST = ('{"name": "気分レシピ", "icons": []}' * 20).encode('utf-8')
+PNG = bytes(range(256))
+
+
+@pytest.fixture
+def registry():
+    registry = AssetRegistry(cache_control='public, max-age=60')
+    registry.add_bytes('manifest.json', MANIFEST, 'application/json')
+    registry.add_bytes('icon.png', PNG, 'image/png')
+    return registry
+
+
+@pytest.fixture
+def client(registry):
+    app = Flask(__name__)
+
+    @app.route('/assets/<name>')
+    def fingerprinted(name):
+        return registry.fingerprinted_response(name) or abort(404)
+
+    @app.route('/<name>')
+    def plain(name):
+        return registry.response(name) or abort(404)
+
+    return app.test_client()
+
+
+def test_fingerprinted_url_changes_with_content(registry):
+    url = registry.url('manifest.json')
+    assert url.startswith('/assets/manifest.') and url.endswith('.json')
+    registry.add_bytes('manifest.json', MANIFEST + b' ', 'application/json')
+    assert registry.url('manifest.json') != url
+    assert registry.url('missing.png') == '/missing.png'
+
+
+def test_gzip_variant_has_its_own_etag(client):
+    plain = client.get('/manifest.json')
+    assert plain.data == MANIFEST
+    assert 'Content-Encoding' not in plain.headers
+    compressed = client.get('/manifest.json', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == MANIFEST
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+    assert compressed.headers['Vary'] == 'Accept-Encoding'
+    assert plain.headers['Cache-Control'] == 'public, max-age=60'
+
+
+def test_incompressible_asset_is_served_as_is(client):
+    response = client.get('/icon.png', headers={'Accept-Encoding': 'gzip'})
+    assert response.data == PNG
+    assert 'Content-Encoding' not in response.headers
+    assert 'Vary' not in response.headers
+
+
+def test_matching_etag_returns_304(client, registry):
+    etag = client.get('/manifest.json', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+    response = client.get('/manifest.json', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    # 圧縮形式が違えば別のETagなので、本文を返す
+    assert client.get('/manifest.json', headers={'If-None-Match': etag}).status_code == 200
+    assert registry.stats()['not_modified'] == 1
+
+
+def test_fingerprinted_response_is_immutable(client, registry):
+    url = registry.url('icon.png')
+    response = client.get(url)
+    assert response.data == PNG
+    assert response.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+    # 置き換える前のハッシュのURLはもう返さない
+    registry.add_bytes('icon.png', PNG[::-1], 'image/png')
+    assert client.get(url).status_code == 404
+
+
+def test_app_serves_registered_assets(app_module):
+    client = app_module.app.test_client()
+    response = client.get('/manifest.json')
+    assert response.status_code == 200
+    assert client.get('/manifest.json', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert client.get(app_module.assets.url('icon-256x256.png')).headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL